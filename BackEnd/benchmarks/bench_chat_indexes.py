@@ -0,0 +1,163 @@
+# benchmarks/bench_chat_indexes.py
+"""Mide las consultas del chat sobre una BD grande sin y con los índices compuestos
+(conversation_id, created_at) y (user_id, created_at).
+
+Siembra `--messages` mensajes (por defecto un millón) repartidos en conversaciones
+de `--per-conversation` mensajes y usuarios de `--per-user` conversaciones, y mide:
+  - últimos 5 mensajes (contexto de handle_message)
+  - historial completo de una conversación (get_history)
+  - listado de conversaciones de un usuario (get_conversations)
+
+Uso (desde BackEnd/):
+    python -m benchmarks.bench_chat_indexes [--messages 1000000] [--url postgresql://...]
+Sin --url usa un SQLite temporal. La BD indicada se vacía antes de sembrar.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, create_engine, insert, select, text
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from src.config.db import Base
+from src.models.auth_model import User
+from src.models.conversation_model import Conversation
+from src.models.message_model import Message
+
+BATCH = 50_000
+INDEXES = {
+    "ix_messages_conversation_id_created_at": Message.__table__,
+    "ix_conversations_user_id_created_at": Conversation.__table__,
+}
+
+
+def seed(engine, n_messages: int, per_conversation: int, per_user: int):
+    n_conversations = max(1, n_messages // per_conversation)
+    n_users = max(1, n_conversations // per_user)
+    start = datetime(2024, 1, 1)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": u, "username": f"user{u}", "email": f"user{u}@bench.test", "hashed_password": "x"}
+            for u in range(1, n_users + 1)
+        ])
+        conn.execute(insert(Conversation), [
+            # Las conversaciones se intercalan entre usuarios, como en producción
+            {"id": c, "user_id": (c % n_users) + 1, "title": f"Conversación {c}",
+             "created_at": start + timedelta(minutes=c)}
+            for c in range(1, n_conversations + 1)
+        ])
+
+    # Los mensajes también se intercalan: llegan mezclados de todas las conversaciones
+    rows, message_id = [], 0
+    for step in range(per_conversation):
+        for c in range(1, n_conversations + 1):
+            message_id += 1
+            rows.append({
+                "id": message_id,
+                "conversation_id": c,
+                "role": "user" if step % 2 == 0 else "assistant",
+                "content": f"Mensaje {step} de la conversación {c}",
+                "created_at": start + timedelta(seconds=message_id),
+            })
+            if len(rows) >= BATCH:
+                with engine.begin() as conn:
+                    conn.execute(insert(Message), rows)
+                rows = []
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(insert(Message), rows)
+
+    return n_users, n_conversations, message_id
+
+
+def set_indexes(engine, enabled: bool):
+    with engine.begin() as conn:
+        for name, table in INDEXES.items():
+            index = next(i for i in table.indexes if i.name == name)
+            if enabled:
+                index.create(bind=conn, checkfirst=True)
+            else:
+                index.drop(bind=conn, checkfirst=True)
+        # Estadísticas al día para que el planificador elija (o no) el índice
+        conn.execute(text("ANALYZE"))
+
+
+def timed(engine, statement, runs: list) -> float:
+    """Mediana en ms de la consulta ejecutada con cada juego de parámetros de `runs`."""
+    samples = []
+    with engine.connect() as conn:
+        for params in runs:
+            start = time.perf_counter()
+            conn.execute(statement, params).all()
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def measure(engine, n_users: int, n_conversations: int, runs: int) -> dict:
+    rng = random.Random(42)
+    chats = [{"chat_id": rng.randint(1, n_conversations)} for _ in range(runs)]
+    users = [{"user_id": rng.randint(1, n_users)} for _ in range(runs)]
+
+    last_five = (
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == bindparam("chat_id"))
+        .order_by(Message.created_at.desc())
+        .limit(5)
+    )
+    history = (
+        select(Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == bindparam("chat_id"))
+        .order_by(Message.created_at)
+    )
+    conversations = (
+        select(Conversation.id, Conversation.created_at, Conversation.title)
+        .where(Conversation.user_id == bindparam("user_id"))
+        .order_by(Conversation.created_at.desc())
+    )
+    return {
+        "últimos 5 mensajes": timed(engine, last_five, chats),
+        "historial completo": timed(engine, history, chats),
+        "listado de chats": timed(engine, conversations, users),
+    }
+
+
+def main(url: str, n_messages: int, per_conversation: int, per_user: int, runs: int):
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    start = time.perf_counter()
+    n_users, n_conversations, n_seeded = seed(engine, n_messages, per_conversation, per_user)
+    print(f"Sembrados {n_seeded} mensajes, {n_conversations} conversaciones, {n_users} usuarios "
+          f"({engine.dialect.name}) en {time.perf_counter() - start:.1f} s")
+
+    set_indexes(engine, enabled=False)
+    before = measure(engine, n_users, n_conversations, runs)
+    set_indexes(engine, enabled=True)
+    after = measure(engine, n_users, n_conversations, runs)
+
+    print(f"{'consulta':<22}{'sin índices':>14}{'con índices':>14}{'mejora':>10}")
+    for name in before:
+        print(f"{name:<22}{before[name]:>11.2f} ms{after[name]:>11.2f} ms{before[name] / after[name]:>9.0f}x")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="URL de la BD (se vacía); por defecto SQLite temporal")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--per-conversation", type=int, default=100)
+    parser.add_argument("--per-user", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or f"sqlite:///{os.path.join(tmp, 'bench_chat.db')}"
+        main(url, args.messages, args.per_conversation, args.per_user, args.runs)
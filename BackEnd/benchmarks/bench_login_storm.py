@@ -0,0 +1,104 @@
+# benchmarks/bench_login_storm.py
+"""Lanza una ráfaga de logins concurrentes y mide cómo responde el resto de la API.
+
+Mientras `--logins` peticiones POST /auth/login compiten por bcrypt, se sondea
+una ruta síncrona barata (/internal/db-pool) y se mide su latencia. Los logins
+esperan el hash sin ocupar hilos del threadpool, y con el pool de hashing
+acotado los que no caben reciben 503 al momento; con --unbounded se emula el
+comportamiento anterior (sin control de admisión).
+
+Uso (desde BackEnd/):
+    python -m benchmarks.bench_login_storm [--logins 200] [--rounds 12] [--unbounded]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+PROBES = 50
+
+
+INTERNAL_HEADERS = {"X-Internal-Token": "bench"}
+
+
+async def probe(client, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/internal/db-pool", headers=INTERNAL_HEADERS)
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run(n_logins: int, unbounded: bool):
+    import httpx
+
+    from main import app
+    from src.config.db import Base, SessionLocal, engine
+    from src.controllers import auth_controller
+    from src.models.auth_model import User
+    from src.utils.auth import hash_password
+    from src.utils.password_hasher import PASSWORD_HASH_WORKERS, PasswordHasher
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.add(User(username="bench", email="bench@example.com", hashed_password=hash_password("secreto")))
+        db.commit()
+
+    if unbounded:
+        # Como antes: cada login hace bcrypt en su propio hilo del threadpool
+        auth_controller.password_hasher = PasswordHasher(workers=n_logins, queue_size=0)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = []
+        for _ in range(PROBES):
+            start = time.perf_counter()
+            await client.get("/internal/db-pool", headers=INTERNAL_HEADERS)
+            idle.append((time.perf_counter() - start) * 1000)
+
+        samples, stop = [], asyncio.Event()
+        prober = asyncio.create_task(probe(client, samples, stop))
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/auth/login", data={"username": "bench@example.com", "password": "secreto"})
+            for _ in range(n_logins)
+        ])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    statuses = Counter(response.status_code for response in responses)
+    hasher = auth_controller.password_hasher.stats()
+    mode = "sin límite" if unbounded else f"capacidad {hasher['capacity']} ({PASSWORD_HASH_WORKERS} hilos)"
+    print(f"{n_logins} logins concurrentes, pool de hashing {mode}: {elapsed:.2f} s")
+    print(f"Respuestas: {dict(sorted(statuses.items()))}")
+    print(f"Ruta sondeada en reposo:     p50 {statistics.median(idle):7.1f} ms")
+    if samples:
+        p95 = sorted(samples)[max(int(len(samples) * 0.95) - 1, 0)]
+        print(f"Ruta sondeada con la ráfaga: p50 {statistics.median(samples):7.1f} ms, "
+              f"p95 {p95:7.1f} ms ({len(samples)} muestras)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=12, help="coste de bcrypt")
+    parser.add_argument("--unbounded", action="store_true", help="emula el hash sin control de admisión")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La configuración se lee al importar: se fija antes de cargar la app
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench_login.db')}"
+        os.environ["PASSWORD_BCRYPT_ROUNDS"] = str(args.rounds)
+        for name in ("SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET", "SPOTIFY_REDIRECT_URI"):
+            os.environ.setdefault(name, "bench")
+        os.environ.setdefault("SECRET_KEY", "bench")
+        os.environ.setdefault("ALGORITHM", "HS256")
+        os.environ["INTERNAL_API_TOKEN"] = INTERNAL_HEADERS["X-Internal-Token"]
+        logging.disable(logging.INFO)
+        asyncio.run(run(args.logins, args.unbounded))
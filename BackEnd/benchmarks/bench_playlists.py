@@ -0,0 +1,85 @@
+# benchmarks/bench_playlists.py
+"""Compara el listado de playlists N+1 secuencial con el fetcher concurrente paginado
+y mide el tráfico de un listado repetido con la caché por snapshot_id.
+
+Uso (desde BackEnd/):
+    python -m benchmarks.bench_playlists [--latency 0.05] [--playlists 200] [--tracks 250]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from benchmarks.fake_spotify import create_app, run_fake_spotify
+
+
+async def list_playlists_n_plus_one(client, access_token):
+    """Comportamiento anterior: playlists en serie y solo la primera página de canciones."""
+    playlists, offset = [], 0
+    while True:
+        data = (await client.get("/me/playlists", access_token=access_token, params={"limit": 50, "offset": offset})).json()
+        for item in data.get("items", []):
+            tracks = (await client.get(f"/playlists/{item['id']}/tracks", access_token=access_token)).json()
+            playlists.append(len(tracks.get("items", [])))
+        offset += 50
+        if not data.get("next"):
+            return playlists
+
+
+async def run(latency: float, n_playlists: int, tracks: int):
+    app = create_app(latency, playlists=n_playlists, tracks_per_playlist=tracks)
+    with run_fake_spotify(app=app) as (base_url, app):
+        from src.controllers import spotify_controller
+        from src.services.spotify_client import SpotifyClient
+
+        client = SpotifyClient(base_url=base_url, http2=False)
+        spotify_controller.spotify_client = client
+        await client.start()
+
+        start = time.perf_counter()
+        old = await list_playlists_n_plus_one(client, "token")
+        old_time = time.perf_counter() - start
+
+        async def fake_token(user, db):
+            return "token"
+
+        spotify_controller.get_valid_spotify_token = fake_token
+        user = SimpleNamespace(email="bench@example.com")
+
+        async def listing():
+            requests_before, bytes_before = app.state.requests, app.state.bytes
+            start = time.perf_counter()
+            result = await spotify_controller.get_all_user_playlists(user, None)
+            elapsed = time.perf_counter() - start
+            songs = sum(len(p["tracks"]) for p in result["playlists"])
+            return elapsed, songs, app.state.requests - requests_before, app.state.bytes - bytes_before
+
+        new_time, new_songs, cold_requests, cold_bytes = await listing()
+
+        # Cambia el contenido del 5% de las playlists y repite el listado
+        for pid in list(app.state.snapshots)[: max(1, n_playlists // 20)]:
+            app.state.snapshots[pid] = "s1"
+        warm_time, warm_songs, warm_requests, warm_bytes = await listing()
+
+        await client.close()
+
+    print(f"{n_playlists} playlists × {tracks} canciones, latencia {latency * 1000:.0f} ms")
+    print(f"N+1 secuencial:        {old_time:6.2f} s, canciones devueltas: {sum(old)}")
+    print(f"Concurrente paginado:  {new_time:6.2f} s, canciones devueltas: {new_songs}, "
+          f"{cold_requests} peticiones, {cold_bytes / 1024:.0f} KiB")
+    print(f"Repetido (5% cambian): {warm_time:6.2f} s, canciones devueltas: {warm_songs}, "
+          f"{warm_requests} peticiones, {warm_bytes / 1024:.0f} KiB "
+          f"({100 * (1 - warm_bytes / cold_bytes):.0f}% menos tráfico)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--playlists", type=int, default=200)
+    parser.add_argument("--tracks", type=int, default=250)
+    args = parser.parse_args()
+    asyncio.run(run(args.latency, args.playlists, args.tracks))
@@ -0,0 +1,137 @@
+# benchmarks/bench_startup.py
+"""Mide el arranque en frío de un worker y falla si supera el presupuesto.
+
+  - importación de `main` (python -X importtime, acumulado del módulo main)
+  - tiempo hasta la primera respuesta: desde lanzar uvicorn hasta el primer 200
+    de una ruta ligera (/internal/db-pool), lifespan incluido
+  - que las dependencias que se cargan en el primer uso (LAZY_MODULES) no se
+    importen al arrancar
+
+Cada medida es la mediana de `--runs` procesos nuevos. Sale con código 1 si
+alguna mediana supera su presupuesto o se importa alguna dependencia perezosa.
+
+Uso (desde BackEnd/):
+    python -m benchmarks.bench_startup [--runs 5] [--import-budget-ms 1500] [--first-request-budget-ms 4000]
+"""
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se importan en el primer uso; si aparecen al arrancar es una regresión
+LAZY_MODULES = ("spotipy", "bs4", "passlib", "jose", "requests")
+
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1500))
+FIRST_REQUEST_BUDGET_MS = float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET_MS", 4000))
+
+INTERNAL_TOKEN = "bench"
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def worker_env(tmp: str) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench_startup.db')}"
+    env.pop("ASYNC_DATABASE_URL", None)
+    env["INTERNAL_API_TOKEN"] = INTERNAL_TOKEN
+    return env
+
+
+def measure_import(env: dict) -> tuple:
+    """(ms acumulados de `import main`, módulos de primer nivel más caros, perezosos cargados)."""
+    code = f"import main, sys; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    main_ms, top = None, []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        if module == "main":
+            main_ms = cumulative / 1000
+        elif indent <= 3:
+            top.append((cumulative / 1000, module))
+    loaded = [module for module in result.stdout.strip().split(",") if module]
+    return main_ms, sorted(top, reverse=True)[:8], loaded
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env: dict, timeout: float = 30) -> float:
+    """ms desde lanzar uvicorn hasta el primer 200."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/internal/db-pool"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if httpx.get(url, headers={"X-Internal-Token": INTERNAL_TOKEN}, timeout=1).status_code == 200:
+                    return (time.perf_counter() - start) * 1000
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn terminó antes de responder")
+            time.sleep(0.005)
+        raise RuntimeError(f"Sin respuesta en {timeout:.0f} s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main(runs: int, import_budget: float, first_request_budget: float) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = worker_env(tmp)
+        # El arranque solo comprueba la versión del esquema: la BD se migra antes, como en un despliegue
+        subprocess.run([sys.executable, "migrate.py"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+        imports = [measure_import(env) for _ in range(runs)]
+        first_requests = [measure_first_request(env) for _ in range(runs)]
+
+    import_ms = statistics.median(run[0] for run in imports)
+    first_request_ms = statistics.median(first_requests)
+    lazy_loaded = sorted({module for run in imports for module in run[2]})
+
+    print(f"Importar main:        {import_ms:8.1f} ms (mediana de {runs}, presupuesto {import_budget:.0f} ms)")
+    print(f"Primera respuesta:    {first_request_ms:8.1f} ms (mediana de {runs}, presupuesto {first_request_budget:.0f} ms)")
+    print("Módulos más caros al importar main:")
+    for ms, module in imports[-1][1]:
+        print(f"  {module:<32}{ms:8.1f} ms")
+
+    failures = []
+    if lazy_loaded:
+        failures.append(f"se importan al arrancar: {', '.join(lazy_loaded)}")
+    if import_ms > import_budget:
+        failures.append(f"importar main tarda {import_ms:.0f} ms > {import_budget:.0f} ms")
+    if first_request_ms > first_request_budget:
+        failures.append(f"la primera respuesta tarda {first_request_ms:.0f} ms > {first_request_budget:.0f} ms")
+    for failure in failures:
+        print(f"REGRESIÓN: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--first-request-budget-ms", type=float, default=FIRST_REQUEST_BUDGET_MS)
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.import_budget_ms, args.first_request_budget_ms))
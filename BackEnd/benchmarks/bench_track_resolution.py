@@ -0,0 +1,88 @@
+# benchmarks/bench_track_resolution.py
+"""Compara la resolución secuencial, concurrente y con caché de canciones "Título - Artista".
+
+Uso (desde BackEnd/):
+    python -m benchmarks.bench_track_resolution [--latency 0.08] [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from benchmarks.fake_spotify import run_fake_spotify
+
+SONG_COUNTS = (20, 50, 100)
+
+
+def build_songs(count: int):
+    return [(f"Song {i}", f"Artist {i % 7}") for i in range(count)]
+
+
+async def resolve_sequential(controller, canciones, access_token):
+    """Comportamiento anterior: una búsqueda tras otra."""
+    uris = []
+    for titulo, artista in canciones:
+        uri = await controller.search_track_uri(titulo, artista, access_token)
+        if uri:
+            uris.append(uri)
+    return uris
+
+
+async def run(latency: float, concurrency: int):
+    with run_fake_spotify(latency) as (base_url, app):
+        os.environ["SPOTIFY_API_URL"] = base_url
+        from src.controllers import spotify_controller
+        from src.services.spotify_client import SpotifyClient
+        from src.services.track_cache import TrackURICache
+
+        # Cliente apuntando al servidor falso
+        spotify_controller.spotify_client = SpotifyClient(base_url=base_url, http2=False)
+        await spotify_controller.spotify_client.start()
+
+        print(f"Latencia simulada por petición: {latency * 1000:.0f} ms, concurrencia: {concurrency}")
+        print(
+            f"{'canciones':>10} {'secuencial (s)':>16} {'concurrente (s)':>16} {'speedup':>8} "
+            f"{'con caché (s)':>14} {'búsquedas':>10}"
+        )
+        for count in SONG_COUNTS:
+            canciones = build_songs(count)
+
+            start = time.perf_counter()
+            sequential = await resolve_sequential(spotify_controller, canciones, "token")
+            sequential_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            concurrent = await spotify_controller.resolve_track_uris(
+                canciones, "token", concurrency=concurrency, cache=None
+            )
+            concurrent_time = time.perf_counter() - start
+
+            # Caché en memoria: una pasada en frío y se mide la segunda
+            cache = TrackURICache()
+            await spotify_controller.resolve_track_uris(canciones, "token", concurrency=concurrency, cache=cache)
+            requests_before = app.state.requests
+            start = time.perf_counter()
+            cached = await spotify_controller.resolve_track_uris(
+                canciones, "token", concurrency=concurrency, cache=cache
+            )
+            cached_time = time.perf_counter() - start
+            cached_searches = app.state.requests - requests_before
+
+            assert sequential == concurrent == cached, "El orden de track_uris debe conservarse"
+            print(
+                f"{count:>10} {sequential_time:>16.2f} {concurrent_time:>16.2f} "
+                f"{sequential_time / concurrent_time:>7.1f}x {cached_time:>14.4f} {cached_searches:>10}"
+            )
+
+        await spotify_controller.spotify_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run(args.latency, args.concurrency))
@@ -0,0 +1,100 @@
+# benchmarks/fake_spotify.py
+"""Servidor local que imita la Web API de Spotify con latencia artificial.
+
+Solo implementa los endpoints que usan los benchmarks. Cada respuesta espera
+`latency` segundos para simular el round trip real contra api.spotify.com.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def create_app(latency: float = 0.08, playlists: int = 0, tracks_per_playlist: int = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.bytes = 0
+    app.state.snapshots = {f"pl{i}": "s0" for i in range(playlists)}
+
+    @app.middleware("http")
+    async def simulate_latency(request: Request, call_next):
+        app.state.requests += 1
+        await asyncio.sleep(latency)
+        response = await call_next(request)
+        app.state.bytes += int(response.headers.get("content-length", 0))
+        return response
+
+    @app.get("/v1/search")
+    async def search(q: str, type: str = "track", limit: int = 1):
+        # Las consultas con "missing" no devuelven resultados
+        if "missing" in q:
+            return {"tracks": {"items": []}}
+        return {"tracks": {"items": [{"uri": f"spotify:track:{abs(hash(q)) % 10**8}"}]}}
+
+    @app.get("/v1/me/playlists")
+    async def me_playlists(request: Request, limit: int = 50, offset: int = 0):
+        ids = list(app.state.snapshots)[offset:offset + limit]
+        has_next = offset + limit < playlists
+        return {
+            "items": [
+                {
+                    "id": pid,
+                    "name": f"Playlist {pid}",
+                    "description": "",
+                    "images": [],
+                    "snapshot_id": app.state.snapshots[pid],
+                    "tracks": {"total": tracks_per_playlist},
+                }
+                for pid in ids
+            ],
+            "total": playlists,
+            "next": str(request.url.include_query_params(offset=offset + limit)) if has_next else None,
+        }
+
+    @app.get("/v1/playlists/{playlist_id}/tracks")
+    async def playlist_tracks(playlist_id: str, limit: int = 100, offset: int = 0, fields: str = None):
+        count = max(0, min(limit, tracks_per_playlist - offset))
+        items = [
+            {
+                "track": {
+                    "name": f"Track {offset + i}",
+                    "uri": f"spotify:track:{playlist_id}-{offset + i}",
+                    "artists": [{"name": "Artist"}],
+                    # Campos pesados que la proyección 'fields' permite omitir
+                    **({} if fields else {"album": {"images": [{"url": "x" * 200}] * 3}, "available_markets": ["ES"] * 180}),
+                }
+            }
+            for i in range(count)
+        ]
+        return {"items": items, "total": tracks_per_playlist}
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def run_fake_spotify(latency: float = 0.08, app: FastAPI = None):
+    """Arranca el servidor falso en un hilo y devuelve su URL base (/v1)."""
+    app = app or create_app(latency)
+    port = _free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}/v1", app
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
@@ -2,11 +2,15 @@ from src.config.db import Base, engine
 from src.models.auth_model import User
 from src.models.conversation_model import Conversation
 from src.models.message_model import Message
+from src.models.track_cache_model import TrackSearchCache
+from src.models.completion_cache_model import CompletionCacheEntry
+from src.models.schema_migration_model import SchemaMigration
+from src.config.migrations import apply_migrations
 
 print("🧨 Eliminando todas las tablas...")
 Base.metadata.drop_all(bind=engine)
 print("✅ Tablas eliminadas")
 
 print("🧱 Creando tablas nuevas...")
-Base.metadata.create_all(bind=engine)
+apply_migrations(engine)
 print("✅ Tablas creadas")
@@ -1,18 +1,27 @@
 # main.py
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from src.routes import auth_routes, chat_routes, spotify_routes
-from src.config.db import Base, engine
+from src.routes import auth_routes, chat_routes, spotify_routes, internal_routes
+from src.config.db import engine, async_engine
+from src.config.migrations import check_schema_version
+from src.services.spotify_client import spotify_client
+from src.services.chatIA_service import openrouter_client
 from fastapi.middleware.cors import CORSMiddleware
 
 # Manejo moderno del ciclo de vida de la app
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🔄 Iniciando app... creando tablas si no existen")
-    Base.metadata.create_all(bind=engine)
-    print("✅ Tablas listas")
+    # Las migraciones se aplican con `python migrate.py`; aquí solo se comprueba la versión
+    print("🔄 Iniciando app... comprobando la versión del esquema")
+    check_schema_version(engine)
+    print("✅ Esquema al día")
+    await spotify_client.start()
+    await openrouter_client.start()
     yield
     print("👋 Cerrando app...")
+    await spotify_client.close()
+    await openrouter_client.close()
+    await async_engine.dispose()
 
 # Crear app con ciclo de vida personalizado
 app = FastAPI(lifespan=lifespan)
@@ -28,4 +37,5 @@ app.add_middleware(
 # Incluir tus rutas
 app.include_router(chat_routes.router, prefix="/chat", tags=["chat"])
 app.include_router(auth_routes.router, prefix="/auth", tags=["auth"])
-app.include_router(spotify_routes.router, prefix="/spotify", tags=["spotify"])
\ No newline at end of file
+app.include_router(spotify_routes.router, prefix="/spotify", tags=["spotify"])
+app.include_router(internal_routes.router, prefix="/internal", tags=["internal"])
\ No newline at end of file
@@ -0,0 +1,61 @@
+# migrate.py
+"""Aplica las migraciones pendientes del esquema (ver src/config/migrations.py).
+
+A diferencia de init_db.py (que recrea todo), no borra datos: cada migración
+añade lo que le falta a la BD (tablas, columnas, índices) y se puede ejecutar
+varias veces. En Postgres los índices se crean con CREATE INDEX CONCURRENTLY,
+sin bloquear las escrituras. La app no migra al arrancar: solo comprueba que
+la versión del esquema es la última.
+
+Uso (desde BackEnd/):
+    python migrate.py            # aplica las migraciones pendientes
+    python migrate.py --status   # versión aplicada, pendientes y diferencias con los modelos
+"""
+
+import argparse
+import logging
+
+from sqlalchemy.engine import Engine
+
+from src.config.db import engine
+from src.config.migrations import (
+    LATEST_VERSION,
+    apply_migrations,
+    current_version,
+    pending_migrations,
+    schema_drift,
+)
+
+
+def migrate(bind: Engine = engine) -> list:
+    """Aplica las migraciones pendientes. Devuelve los cambios aplicados."""
+    return apply_migrations(bind)
+
+
+def status(bind: Engine = engine):
+    print(f"Versión del esquema: {current_version(bind)} (última: {LATEST_VERSION})")
+    for migration in pending_migrations(bind):
+        print(f"  pendiente {migration.version}: {migration.description}")
+    drift = schema_drift(bind)
+    if drift:
+        print(f"⚠️  Falta en la BD respecto a los modelos: {', '.join(drift)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="muestra el estado sin aplicar nada")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.status:
+        status()
+    else:
+        print("🔧 Aplicando migraciones pendientes...")
+        changes = migrate()
+        if changes:
+            print(f"✅ Cambios aplicados: {', '.join(changes)}")
+        else:
+            print(f"✅ El esquema ya estaba al día (versión {current_version()})")
+        drift = schema_drift()
+        if drift:
+            print(f"⚠️  Hay cambios en los modelos sin migración: {', '.join(drift)}")
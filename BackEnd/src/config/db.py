@@ -4,10 +4,13 @@ import logging
 import os
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Carga configuración del entorno (.env)
 from src.config import dotenv_config  # Asegúrate de que esto cargue dotenv correctamente
+from src.utils.db_pool_metrics import PoolMetrics, engine_pool, timed_pool_class
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
@@ -20,12 +23,95 @@ if not DB_URL:
     logger.error("DATABASE_URL no está definida en las variables de entorno.")
     raise RuntimeError("DATABASE_URL es requerida para conectarse a la base de datos")
 
+# === Pool de conexiones ===
+# Cada motor (síncrono y async) tiene su propio pool con esta configuración:
+# el máximo de conexiones por worker es 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").strip().lower() in ("1", "true", "yes", "on")
+DB_POOL_USE_LIFO = os.getenv("DB_POOL_ORDER", "fifo").strip().lower() == "lifo"
+
+# Métricas de cada pool, expuestas en /internal/db-pool
+pool_metrics = {
+    "sync": PoolMetrics("sync"),
+    "async": PoolMetrics("async"),
+}
+
+
+def pool_options(url: str) -> dict:
+    """Argumentos de pool para create_engine según el pool por defecto del dialecto.
+
+    Los ajustes de tamaño solo aplican a pools con cola (Postgres, SQLite en fichero);
+    SQLite en memoria usa pools de una conexión que no los aceptan.
+    """
+    parsed = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+
+    timed_pool = timed_pool_class(parsed.get_dialect().get_pool_class(parsed))
+    if timed_pool is not None:
+        options.update({
+            "poolclass": timed_pool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_use_lifo": DB_POOL_USE_LIFO,
+        })
+    return options
+
+
+def get_pool_stats() -> dict:
+    """Estado de los pools: configuración, conexiones en uso y tiempos de espera."""
+    return {
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "order": "lifo" if DB_POOL_USE_LIFO else "fifo",
+        },
+        "engines": {
+            "sync": pool_metrics["sync"].snapshot(engine_pool(engine)),
+            "async": pool_metrics["async"].snapshot(engine_pool(async_engine)),
+        },
+    }
+
+
 # Crear motor de conexión a la base de datos
-engine = create_engine(DB_URL)
+engine = create_engine(DB_URL, **pool_options(DB_URL))
+pool_metrics["sync"].attach(engine.pool)
 
 # Crear sesión de SQLAlchemy para manejo de transacciones
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# === Motor asíncrono ===
+
+# Drivers async equivalentes a los síncronos habituales
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Deriva la URL async (asyncpg / aiosqlite) a partir de la URL síncrona."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No hay driver async configurado para '{backend}', define ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+ASYNC_DB_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DB_URL)
+
+# Motor y sesiones async para las rutas que no deben bloquear el event loop (chat)
+async_engine = create_async_engine(ASYNC_DB_URL, **pool_options(ASYNC_DB_URL))
+pool_metrics["async"].attach(async_engine.sync_engine.pool)
+# expire_on_commit=False: tras el commit no se puede recargar atributos de forma implícita
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
 # Base de la cual heredan todos los modelos declarativos
 Base = declarative_base()
 
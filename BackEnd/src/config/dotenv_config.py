@@ -9,15 +9,18 @@ from dotenv import load_dotenv
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Cargar variables del archivo .env al entorno
+# Cargar variables del archivo .env al entorno. Los módulos que leen variables
+# al importarse importan este módulo, así el .env se lee una sola vez por proceso
 load_dotenv()
 logger.info(".env cargado correctamente.")
 
 # Obtener clave secreta para JWT u otros usos críticos
-SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
+SECRET_KEY = os.getenv("SECRET_KEY") or "default_secret_key"
 if SECRET_KEY == "default_secret_key":
     logger.warning("SECRET_KEY no definida en .env, se está usando el valor por defecto (no seguro para producción)")
 
+ALGORITHM = os.getenv("ALGORITHM") or "HS256"
+
 # Tiempo de expiración para el token de acceso (en minutos)
 try:
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
@@ -0,0 +1,273 @@
+# src/config/migrations.py
+"""Migraciones versionadas del esquema de la base de datos.
+
+Cada migración tiene un número de versión creciente y una función que recibe el
+motor y devuelve los cambios que ha hecho. `apply_migrations` (el comando
+`python migrate.py`) aplica las pendientes en orden y anota cada una en la
+tabla schema_migrations. Al arrancar, la app solo comprueba con
+`check_schema_version` que la versión anotada es la última, sin reflejar el
+resto del esquema.
+
+La migración 1 crea con su forma actual las tablas de los modelos que falten,
+así que en una BD nueva lo que añaden las siguientes ya existe: todas tienen que
+ser idempotentes. Por lo mismo, si una migración falla a medias se puede volver
+a lanzar el comando.
+
+Para cambiar el esquema: modificar el modelo en src/models/ y añadir al final de
+MIGRATIONS una migración que haga el cambio en las BD existentes.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Index, Table, bindparam, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from src.config.db import Base, engine
+from src.models.auth_model import User
+from src.models.conversation_model import Conversation
+from src.models.message_model import Message
+from src.models.track_cache_model import TrackSearchCache
+from src.models.completion_cache_model import CompletionCacheEntry
+from src.models.schema_migration_model import SchemaMigration
+from src.utils.token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Qué hace el arranque si el esquema no está al día: error (no arranca), warn (solo lo registra) u off
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "error").strip().lower()
+
+BACKFILL_BATCH = 1000
+# Advisory lock de Postgres: dos `migrate.py` a la vez (p. ej. dos despliegues) se esperan
+MIGRATION_LOCK_KEY = 4_187_251
+
+
+class SchemaOutOfDateError(RuntimeError):
+    """La BD no tiene aplicadas todas las migraciones que espera el código."""
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Engine], List[str]]
+
+
+# === Operaciones ===
+
+def create_missing_tables(bind: Engine) -> list:
+    """Crea las tablas de los modelos que no existen, con sus índices. Devuelve sus nombres."""
+    inspector = inspect(bind)
+    missing = [table for table in Base.metadata.sorted_tables if not inspector.has_table(table.name)]
+    for table in missing:
+        logger.info(f"[MIGRATE] Creando tabla {table.name}")
+    Base.metadata.create_all(bind=bind, tables=missing)
+    return [table.name for table in missing]
+
+
+def add_columns(bind: Engine, table: Table, *names: str) -> list:
+    """Añade con ALTER TABLE las columnas `names` de `table` que no existen. Devuelve "tabla.columna"."""
+    existing = {column["name"] for column in inspect(bind).get_columns(table.name)}
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        if not column.nullable:
+            raise RuntimeError(f"La columna {table.name}.{column.name} debe admitir NULL para añadirla")
+        logger.info(f"[MIGRATE] Añadiendo columna {column.name} a {table.name}")
+        with bind.begin() as conn:
+            ddl = CreateColumn(column).compile(dialect=bind.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_index_concurrently(bind: Engine, index: Index) -> list:
+    """CREATE INDEX CONCURRENTLY en Postgres: la tabla sigue admitiendo escrituras mientras se construye.
+
+    Tiene que ir fuera de una transacción. Si una ejecución anterior se cortó,
+    Postgres deja el índice marcado como inválido: se borra y se vuelve a crear.
+    """
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(
+            text(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name"
+            ),
+            {"name": index.name},
+        ).scalar()
+        if valid:
+            return []
+        if valid is False:
+            logger.warning(f"[MIGRATE] Índice {index.name} inválido de una ejecución anterior, se recrea")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {bind.dialect.identifier_preparer.quote(index.name)}"))
+
+        logger.info(f"[MIGRATE] Creando índice {index.name} en {index.table.name} (CONCURRENTLY)")
+        options = index.dialect_options["postgresql"]
+        previous = options["concurrently"]
+        options["concurrently"] = True
+        try:
+            conn.execute(CreateIndex(index))
+        finally:
+            options["concurrently"] = previous
+    return [index.name]
+
+
+def create_index(bind: Engine, table: Table, name: str) -> list:
+    """Crea el índice `name` declarado en `table` si no existe. Devuelve [name] si lo crea."""
+    index = next(index for index in table.indexes if index.name == name)
+    if bind.dialect.name == "postgresql":
+        return create_index_concurrently(bind, index)
+
+    if name in {existing["name"] for existing in inspect(bind).get_indexes(table.name)}:
+        return []
+    logger.info(f"[MIGRATE] Creando índice {name} en {table.name}")
+    index.create(bind=bind)
+    return [name]
+
+
+def backfill_message_token_counts(bind: Engine) -> int:
+    """Calcula token_count de los mensajes que no lo tienen, por lotes. Devuelve cuántos."""
+    total = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(Message.id, Message.content)
+                .where(Message.token_count.is_(None))
+                .limit(BACKFILL_BATCH)
+            ).all()
+            if not rows:
+                return total
+            conn.execute(
+                update(Message).where(Message.id == bindparam("message_id")).values(token_count=bindparam("tokens")),
+                [{"message_id": message_id, "tokens": estimate_tokens(content)} for message_id, content in rows]
+            )
+        total += len(rows)
+        logger.info(f"[MIGRATE] token_count calculado para {total} mensajes")
+
+
+# === Migraciones ===
+
+def initial_tables(bind: Engine) -> list:
+    return create_missing_tables(bind)
+
+
+def chat_history_indexes(bind: Engine) -> list:
+    return (
+        create_index(bind, Message.__table__, "ix_messages_conversation_id_created_at")
+        + create_index(bind, Conversation.__table__, "ix_conversations_user_id_created_at")
+    )
+
+
+def message_token_count(bind: Engine) -> list:
+    added = add_columns(bind, Message.__table__, "token_count")
+    backfill_message_token_counts(bind)
+    return added
+
+
+def conversation_summary(bind: Engine) -> list:
+    return add_columns(bind, Conversation.__table__, "summary", "summary_until_id")
+
+
+MIGRATIONS = [
+    Migration(1, "Tablas de los modelos", initial_tables),
+    Migration(2, "Índices (conversation_id, created_at) y (user_id, created_at)", chat_history_indexes),
+    Migration(3, "messages.token_count", message_token_count),
+    Migration(4, "Resumen de conversaciones largas", conversation_summary),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# === Ejecución ===
+
+def current_version(bind: Engine = engine) -> int:
+    """Última migración aplicada (0 si no hay tabla de versiones).
+
+    Los errores de conexión se propagan: una BD inaccesible no se confunde con
+    una sin migrar.
+    """
+    with bind.connect() as conn:
+        if not inspect(conn).has_table(SchemaMigration.__tablename__):
+            return 0
+        return conn.execute(select(func.max(SchemaMigration.version))).scalar() or 0
+
+
+@contextmanager
+def migration_lock(bind: Engine):
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def pending_migrations(bind: Engine = engine) -> List[Migration]:
+    applied = current_version(bind)
+    return [migration for migration in MIGRATIONS if migration.version > applied]
+
+
+def apply_migrations(bind: Engine = engine) -> list:
+    """Aplica en orden las migraciones pendientes. Devuelve los cambios hechos."""
+    changes = []
+    with migration_lock(bind):
+        SchemaMigration.__table__.create(bind=bind, checkfirst=True)
+        for migration in pending_migrations(bind):
+            logger.info(f"[MIGRATE] Aplicando migración {migration.version}: {migration.description}")
+            changes += migration.upgrade(bind)
+            with bind.begin() as conn:
+                conn.execute(insert(SchemaMigration).values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.utcnow(),
+                ))
+    return changes
+
+
+def schema_drift(bind: Engine = engine) -> list:
+    """Tablas, columnas e índices de los modelos que no están en la BD.
+
+    Tras aplicar todas las migraciones debería estar vacío; si no, falta una
+    migración para algún cambio de los modelos.
+    """
+    inspector = inspect(bind)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            missing.append(table.name)
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing += [f"{table.name}.{column.name}" for column in table.columns if column.name not in columns]
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing += sorted(index.name for index in table.indexes if index.name not in indexes)
+    return missing
+
+
+def check_schema_version(bind: Engine = engine, mode: str = DB_SCHEMA_CHECK) -> Optional[int]:
+    """Comprobación de arranque: la BD tiene aplicada la última migración.
+
+    Con `mode` "error" lanza SchemaOutOfDateError si faltan migraciones, con
+    "warn" solo lo registra y con "off" no consulta nada.
+    """
+    if mode == "off":
+        return None
+
+    version = current_version(bind)
+    if version < LATEST_VERSION:
+        message = (
+            f"El esquema de la BD está en la versión {version} y el código espera la {LATEST_VERSION}: "
+            "ejecuta `python migrate.py`"
+        )
+        if mode == "error":
+            raise SchemaOutOfDateError(message)
+        logger.error(f"[MIGRATE] {message}")
+    elif version > LATEST_VERSION:
+        logger.warning(f"[MIGRATE] El esquema (versión {version}) es más nuevo que el código ({LATEST_VERSION})")
+    return version
@@ -3,25 +3,33 @@
 # --- Librerías estándar ---
 import os
 import logging
+from typing import Optional
+from urllib.parse import urlencode
 
 # --- Librerías de terceros ---
-from dotenv import load_dotenv
 from email_validator import validate_email, EmailNotValidError
 from fastapi import HTTPException, Depends, Security
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from sqlalchemy import and_
 from sqlalchemy.orm import Session
-from spotipy.oauth2 import SpotifyOAuth
 
 # --- Módulos locales ---
-from src.config.db import SessionLocal
+from src.config.db import SessionLocal, AsyncSessionLocal
 from src.models.auth_model import User
-from src.utils.auth import hash_password, verify_password, create_access_token
+from src.services.principal_cache import Principal, principal_cache
+from src.utils.auth import ALGORITHM, SECRET_KEY, create_access_token
+from src.utils.password_hasher import password_hasher
 
 # --- Configuración global ---
-load_dotenv()
-ALGORITHM = os.getenv("ALGORITHM") or "HS256"
-SECRET_KEY = os.getenv("SECRET_KEY") or "supersecretkey"
+SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
+SPOTIFY_AUTHORIZE_URL = "https://accounts.spotify.com/authorize"
+SPOTIFY_SCOPES = (
+    "user-library-read user-read-private user-read-email "
+    "playlist-modify-public playlist-modify-private ugc-image-upload "
+    "playlist-read-private user-top-read"
+)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -40,6 +48,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Provee una sesión asíncrona de base de datos y asegura su cierre."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def validate_email_address(email: str):
     """Valida el formato del correo electrónico."""
     logger.info(f"Validando email: {email}")
@@ -52,9 +65,11 @@ def validate_email_address(email: str):
         raise HTTPException(status_code=400, detail={"success": False, "error": f"Invalid email: {e}"})
 
 # --- Registro y Login ---
+# El acceso a la BD va al threadpool y bcrypt al pool de hashing: el event loop
+# no se bloquea y la espera del hash no ocupa un hilo del threadpool.
 
-def register_user(username: str, email: str, password: str, db: Session):
-    """Registra un nuevo usuario."""
+def check_new_user(username: str, email: str, db: Session):
+    """Valida el email y comprueba que ni el username ni el email están registrados."""
     validate_email_address(email)
 
     if db.query(User).filter(User.username == username).first():
@@ -65,12 +80,18 @@ def register_user(username: str, email: str, password: str, db: Session):
         logger.warning(f"Email ya registrado: {email}")
         raise HTTPException(status_code=400, detail={"success": False, "error": "Email already registered"})
 
-    hashed = hash_password(password)
-    new_user = User(username=username, email=email, hashed_password=hashed)
-
+def create_user(username: str, email: str, hashed_password: str, db: Session) -> User:
+    new_user = User(username=username, email=email, hashed_password=hashed_password)
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    return new_user
+
+async def register_user(username: str, email: str, password: str, db: Session):
+    """Registra un nuevo usuario."""
+    await run_in_threadpool(check_new_user, username, email, db)
+    hashed = await password_hasher.hash(password)
+    new_user = await run_in_threadpool(create_user, username, email, hashed, db)
 
     token = create_access_token({"sub": new_user.email})
     redirect_url = get_spotify_login_url(email=new_user.email)
@@ -82,14 +103,34 @@ def register_user(username: str, email: str, password: str, db: Session):
         "redirect_url": redirect_url
     }
 
-def login_user(email: str, password: str, db: Session):
+def find_user_by_email(email: str, db: Session) -> Optional[User]:
+    return db.query(User).filter(User.email == email).first()
+
+def save_password_hash(user: User, new_hash: str, db: Session):
+    """Guarda el hash rehecho con los parámetros actuales; si falla, el login sigue adelante."""
+    try:
+        user.hashed_password = new_hash
+        db.commit()
+        logger.info(f"Hash de contraseña actualizado para el usuario ID {user.id}")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"No se pudo actualizar el hash del usuario ID {user.id}: {e}")
+    # Se recarga aquí para que leer sus atributos después no consulte la BD desde el event loop
+    db.refresh(user)
+
+async def login_user(email: str, password: str, db: Session):
     """Autentica un usuario y retorna token y redirección a Spotify."""
-    user = db.query(User).filter(User.email == email).first()
+    user = await run_in_threadpool(find_user_by_email, email, db)
+    valid, new_hash = (await password_hasher.verify_and_update(password, user.hashed_password)) if user else (False, None)
 
-    if not user or not verify_password(password, user.hashed_password):
+    if not valid:
         logger.warning(f"Intento de login fallido para: {email}")
         raise HTTPException(status_code=401, detail={"success": False, "error": "Invalid credentials"})
 
+    if new_hash:
+        # El hash guardado usa otros parámetros (p. ej. otro coste): se rehace con los actuales
+        await run_in_threadpool(save_password_hash, user, new_hash, db)
+
     token = create_access_token({"sub": user.email})
     redirect_url = get_spotify_login_url(email=user.email)
 
@@ -100,47 +141,88 @@ def login_user(email: str, password: str, db: Session):
         "redirect_url": redirect_url
     }
 
-def get_current_user(token: str = Security(oauth2_scheme), db: Session = Depends(get_db)):
-    """Obtiene el usuario autenticado desde el token JWT."""
+def load_principal(email: str, db: Session) -> Optional[Principal]:
+    """Lee de la BD solo las columnas del principal (sin contraseña ni tokens)."""
+    row = db.query(
+        User.id,
+        User.username,
+        User.email,
+        User.spotify_user_id,
+        and_(User.spotify_user_id.isnot(None), User.spotify_access_token.isnot(None)).label("spotify_connected"),
+    ).filter(User.email == email).first()
+    if row is None:
+        return None
+    return Principal(row.id, row.username, row.email, row.spotify_user_id, bool(row.spotify_connected))
+
+def get_current_user(token: str = Security(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Obtiene el usuario autenticado desde el token JWT (desde la caché si está)."""
     credentials_exception = HTTPException(
         status_code=401,
         detail="No se pudo verificar las credenciales del usuario.",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # python-jose se importa en la primera petición autenticada, no al arrancar
+    from jose import JWTError, jwt
+
     try:
-        logger.debug(f"Token recibido: {token}")
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
 
         if email is None:
             logger.warning("Token JWT inválido: sin 'sub'")
             raise credentials_exception
-
-        logger.info(f"Token decodificado correctamente. Email: {email}")
     except JWTError as e:
         logger.error(f"Error al decodificar token JWT: {str(e)}")
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
-
+    user = principal_cache.get(email)
     if user is None:
-        logger.warning(f"Usuario no encontrado: {email}")
-        raise credentials_exception
+        user = load_principal(email, db)
+        if user is None:
+            logger.warning(f"Usuario no encontrado: {email}")
+            raise credentials_exception
+        principal_cache.set(email, user)
 
-    logger.info(f"Usuario autenticado: {user.username} ({user.email})")
+    logger.debug(f"Usuario autenticado: {user.username} ({user.email})")
     return user
 
+def load_user(user, db: Session) -> User:
+    """Fila completa de un usuario autenticado, para los handlers que la necesitan.
+
+    Un `Principal` se carga de la BD por id; cualquier otro objeto (un `User` ya
+    cargado) se devuelve tal cual.
+    """
+    if not isinstance(user, Principal):
+        return user
+    row = db.get(User, user.id)
+    if row is None:
+        principal_cache.invalidate(user.email)
+        logger.warning(f"Usuario no encontrado: {user.email}")
+        raise HTTPException(
+            status_code=401,
+            detail="No se pudo verificar las credenciales del usuario.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return row
+
 # --- Perfil de Usuario ---
 
-def get_user_info(user: User):
+def get_user_info(user: Principal):
     """Devuelve información básica del usuario."""
     return {
         "username": user.username,
         "email": user.email
     }
 
-def update_user_info(data, user: User, db: Session):
+async def update_user_info(data, user: Principal, db: Session):
     """Actualiza datos del usuario (username, email, password)."""
+    hashed_password = await password_hasher.hash(data.password) if data.password else None
+    return await run_in_threadpool(apply_user_update, data, user, hashed_password, db)
+
+def apply_user_update(data, user: Principal, hashed_password: Optional[str], db: Session):
+    """Aplica en la BD los cambios de update_user_info; la contraseña llega ya hasheada."""
+    user = load_user(user, db)
+    previous_email = user.email
     try:
         updated = False
 
@@ -166,12 +248,13 @@ def update_user_info(data, user: User, db: Session):
 
         if data.password:
             logger.info(f"Actualizando contraseña del usuario ID {user.id}")
-            user.hashed_password = hash_password(data.password)
+            user.hashed_password = hashed_password
             updated = True
 
         if updated:
             db.commit()
             db.refresh(user)
+            principal_cache.invalidate(previous_email, user.email)
             logger.info(f"Usuario actualizado exitosamente: {user.id}")
         else:
             logger.info(f"No se realizaron cambios para el usuario: {user.id}")
@@ -196,18 +279,15 @@ def update_user_info(data, user: User, db: Session):
 # --- Spotify Integration ---
 def get_spotify_login_url(email: str = None):
     """Genera URL de autorización para Spotify con estado opcional (email)."""
-    sp_oauth = SpotifyOAuth(
-        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
-        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
-        redirect_uri=os.getenv("SPOTIFY_REDIRECT_URI"),
-        scope=(
-            "user-library-read user-read-private user-read-email "
-            "playlist-modify-public playlist-modify-private ugc-image-upload "
-            "playlist-read-private user-top-read"
-        ),
-        show_dialog=True
-    )
-    url = sp_oauth.get_authorize_url(state=email)
+    params = {
+        "client_id": SPOTIFY_CLIENT_ID,
+        "response_type": "code",
+        "redirect_uri": SPOTIFY_REDIRECT_URI,
+        "scope": SPOTIFY_SCOPES,
+    }
+    if email is not None:
+        params["state"] = email
+    params["show_dialog"] = True
+    url = f"{SPOTIFY_AUTHORIZE_URL}?{urlencode(params)}"
     logger.debug(f"URL de login de Spotify generada: {url}")
     return url
-
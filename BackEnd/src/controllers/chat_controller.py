@@ -1,60 +1,130 @@
+import asyncio
+import json
 import logging
+import os
 import re
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
 from fastapi import HTTPException
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from src.config.db import AsyncSessionLocal
 from src.services.chatIA_service import Agent
+from src.services.openrouter_resilience import OpenRouterError, to_http_exception
 from src.models.conversation_model import Conversation
 from src.models.message_model import Message
 from src.controllers.spotify_controller import get_user_full_top_info
-from src.models.auth_model import User
+from src.utils.token_budget import (
+    CHAT_CONTEXT_MAX_MESSAGES,
+    MESSAGE_OVERHEAD_TOKENS,
+    context_budget,
+    estimate_tokens,
+    fit_history,
+    message_tokens,
+)
+from src.services.principal_cache import Principal
 
 logger = logging.getLogger(__name__)
+# Un único Agent para chat y títulos: reutiliza el pool HTTP compartido de OpenRouter
 agent = Agent()
 
-def get_conversation_by_id(chat_id: int, db: Session):
-    return db.query(Conversation).filter(Conversation.id == chat_id).first()
+# Resúmenes de conversaciones largas (ver "Resúmenes en segundo plano")
+CHAT_SUMMARY_TRIGGER_MESSAGES = int(os.getenv("CHAT_SUMMARY_TRIGGER_MESSAGES", 20))
+CHAT_SUMMARY_KEEP_MESSAGES = int(os.getenv("CHAT_SUMMARY_KEEP_MESSAGES", 6))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 250))
+summary_agent = Agent(max_tokens=CHAT_SUMMARY_MAX_TOKENS, temperature=0.3)
 
-async def start_conversation(user_id: str, db: Session):
+# Temperatura baja para los títulos: respuestas reproducibles y cacheables
+CHAT_TITLE_TEMPERATURE = float(os.getenv("CHAT_TITLE_TEMPERATURE", 0.2))
+
+# Sesiones propias para el trabajo que sigue tras la respuesta (títulos, stream):
+# la sesión de la petición ya estará cerrada
+session_factory = AsyncSessionLocal
+
+# Tareas en segundo plano que deben terminar aunque se cancele la petición
+_background_tasks: set = set()
+
+async def get_conversation_by_id(chat_id: int, db: AsyncSession):
+    return await db.get(Conversation, int(chat_id))
+
+async def start_conversation(user_id: int, db: AsyncSession):
     logger.info(f"Start conversation for user with id {user_id}")
     try:
         new_conversation = Conversation(user_id=user_id)
         db.add(new_conversation)
-        db.commit()
-        db.refresh(new_conversation)
+        await db.commit()
+        await db.refresh(new_conversation)
         logger.info(f"Conversation created with id {new_conversation.id}")
         return {"chat_id": new_conversation.id}
     except Exception as e:
         logger.error(f"Error creating conversation for user with {user_id}: {e}")
         raise HTTPException(status_code=500, detail="Error creationg conversation")
 
-async def save_message(chat_id: int, role: str, content: str, db: Session):
+async def save_message(chat_id: int, role: str, content: str, db: AsyncSession):
     logger.info(f"Save message for conversation {chat_id}")
     try:
         new_message = Message(conversation_id=chat_id, role=role, content=content)
         db.add(new_message)
-        db.commit()
-        db.refresh(new_message)
+        await db.commit()
+        await db.refresh(new_message)
         logger.info(f"Message saved with id {new_message.id}")
         return new_message
     except Exception as e:
         logger.error(f"Error saving message for conversation {chat_id}: {e}")
         raise HTTPException(status_code=500, detail="Error saving the message")
 
-async def handle_message(chat_id: int, question: str, user: User, db: Session, mode: str = "normal"):
-    conversation = db.query(Conversation).filter(Conversation.id == chat_id).first()
+def turn_rows(chat_id: int, question: str, answer: str) -> list:
+    # Misma fecha para los dos mensajes del turno: el id desempata el orden
+    now = datetime.utcnow()
+    return [
+        {"conversation_id": chat_id, "role": role, "content": content, "created_at": now, "token_count": estimate_tokens(content)}
+        for role, content in (("user", question), ("assistant", answer))
+    ]
+
+async def save_turn(chat_id: int, question: str, answer: str, db: AsyncSession, return_ids: bool = False) -> Optional[list]:
+    """Guarda la pregunta y la respuesta de un turno en una sola transacción.
+
+    Un único INSERT con las dos filas y un commit; los ids generados solo se
+    piden (RETURNING) si `return_ids` es True. Si falla no se guarda ninguno.
+    """
+    try:
+        statement = insert(Message)
+        if return_ids:
+            result = await db.execute(statement.returning(Message.id, sort_by_parameter_order=True), turn_rows(chat_id, question, answer))
+            ids = list(result.scalars())
+        else:
+            await db.execute(statement, turn_rows(chat_id, question, answer))
+            ids = None
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    logger.info(f"Turn saved for conversation {chat_id}")
+    return ids
+
+async def build_chat_context(
+    chat_id: int,
+    user: Principal,
+    db: AsyncSession,
+    user_db: Optional[Session] = None,
+    question: str = "",
+    mode: str = "normal"
+):
+    """Carga la conversación, el historial que cabe en el presupuesto de tokens y el contexto musical.
+
+    Si la conversación tiene resumen, el historial empieza por él y solo incluye
+    los mensajes posteriores; cuando se acumulan demasiados sin resumir se lanza
+    un resumen nuevo en segundo plano.
+
+    `user_db` es la sesión síncrona a la que pertenece `user`; solo se usa si
+    hay que refrescar su token de Spotify.
+    """
+    conversation = await db.get(Conversation, chat_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    history = [
-        {"role": msg.role, "content": msg.content}
-        for msg in db.query(Message)
-            .filter(Message.conversation_id == chat_id)
-            .order_by(Message.created_at.desc())
-            .limit(5)
-            .all()
-    ][::-1]
-
-    top_info = get_user_full_top_info(user, db)
+    top_info = await get_user_full_top_info(user, user_db)
 
     def format_top_info(title: str, data: dict) -> str:
         return (
@@ -69,65 +139,443 @@ async def handle_message(chat_id: int, question: str, user: User, db: Session, m
         format_top_info("Top géneros", top_info["top_genres"])
     )
 
+    history, unsummarized = await load_history_within_budget(conversation, db, question, mode, extra_context)
+    if unsummarized >= CHAT_SUMMARY_TRIGGER_MESSAGES:
+        schedule_summary(chat_id, conversation.summary_until_id)
+    return conversation, history, extra_context
+
+def summary_message(summary: str) -> dict:
+    return {"role": "system", "content": f"Resumen de la conversación anterior:\n{summary}"}
+
+async def load_history_within_budget(conversation: Conversation, db: AsyncSession, question: str, mode: str, extra_context: str):
+    """Historial más reciente que cabe en el presupuesto del modelo tras el prompt de sistema y la pregunta.
+
+    Devuelve (historial, mensajes sin resumir leídos); el segundo valor está
+    acotado por CHAT_CONTEXT_MAX_MESSAGES.
+    """
+    chat_id = conversation.id
+    fixed_tokens = message_tokens(agent.get_context(mode) + extra_context) + message_tokens(question)
+    summary = [summary_message(conversation.summary)] if conversation.summary else []
+    fixed_tokens += sum(message_tokens(m["content"]) for m in summary)
+    budget = context_budget(agent.model) - fixed_tokens
+
+    query = (
+        select(Message.role, Message.content, Message.token_count)
+        .where(Message.conversation_id == chat_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(CHAT_CONTEXT_MAX_MESSAGES)
+    )
+    if conversation.summary_until_id is not None:
+        query = query.where(Message.id > conversation.summary_until_id)
+    rows = (await db.execute(query)).all()
+    candidates = (
+        {
+            "role": role,
+            "content": content,
+            # Los mensajes anteriores a la columna no tienen el recuento guardado
+            "tokens": (token_count if token_count is not None else estimate_tokens(content)) + MESSAGE_OVERHEAD_TOKENS,
+        }
+        for role, content, token_count in rows
+    )
+    selected = fit_history(candidates, budget)
+    logger.info(f"Context for conversation {chat_id}: {len(selected)} messages, budget {budget} tokens")
+    return summary + [{"role": m["role"], "content": m["content"]} for m in selected], len(rows)
+
+# === Trabajos en segundo plano por conversación ===
+
+def start_job(jobs: Dict[int, asyncio.Task], chat_id: int, coro) -> asyncio.Task:
+    """Lanza `coro` como el trabajo de `chat_id` en `jobs`; se borra de `jobs` al terminar."""
+    task = asyncio.ensure_future(coro)
+    jobs[chat_id] = task
+
+    def forget(done: asyncio.Task):
+        if jobs.get(chat_id) is done:
+            del jobs[chat_id]
+
+    task.add_done_callback(forget)
+    return task
+
+# === Títulos automáticos en segundo plano ===
+
+DEFAULT_TITLE_PATTERN = re.compile(r"^Conversación \d{2}/\d{2}/\d{4} \d{2}:\d{2}$")
+
+# Un único trabajo de título en curso por conversación
+_title_jobs: Dict[int, asyncio.Task] = {}
+
+def build_title_prompt(history: list, question: str) -> str:
+    prompt = (
+        "Dada la siguiente conversación de música, sugiere un título muy breve en español. No me digas nada más.\n"
+        "Si no hay suficiente contexto, responde SOLO con 'NO_TITULO'.\n\n"
+        "Conversación:\n"
+    )
+    for msg in history + [{"role": "user", "content": question}]:
+        prompt += f"{msg['role']}: {msg['content']}\n"
+    return prompt + "\nTítulo:"
+
+async def generate_title(chat_id: int, default_title: str, history: list, question: str) -> Optional[str]:
+    """Genera y guarda el título de una conversación. Devuelve el título nuevo o None.
+
+    Solo se sobrescribe si el título sigue siendo `default_title` (compare-and-set),
+    así no se pisa un renombrado manual ni otro título generado en paralelo.
+    """
+    try:
+        generated_title = await agent.chat(
+            build_title_prompt(history, question), [], temperature=CHAT_TITLE_TEMPERATURE, use_cache=True
+        )
+    except Exception as e:
+        logger.error(f"Error generando título automático: {e}")
+        return None
+
+    if not generated_title or "NO_TITULO" in generated_title.upper():
+        return None
+    title = generated_title.strip()
+
+    async with session_factory() as db:
+        try:
+            result = await db.execute(
+                update(Conversation)
+                .where(Conversation.id == chat_id, Conversation.title == default_title)
+                .values(title=title)
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error guardando título automático de la conversación {chat_id}: {e}")
+            return None
+
+    if not result.rowcount:
+        logger.info(f"Título de la conversación {chat_id} ya cambiado, se descarta el generado")
+        return None
+    logger.info(f"Título generado para la conversación {chat_id}")
+    return title
+
+def schedule_title_generation(chat_id: int, current_title: str, history: list, question: str) -> Optional[asyncio.Task]:
+    """Lanza la generación de título en segundo plano si la conversación tiene el título por defecto.
+
+    Si ya hay un trabajo en curso para la conversación se devuelve ese mismo.
+    """
+    task = _title_jobs.get(chat_id)
+    if task is not None and not task.done():
+        return task
+    if not (current_title and DEFAULT_TITLE_PATTERN.match(current_title)):
+        return None
+
+    return start_job(_title_jobs, chat_id, generate_title(chat_id, current_title, history, question))
+
+def is_title_pending(chat_id: int) -> bool:
+    task = _title_jobs.get(chat_id)
+    return task is not None and not task.done()
+
+async def get_title_status(chat_id: int, db: AsyncSession, wait: float = 0) -> dict:
+    """Estado del título. Con `wait` > 0 espera (como máximo esos segundos) a que termine el trabajo en curso."""
+    task = _title_jobs.get(chat_id)
+    if wait > 0 and task is not None and not task.done():
+        try:
+            # shield: si expira la espera, el trabajo sigue para los demás
+            await asyncio.wait_for(asyncio.shield(task), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+
+    # La fila puede haber cambiado desde otra sesión mientras esperábamos
+    title = await db.scalar(select(Conversation.title).where(Conversation.id == chat_id))
+    if title is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"title": title, "title_pending": is_title_pending(chat_id)}
+
+# === Resúmenes en segundo plano ===
+
+# Un único resumen en curso por conversación
+_summary_jobs: Dict[int, asyncio.Task] = {}
+
+def build_summary_prompt(previous_summary: Optional[str], messages: list) -> str:
+    prompt = (
+        "Resume en español, de forma muy compacta, la siguiente conversación con un asistente musical. "
+        "Conserva gustos, peticiones y recomendaciones importantes. Responde solo con el resumen.\n\n"
+    )
+    if previous_summary:
+        prompt += f"Resumen previo:\n{previous_summary}\n\n"
+    prompt += "Mensajes nuevos:\n"
+    for role, content in messages:
+        prompt += f"{role}: {content}\n"
+    return prompt + "\nResumen:"
+
+async def generate_summary(chat_id: int, summary_until_id: Optional[int]) -> Optional[str]:
+    """Incorpora al resumen los mensajes sin resumir salvo los CHAT_SUMMARY_KEEP_MESSAGES últimos.
+
+    Se guarda con compare-and-set sobre `summary_until_id`: si otro resumen se
+    adelantó, este se descarta. Devuelve el resumen nuevo o None.
+    """
+    async with session_factory() as db:
+        query = select(Message.id, Message.role, Message.content).where(Message.conversation_id == chat_id)
+        if summary_until_id is not None:
+            query = query.where(Message.id > summary_until_id)
+        rows = (await db.execute(query.order_by(Message.id))).all()
+        to_summarize = rows[:len(rows) - CHAT_SUMMARY_KEEP_MESSAGES]
+        if not to_summarize:
+            return None
+        previous_summary = await db.scalar(select(Conversation.summary).where(Conversation.id == chat_id))
+
+    try:
+        summary = await summary_agent.chat(
+            build_summary_prompt(previous_summary, [(role, content) for _, role, content in to_summarize]), []
+        )
+    except Exception as e:
+        logger.error(f"Error generando resumen de la conversación {chat_id}: {e}")
+        return None
+    if not summary or not summary.strip():
+        return None
+    summary = summary.strip()
+
+    async with session_factory() as db:
+        try:
+            result = await db.execute(
+                update(Conversation)
+                .where(
+                    Conversation.id == chat_id,
+                    Conversation.summary_until_id.is_(None) if summary_until_id is None
+                    else Conversation.summary_until_id == summary_until_id
+                )
+                .values(summary=summary, summary_until_id=to_summarize[-1][0])
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error guardando resumen de la conversación {chat_id}: {e}")
+            return None
+
+    if not result.rowcount:
+        logger.info(f"Resumen de la conversación {chat_id} ya actualizado, se descarta")
+        return None
+    logger.info(f"Resumen actualizado para la conversación {chat_id} ({len(to_summarize)} mensajes)")
+    return summary
+
+def schedule_summary(chat_id: int, summary_until_id: Optional[int]) -> asyncio.Task:
+    """Lanza el resumen en segundo plano; si ya hay uno en curso se devuelve ese mismo."""
+    task = _summary_jobs.get(chat_id)
+    if task is not None and not task.done():
+        return task
+    return start_job(_summary_jobs, chat_id, generate_summary(chat_id, summary_until_id))
+
+async def handle_message(chat_id: int, question: str, user: Principal, db: AsyncSession, mode: str = "normal", user_db: Optional[Session] = None):
+    conversation, history, extra_context = await build_chat_context(chat_id, user, db, user_db, question=question, mode=mode)
+
     try:
         answer = await agent.chat(question, history, mode=mode, extra_context=extra_context)
     except Exception as e:
         logger.error(f"Error creating the answer: {e}")
-        raise HTTPException(status_code=500, detail="Error creating the answer")
+        raise to_http_exception(e, "Error creating the answer")
 
-    await save_message(chat_id, "user", question, db)
-    await save_message(chat_id, "assistant", answer, db)
+    try:
+        await save_turn(chat_id, question, answer, db)
+    except Exception as e:
+        logger.error(f"Error saving turn for conversation {chat_id}: {e}")
+        raise HTTPException(status_code=500, detail="Error saving the message")
 
-    default_title_pattern = r"^Conversación \d{2}/\d{2}/\d{4} \d{2}:\d{2}$"
-    title_changed = False
+    # El título se genera después de responder, sin retrasar la respuesta
+    title_pending = schedule_title_generation(chat_id, conversation.title, history, question) is not None
 
-    if conversation.title and re.match(default_title_pattern, conversation.title):
-        agent_temp = Agent() 
-        history.append({"role": "user", "content": question})
-        prompt = (
-            "Dada la siguiente conversación de música, sugiere un título muy breve en español. No me digas nada más.\n"
-            "Si no hay suficiente contexto, responde SOLO con 'NO_TITULO'.\n\n"
-            "Conversación:\n"
-        )
-        for msg in history:
-            prompt += f"{msg['role']}: {msg['content']}\n"
-        prompt += "\nTítulo:"
+    return {"answer": answer, "title_changed": False, "title_pending": title_pending}
+
+def format_sse(event: str, data: dict) -> str:
+    """Serializa un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def persist_turn(chat_id: int, question: str, answer: str):
+    """Guarda la pregunta y la respuesta de un turno en una sesión propia."""
+    async with session_factory() as db:
+        try:
+            await save_turn(chat_id, question, answer, db)
+        except Exception as e:
+            logger.error(f"Error saving streamed turn for conversation {chat_id}: {e}")
 
+async def stream_message(
+    chat_id: int,
+    question: str,
+    user: Principal,
+    db: AsyncSession,
+    mode: str = "normal",
+    user_db: Optional[Session] = None
+) -> AsyncIterator[str]:
+    """Prepara la respuesta en streaming (SSE) de un mensaje.
+
+    El contexto se carga antes de devolver el generador, así los errores
+    (p. ej. 404) se devuelven como respuesta HTTP normal. Los mensajes se
+    guardan al terminar el stream, también si el cliente se desconecta.
+    Tras 'done' el stream sigue abierto hasta que termina el título en segundo plano.
+    """
+    conversation, history, extra_context = await build_chat_context(chat_id, user, db, user_db, question=question, mode=mode)
+    # Se lee ahora: durante el stream la sesión de la petición ya está cerrada
+    current_title = conversation.title
+
+    async def events():
+        chunks = []
+        completed = False
         try:
-            generated_title = await agent_temp.chat(prompt, [])
-            if generated_title and "NO_TITULO" not in generated_title.upper():
-                conversation.title = generated_title.strip()
-                db.commit()
-                db.refresh(conversation)
-                title_changed = True
+            async for token in agent.chat_stream(question, history, mode=mode, extra_context=extra_context):
+                chunks.append(token)
+                yield format_sse("token", {"content": token})
+            completed = True
         except Exception as e:
-            logger.error(f"Error generando título automático: {e}")
+            logger.error(f"Error streaming the answer: {e}")
+            error = {"detail": "Error creating the answer"}
+            if isinstance(e, OpenRouterError) and e.retry_after:
+                error["retry_after"] = e.retry_after
+            yield format_sse("error", error)
+        finally:
+            answer = "".join(chunks)
+            if answer:
+                # Si el cliente se desconecta la tarea del stream se cancela;
+                # el guardado va en su propia tarea para que termine igualmente
+                save = asyncio.ensure_future(persist_turn(chat_id, question, answer))
+                _background_tasks.add(save)
+                save.add_done_callback(_background_tasks.discard)
+                try:
+                    await asyncio.shield(save)
+                except asyncio.CancelledError:
+                    logger.info(f"Stream for conversation {chat_id} cancelled, saving in background")
+                    raise
+            if not completed:
+                logger.info(f"Stream for conversation {chat_id} ended early ({len(answer)} chars)")
+
+        title_job = schedule_title_generation(chat_id, current_title, history, question) if completed else None
+        yield format_sse("done", {"title_pending": title_job is not None})
+
+        # La respuesta ya está completa; el título llega como evento extra si se genera
+        if title_job is not None:
+            title = await asyncio.shield(title_job)
+            if title:
+                yield format_sse("title", {"title": title})
+
+    return events()
+
+
+# === Historial ===
+
+HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", 50))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", 500))
+HISTORY_STREAM_BATCH = int(os.getenv("CHAT_HISTORY_STREAM_BATCH", 500))
+
+HISTORY_COLUMNS = (Message.id, Message.role, Message.content, Message.created_at)
+
+def format_history_row(row) -> dict:
+    message_id, role, content, created_at = row
+    return {"id": message_id, "role": role, "content": content, "timestamp": created_at}
+
+async def get_history(chat_id: int, db: AsyncSession):
+    result = await db.execute(
+        select(*HISTORY_COLUMNS)
+        .where(Message.conversation_id == chat_id)
+        .order_by(Message.created_at, Message.id)
+    )
+    return [format_history_row(row) for row in result.all()]
 
-    return {"answer": answer, "title_changed": title_changed}
+async def resolve_history_anchor(chat_id: int, message_id: int, db: AsyncSession):
+    """Devuelve (created_at, id) del mensaje usado como cursor; 400 si no es de la conversación."""
+    anchor = (await db.execute(
+        select(Message.created_at, Message.id)
+        .where(Message.id == message_id, Message.conversation_id == chat_id)
+    )).first()
+    if anchor is None:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return tuple(anchor)
 
+def history_page_query(chat_id: int, before=None, after=None, limit: Optional[int] = None):
+    """Consulta keyset sobre (created_at, id), siempre en orden cronológico.
 
-def get_history(chat_id: int, db: Session):
-    messages = db.query(Message).filter(Message.conversation_id == chat_id).order_by(Message.created_at).all()
-    return [{"role": m.role, "content": m.content, "timestamp": m.created_at} for m in messages]
+    `before`/`after` son el (created_at, id) del mensaje cursor. Sin `after`,
+    se toman los `limit` mensajes más recientes anteriores al cursor.
+    """
+    query = select(*HISTORY_COLUMNS).where(Message.conversation_id == chat_id)
+    if after is not None:
+        query = query.where(tuple_(Message.created_at, Message.id) > tuple_(*after))
+        query = query.order_by(Message.created_at, Message.id)
+        return query.limit(limit) if limit else query
 
-def delete_chat(chat_id: int, db: Session):
-    conversation = db.query(Conversation).filter(Conversation.id == chat_id).first()
+    if before is not None:
+        query = query.where(tuple_(Message.created_at, Message.id) < tuple_(*before))
+    if not limit:
+        return query.order_by(Message.created_at, Message.id)
+
+    # Los N más recientes (descendente, aprovecha el índice) y se reordenan
+    latest = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).subquery()
+    return select(*latest.c).order_by(latest.c.created_at, latest.c.id)
+
+async def get_history_page(
+    chat_id: int,
+    db: AsyncSession,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE
+) -> dict:
+    """Página del historial por cursor de id de mensaje.
+
+    Con `before` (o sin cursor) devuelve los mensajes anteriores más recientes;
+    con `after`, los siguientes. `has_more` indica si quedan más en esa dirección.
+    """
+    before_key = await resolve_history_anchor(chat_id, before, db) if before is not None else None
+    after_key = await resolve_history_anchor(chat_id, after, db) if after is not None else None
+
+    # Se pide uno de más para saber si hay otra página
+    result = await db.execute(history_page_query(chat_id, before_key, after_key, limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    if has_more:
+        rows = rows[:limit] if after is not None else rows[1:]
+
+    return {"messages": [format_history_row(row) for row in rows], "has_more": has_more}
+
+async def open_history_stream(
+    chat_id: int,
+    db: AsyncSession,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None
+) -> AsyncIterator[str]:
+    """Prepara un stream NDJSON del historial, una línea por mensaje.
+
+    Los cursores se validan antes de empezar; las filas se leen con un cursor
+    del servidor en una sesión propia, ya que la de la petición se cierra.
+    """
+    before_key = await resolve_history_anchor(chat_id, before, db) if before is not None else None
+    after_key = await resolve_history_anchor(chat_id, after, db) if after is not None else None
+    query = history_page_query(chat_id, before_key, after_key, limit)
+
+    async def lines():
+        async with session_factory() as stream_db:
+            result = await stream_db.stream(query.execution_options(yield_per=HISTORY_STREAM_BATCH))
+            async for partition in result.partitions():
+                yield "".join(
+                    json.dumps(format_history_row(row), default=datetime.isoformat, ensure_ascii=False) + "\n"
+                    for row in partition
+                )
+
+    return lines()
+
+async def delete_chat(chat_id: int, db: AsyncSession):
+    conversation = await db.get(Conversation, chat_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    db.query(Message).filter(Message.conversation_id == chat_id).delete()
-    db.delete(conversation)
-    db.commit()
+    # Borrado explícito: la cascada del ORM cargaría los mensajes de forma implícita
+    await db.execute(delete(Message).where(Message.conversation_id == chat_id))
+    await db.execute(delete(Conversation).where(Conversation.id == chat_id))
+    await db.commit()
     return {"message": "Conversation deleted"}
 
-def get_conversations(user_id: str, db: Session):
-    conversations = db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.created_at.desc()).all()
-    return [{"id": c.id, "created_at": c.created_at, "title": getattr(c, "title", "Sin título")} for c in conversations]
+async def get_conversations(user_id: int, db: AsyncSession):
+    result = await db.execute(
+        select(Conversation.id, Conversation.created_at, Conversation.title)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc())
+    )
+    return [
+        {"id": id_, "created_at": created_at, "title": title, "title_pending": is_title_pending(id_)}
+        for id_, created_at, title in result.all()
+    ]
 
-def rename_conversation(chat_id: int, new_title: str, db: Session):
-    conversation = db.query(Conversation).filter(Conversation.id == chat_id).first()
+async def rename_conversation(chat_id: int, new_title: str, db: AsyncSession):
+    conversation = await db.get(Conversation, chat_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     conversation.title = new_title
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
     return {"message": "Title updated"}
@@ -1,42 +1,119 @@
+import asyncio
 import base64
+import json
 import logging
 import os
 from datetime import datetime, timedelta
+from contextlib import nullcontext
+from functools import partial
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import re
-import io
-import sys
-from typing import Optional
+import weakref
 
-from typing import Optional
-import requests
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import inspect, update
 from sqlalchemy.orm import Session
 
+from src.config.db import SessionLocal
+from src.controllers.auth_controller import load_user
 from src.models.auth_model import User
+from src.services.principal_cache import Principal
 from src.services.chatIA_service import Agent
+from src.services.openrouter_resilience import to_http_exception
+from src.services.spotify_client import spotify_client, SPOTIFY_TOKEN_URL
+from src.services.track_cache import TrackURICache, normalize_query, track_uri_cache
+from src.services.playlist_cache import playlist_tracks_cache
+from src.utils.swr_cache import SWRCache
 
 CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
+# Segundos antes de caducar en los que el token se refresca en segundo plano
+SPOTIFY_TOKEN_REFRESH_MARGIN = float(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", 300))
+
+# Búsquedas simultáneas y timeout (s) por búsqueda al resolver canciones generadas por IA
+SEARCH_CONCURRENCY = int(os.getenv("SPOTIFY_SEARCH_CONCURRENCY", 8))
+SEARCH_TIMEOUT = float(os.getenv("SPOTIFY_SEARCH_TIMEOUT", 5))
+
+# Paginación y paralelismo al descargar playlists
+PLAYLISTS_PAGE_SIZE = 50
+PLAYLIST_TRACKS_PAGE_SIZE = 100
+PLAYLIST_TRACK_FIELDS = "items(track(name,uri,artists(name))),total"
+PLAYLIST_FETCH_CONCURRENCY = int(os.getenv("SPOTIFY_PLAYLIST_CONCURRENCY", 8))
+
+# Caché por usuario de get_user_full_top_info (segundos)
+TOP_INFO_CACHE_TTL = float(os.getenv("TOP_INFO_CACHE_TTL", 6 * 3600))
+TOP_INFO_CACHE_STALE_TTL = float(os.getenv("TOP_INFO_CACHE_STALE_TTL", 24 * 3600))
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+top_info_cache = SWRCache(ttl=TOP_INFO_CACHE_TTL, stale_ttl=TOP_INFO_CACHE_STALE_TTL, name="TOP")
+
+# Agent para generar playlists; comparte el pool HTTP de OpenRouter con el chat.
+# No usa la caché de completions: el prompt lleva los tops del usuario, así que
+# dos usuarios nunca comparten clave
+playlist_agent = Agent()
+
 class RemoveTracksRequest(BaseModel):
     tracks: List[dict]
     snapshot_id: Optional[str] = None
 
 # === Token Management ===
-def refresh_spotify_token(user: User, db: Session) -> str:
-    """Refresca el token de acceso de Spotify para el usuario dado."""
+
+# Un lock por usuario: las peticiones concurrentes del proceso esperan al primer
+# refresh en vez de repetirlo. Se liberan solos cuando nadie los usa
+_refresh_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+_refresh_jobs: Dict[int, asyncio.Task] = {}
+
+
+def token_expires_within(user: User, seconds: float) -> bool:
+    expires_at = user.spotify_token_expires_at
+    return not expires_at or expires_at <= datetime.utcnow() + timedelta(seconds=seconds)
+
+
+def save_refreshed_token(user: User, db: Session, seen_expires_at: Optional[datetime], values: dict) -> bool:
+    """Guarda el token refrescado si nadie lo cambió desde `seen_expires_at`.
+
+    Devuelve False si otro proceso ganó la carrera. En ambos casos `user` queda
+    recargado (el commit lo expira), así que leerlo después no vuelve a la BD
+    desde el event loop. Hace E/S de BD: llamar desde un hilo.
+    """
+    unchanged = (
+        User.spotify_token_expires_at.is_(None) if seen_expires_at is None
+        else User.spotify_token_expires_at == seen_expires_at
+    )
+    try:
+        result = db.execute(
+            update(User)
+            .where(User.id == user.id, unchanged)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        db.refresh(user)
+        return result.rowcount > 0
+    except Exception:
+        db.rollback()
+        raise
+
+
+async def refresh_spotify_token(user: User, db: Session) -> str:
+    """Refresca el token de acceso de Spotify para el usuario dado.
+
+    El guardado es un compare-and-set sobre `spotify_token_expires_at`: si otro
+    worker ya lo refrescó mientras tanto, se descarta el token obtenido y se
+    devuelve el que está en la BD.
+    """
     logger.info(f"[TOKEN] Refrescando token para {user.email}")
 
     if not user.spotify_refresh_token:
         logger.warning(f"[TOKEN] Usuario {user.email} sin refresh token.")
         raise HTTPException(status_code=401, detail="Usuario no autorizó Spotify correctamente.")
 
-    token_url = "https://accounts.spotify.com/api/token"
+    seen_expires_at = user.spotify_token_expires_at
     auth_str = f"{CLIENT_ID}:{CLIENT_SECRET}"
     b64_auth = base64.b64encode(auth_str.encode()).decode()
 
@@ -51,19 +128,28 @@ def refresh_spotify_token(user: User, db: Session) -> str:
     }
 
     try:
-        response = requests.post(token_url, headers=headers, data=data)
+        response = await spotify_client.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
 
         if response.status_code != 200:
             logger.error(f"[TOKEN] Error al refrescar: {response.status_code} {response.text}")
             raise HTTPException(status_code=502, detail="Error al refrescar el token de Spotify")
 
         token_info = response.json()
-        user.spotify_access_token = token_info.get("access_token")
-        user.spotify_token_expires_at = datetime.utcnow() + timedelta(seconds=token_info.get("expires_in", 3600))
+        values = {
+            "spotify_access_token": token_info.get("access_token"),
+            "spotify_token_expires_at": datetime.utcnow() + timedelta(seconds=token_info.get("expires_in", 3600)),
+        }
+        # Spotify puede rotar el refresh token
+        if token_info.get("refresh_token"):
+            values["spotify_refresh_token"] = token_info["refresh_token"]
+
+        # La sesión es síncrona: el guardado va al threadpool para no bloquear el event loop
+        if not await run_in_threadpool(save_refreshed_token, user, db, seen_expires_at, values):
+            logger.info(f"[TOKEN] Token ya refrescado por otro proceso para {user.email}")
+            return user.spotify_access_token
 
-        db.commit()
         logger.info(f"[TOKEN] Token actualizado correctamente para {user.email}")
-        return user.spotify_access_token
+        return values["spotify_access_token"]
 
     except HTTPException:
         raise
@@ -72,84 +158,262 @@ def refresh_spotify_token(user: User, db: Session) -> str:
         raise HTTPException(status_code=500, detail="Error interno al refrescar token de Spotify")
 
 
-def get_valid_spotify_token(user: User, db: Session) -> str:
-    """Obtiene un token de acceso válido, refrescándolo si es necesario."""
-    logger.info(f"[TOKEN] Verificando token válido para {user.email}")
+async def refresh_spotify_token_once(user: User, db: Session) -> str:
+    """Refresca el token salvo que otra petición del proceso acabe de hacerlo."""
+    lock = _refresh_locks.setdefault(user.id, asyncio.Lock())
+    async with lock:
+        if inspect(user).persistent:
+            # Quien tenía el lock pudo guardar un token nuevo: se relee la fila (en el threadpool)
+            await run_in_threadpool(
+                db.refresh, user, ["spotify_access_token", "spotify_refresh_token", "spotify_token_expires_at"]
+            )
+        if not token_expires_within(user, SPOTIFY_TOKEN_REFRESH_MARGIN):
+            return user.spotify_access_token
+        return await refresh_spotify_token(user, db)
+
+
+async def refresh_token_in_background(user_id: int):
+    """Refresco anticipado con su propia sesión: la de la petición se cierra al responder.
+
+    La sesión es síncrona, así que sus accesos a la BD van al threadpool.
+    """
+    db = SessionLocal()
+    try:
+        user = await run_in_threadpool(db.get, User, user_id)
+        if user is not None and user.spotify_access_token:
+            await refresh_spotify_token_once(user, db)
+    except Exception as e:
+        logger.warning(f"[TOKEN] Error en el refresco anticipado del usuario {user_id}: {e}")
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def schedule_token_refresh(user_id: int):
+    """Lanza el refresco anticipado si no hay ya uno en curso para el usuario."""
+    job = _refresh_jobs.get(user_id)
+    if job is not None and not job.done():
+        return
+
+    task = asyncio.ensure_future(refresh_token_in_background(user_id))
+    _refresh_jobs[user_id] = task
+
+    def forget(done: asyncio.Task):
+        if _refresh_jobs.get(user_id) is done:
+            del _refresh_jobs[user_id]
+
+    task.add_done_callback(forget)
+
+
+async def get_valid_spotify_token(user: Principal, db: Session) -> str:
+    """Obtiene un token de acceso válido, refrescándolo si es necesario.
+
+    `user` puede ser el principal de `get_current_user`: la fila completa, con
+    los tokens, se carga aquí. Si el token caduca en menos de
+    SPOTIFY_TOKEN_REFRESH_MARGIN se devuelve el actual y se refresca en segundo
+    plano; solo un token ya caducado hace esperar a la petición.
+    """
+    # La fila se lee con la sesión síncrona: en el threadpool, no en el event loop
+    user = await run_in_threadpool(load_user, user, db)
 
     if not user.spotify_access_token:
         logger.warning(f"[TOKEN] Usuario {user.email} sin token de acceso.")
         raise HTTPException(status_code=401, detail="El usuario no está vinculado con Spotify")
 
-    if not user.spotify_token_expires_at or user.spotify_token_expires_at <= datetime.utcnow():
+    if token_expires_within(user, 0):
         logger.info(f"[TOKEN] Token expirado para {user.email}, refrescando...")
-        return refresh_spotify_token(user, db)
+        return await refresh_spotify_token_once(user, db)
+
+    if token_expires_within(user, SPOTIFY_TOKEN_REFRESH_MARGIN):
+        logger.info(f"[TOKEN] Token de {user.email} próximo a caducar, refrescando en segundo plano")
+        schedule_token_refresh(user.id)
 
-    logger.info(f"[TOKEN] Token aún válido para {user.email}")
     return user.spotify_access_token
 
 # === Playlist Retrieval ===
 
-def get_all_user_playlists(user: User, db: Session):
-    """Obtiene todas las playlists del usuario autenticado."""
+async def fetch_playlists_page(
+    access_token: str,
+    offset: int = 0,
+    limit: int = PLAYLISTS_PAGE_SIZE,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> dict:
+    """Obtiene una página de /me/playlists (solo metadatos)."""
+    async with semaphore or nullcontext():
+        response = await spotify_client.get(
+            "/me/playlists",
+            access_token=access_token,
+            params={"limit": limit, "offset": offset}
+        )
+
+    if response.status_code == 401:
+        logger.warning("[PLAYLISTS] Token inválido tras refresh")
+        raise HTTPException(status_code=401, detail="Token inválido incluso después de refrescar")
+
+    if response.status_code != 200:
+        logger.error(f"[PLAYLISTS] Error al obtener: {response.status_code}, {response.text}")
+        raise HTTPException(status_code=response.status_code, detail="Error al obtener playlists")
+
+    return response.json()
+
+
+async def fetch_all_playlist_items(access_token: str, semaphore: Optional[asyncio.Semaphore] = None) -> List[dict]:
+    """Obtiene los metadatos de todas las playlists, pidiendo en paralelo las páginas restantes.
+
+    Como mucho PLAYLIST_FETCH_CONCURRENCY páginas a la vez (o las que permita `semaphore`).
+    """
+    semaphore = semaphore or asyncio.Semaphore(PLAYLIST_FETCH_CONCURRENCY)
+    first = await fetch_playlists_page(access_token, 0)
+    items = list(first.get("items", []))
+    total = first.get("total")
+
+    if first.get("next") and total:
+        pages = await asyncio.gather(*(
+            fetch_playlists_page(access_token, offset, semaphore=semaphore)
+            for offset in range(PLAYLISTS_PAGE_SIZE, total, PLAYLISTS_PAGE_SIZE)
+        ))
+        for page in pages:
+            items.extend(page.get("items", []))
+    else:
+        # Sin 'total' se siguen los enlaces 'next' uno a uno
+        page, offset = first, 0
+        while page.get("next") and page.get("items"):
+            offset += PLAYLISTS_PAGE_SIZE
+            page = await fetch_playlists_page(access_token, offset)
+            items.extend(page.get("items", []))
+
+    return items
+
+
+def parse_track_items(track_items: List[dict]) -> List[dict]:
+    """Convierte items de Spotify en {name, artists, uri}, ignorando pistas vacías."""
+    tracks = []
+    for track_item in track_items:
+        track = track_item.get("track") or {}
+        if not track:
+            continue
+        artists = [a["name"] for a in track.get("artists", [])]
+        tracks.append({"name": track.get("name"), "artists": artists, "uri": track.get("uri")})
+    return tracks
+
+
+async def fetch_playlist_tracks_page(
+    playlist_id: str,
+    access_token: str,
+    offset: int = 0,
+    limit: int = PLAYLIST_TRACKS_PAGE_SIZE,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> dict:
+    """Obtiene una página de canciones de una playlist con proyección de campos."""
+    async with semaphore or nullcontext():
+        response = await spotify_client.get(
+            f"/playlists/{playlist_id}/tracks",
+            access_token=access_token,
+            params={"fields": PLAYLIST_TRACK_FIELDS, "limit": limit, "offset": offset}
+        )
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Error al obtener canciones de la playlist")
+    return response.json()
+
+
+async def fetch_playlist_tracks(
+    playlist_id: str,
+    access_token: str,
+    total: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> List[dict]:
+    """Obtiene todas las canciones de una playlist, pidiendo sus páginas en paralelo.
+
+    Si se conoce `total` (viene en /me/playlists) todas las páginas se piden a la
+    vez; si no, se lee de la primera página.
+    """
+    semaphore = semaphore or asyncio.Semaphore(PLAYLIST_FETCH_CONCURRENCY)
+    pages = []
+
+    if total is None:
+        first = await fetch_playlist_tracks_page(playlist_id, access_token, 0, semaphore=semaphore)
+        pages.append(first)
+        total = first.get("total") or 0
+        offsets = range(PLAYLIST_TRACKS_PAGE_SIZE, total, PLAYLIST_TRACKS_PAGE_SIZE)
+    else:
+        offsets = range(0, total, PLAYLIST_TRACKS_PAGE_SIZE)
+
+    pages.extend(await asyncio.gather(*(
+        fetch_playlist_tracks_page(playlist_id, access_token, offset, semaphore=semaphore)
+        for offset in offsets
+    )))
+
+    tracks = []
+    for page in pages:
+        tracks.extend(parse_track_items(page.get("items", [])))
+    return tracks
+
+
+def format_playlist(item: dict, tracks: Optional[List[dict]] = None) -> dict:
+    """Formato de playlist devuelto al frontend."""
+    playlist = {
+        "name": item["name"],
+        "id": item["id"],
+        "description": item.get("description"),
+        "image": item["images"][0]["url"] if item.get("images") else None,
+    }
+    if tracks is not None:
+        playlist["tracks"] = tracks
+    return playlist
+
+
+def format_playlist_metadata(item: dict) -> dict:
+    """Playlist sin canciones, con el número total y el snapshot para cargarlas bajo demanda."""
+    playlist = format_playlist(item)
+    playlist["tracks_total"] = (item.get("tracks") or {}).get("total", 0)
+    playlist["snapshot_id"] = item.get("snapshot_id")
+    return playlist
+
+
+def encode_cursor(offset: int) -> str:
+    """Cursor opaco para la paginación a partir de un offset de Spotify."""
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Devuelve el offset codificado en el cursor (0 si no hay cursor)."""
+    if not cursor:
+        return 0
     try:
-        access_token = get_valid_spotify_token(user, db)
-        headers = {"Authorization": f"Bearer {access_token}"}
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, offset = base64.urlsafe_b64decode(padded.encode()).decode().split(":", 1)
+        if prefix != "o" or int(offset) < 0:
+            raise ValueError(cursor)
+        return int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
-        playlists = []
-        limit, offset = 50, 0
 
-        while True:
-            url = f"https://api.spotify.com/v1/me/playlists?limit={limit}&offset={offset}"
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 401:
-                logger.warning(f"[PLAYLISTS] Token inválido tras refresh para {user.email}")
-                raise HTTPException(status_code=401, detail="Token inválido incluso después de refrescar")
-
-            if response.status_code != 200:
-                logger.error(f"[PLAYLISTS] Error al obtener: {response.status_code}, {response.text}")
-                raise HTTPException(status_code=response.status_code, detail="Error al obtener playlists")
-
-            data = response.json()
-            items = data.get("items", [])
-
-            if not items:
-                break
-
-            for item in items:
-                playlist_id = item["id"]
-                playlist_name = item["name"]
-                playlist_description = item["description"]
-                image_url = item["images"][0]["url"] if item.get("images") else None
-
-                # Obtener tracks
-                tracks_url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
-                tracks_response = requests.get(tracks_url, headers=headers)
-
-                tracks = []
-                if tracks_response.status_code == 200:
-                    for track_item in tracks_response.json().get("items", []):
-                        track = track_item.get("track", {})
-                        if not track:
-                            continue
-                        track_uri = track.get("uri")
-                        track_name = track.get("name")
-                        artists = [a["name"] for a in track.get("artists", [])]
-                        tracks.append({"name": track_name, "artists": artists, "uri":track_uri})
-                else:
-                    logger.warning(f"[PLAYLISTS] Tracks no disponibles para {playlist_name}")
-
-                playlists.append({
-                    "name": playlist_name,
-                    "id": playlist_id,
-                    "description": playlist_description,
-                    "image": image_url,
-                    "tracks": tracks
-                })
-
-            offset += limit
-            if not data.get("next"):
-                break
+async def get_all_user_playlists(user: Principal, db: Session):
+    """Obtiene todas las playlists del usuario autenticado con sus canciones completas."""
+    try:
+        access_token = await get_valid_spotify_token(user, db)
+        # Un único semáforo limita las peticiones de páginas de playlists y de canciones
+        semaphore = asyncio.Semaphore(PLAYLIST_FETCH_CONCURRENCY)
+        items = await fetch_all_playlist_items(access_token, semaphore=semaphore)
+
+        async def load_tracks(item: dict) -> List[dict]:
+            # Si el snapshot no ha cambiado, las canciones cacheadas siguen siendo válidas
+            snapshot_id = item.get("snapshot_id")
+            cached = playlist_tracks_cache.get(item["id"], snapshot_id)
+            if cached is not None:
+                return cached
+            try:
+                total = (item.get("tracks") or {}).get("total")
+                tracks = await fetch_playlist_tracks(item["id"], access_token, total=total, semaphore=semaphore)
+            except Exception as e:
+                logger.warning(f"[PLAYLISTS] Tracks no disponibles para {item.get('name')}: {e}")
+                return []
+            playlist_tracks_cache.set(item["id"], snapshot_id, tracks)
+            return tracks
+
+        all_tracks = await asyncio.gather(*(load_tracks(item) for item in items))
+        playlists = [format_playlist(item, tracks) for item, tracks in zip(items, all_tracks)]
 
         logger.info(f"[PLAYLISTS] Se obtuvieron {len(playlists)} playlists de {user.email}")
         return {"playlists": playlists}
@@ -161,28 +425,99 @@ def get_all_user_playlists(user: User, db: Session):
         raise HTTPException(status_code=500, detail="Error interno al obtener playlists")
 
 
+async def get_user_playlists_page(user: Principal, db: Session, limit: int = PLAYLISTS_PAGE_SIZE, cursor: Optional[str] = None):
+    """Devuelve una página de playlists (solo metadatos) con una única petición a Spotify."""
+    offset = decode_cursor(cursor)
+    access_token = await get_valid_spotify_token(user, db)
+    data = await fetch_playlists_page(access_token, offset, limit)
+
+    items = data.get("items", [])
+    next_cursor = encode_cursor(offset + len(items)) if data.get("next") and items else None
+
+    logger.info(f"[PLAYLISTS] Página de {len(items)} playlists (offset {offset}) para {user.email}")
+    return {
+        "playlists": [format_playlist_metadata(item) for item in items],
+        "total": data.get("total"),
+        "next_cursor": next_cursor
+    }
+
+
+def _tracks_page_result(page: dict, offset: int) -> dict:
+    items = page.get("items", [])
+    total = page.get("total") or 0
+    next_offset = offset + len(items)
+    return {
+        "tracks": parse_track_items(items),
+        "total": total,
+        "next_cursor": encode_cursor(next_offset) if items and next_offset < total else None
+    }
+
+
+async def get_playlist_tracks_page(
+    playlist_id: str,
+    user: Principal,
+    db: Session,
+    limit: int = PLAYLIST_TRACKS_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    """Devuelve una página de canciones de una playlist."""
+    offset = decode_cursor(cursor)
+    access_token = await get_valid_spotify_token(user, db)
+    page = await fetch_playlist_tracks_page(playlist_id, access_token, offset, limit)
+    return _tracks_page_result(page, offset)
+
+
+async def open_playlist_tracks_stream(
+    playlist_id: str,
+    user: Principal,
+    db: Session,
+    limit: int = PLAYLIST_TRACKS_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Prepara un stream NDJSON con una línea por página de canciones.
+
+    El token se resuelve antes de empezar, ya que la sesión de BD no sigue
+    abierta mientras se envía la respuesta.
+    """
+    offset = decode_cursor(cursor)
+    access_token = await get_valid_spotify_token(user, db)
+
+    async def pages():
+        current = offset
+        while True:
+            try:
+                page = await fetch_playlist_tracks_page(playlist_id, access_token, current, limit)
+            except HTTPException as e:
+                logger.warning(f"[PLAYLISTS] Stream de {playlist_id} interrumpido: {e.status_code}")
+                yield json.dumps({"error": e.detail, "status_code": e.status_code}) + "\n"
+                return
+
+            result = _tracks_page_result(page, current)
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+            if not result["next_cursor"]:
+                return
+            current += len(page.get("items", []))
+
+    return pages()
+
+
 # === Playlist Update ===
 
-def update_playlist(
+async def update_playlist(
     playlist_id: str,
     title: Optional[str],
     description: Optional[str],
-    user: User,
+    user: Principal,
     db: Session
 ):
     """Actualiza el nombre, la descripción o la imagen de una playlist del usuario."""
     logger.info(f"[UPDATE] Actualizando playlist {playlist_id} de {user.email}")
-    access_token = get_valid_spotify_token(user, db)
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    access_token = await get_valid_spotify_token(user, db)
 
     # Verificar propiedad de la playlist
-    playlist_response = requests.get(
-        f"https://api.spotify.com/v1/playlists/{playlist_id}",
-        headers=headers
+    playlist_response = await spotify_client.get(
+        f"/playlists/{playlist_id}",
+        access_token=access_token
     )
 
     if playlist_response.status_code != 200:
@@ -204,32 +539,103 @@ def update_playlist(
         payload["description"] = description
 
     if payload:
-        response = requests.put(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}",
-            headers=headers,
+        response = await spotify_client.put(
+            f"/playlists/{playlist_id}",
+            access_token=access_token,
             json=payload
         )
         if response.status_code != 200:
             logger.error(f"[UPDATE] Error al actualizar nombre/descr.: {response.status_code}, {response.text}")
             raise HTTPException(status_code=response.status_code, detail="Error al actualizar título o descripción")      
+        playlist_tracks_cache.invalidate(playlist_id)
 
     logger.info(f"[UPDATE] Playlist {playlist_id} actualizada exitosamente")
     return {"message": "Playlist actualizada correctamente"}
 
+# === Resolución de canciones ===
+
+async def search_track_uri(titulo: str, artista: str, access_token: str) -> Optional[str]:
+    """Busca una canción en Spotify y devuelve su URI, o None si no se encuentra.
+
+    Lanza HTTPException si Spotify responde con error, para no cachear el fallo como negativo.
+    """
+    query = f"track:{titulo} artist:{artista}"
+    search_resp = await spotify_client.get(
+        "/search",
+        access_token=access_token,
+        params={"q": query, "type": "track", "limit": 1}
+    )
+
+    if search_resp.status_code != 200:
+        raise HTTPException(status_code=search_resp.status_code, detail="Error en búsqueda de Spotify")
+
+    items = search_resp.json().get("tracks", {}).get("items", [])
+    if not items:
+        logger.info(f"[IA] No encontrada: '{titulo}' de '{artista}'")
+        return None
+    return items[0]["uri"]
+
+
+async def resolve_track_uris(
+    canciones: List[tuple],
+    access_token: str,
+    db: Optional[Session] = None,
+    concurrency: int = SEARCH_CONCURRENCY,
+    timeout: float = SEARCH_TIMEOUT,
+    cache: Optional[TrackURICache] = track_uri_cache
+) -> List[str]:
+    """Resuelve pares (título, artista) a URIs en paralelo, conservando el orden original.
+
+    Primero consulta la caché de búsquedas; solo las claves desconocidas van a
+    Spotify. Las búsquedas que fallan o superan el timeout se descartan sin
+    afectar al resto y no se cachean.
+    """
+    keys = [normalize_query(titulo, artista) for titulo, artista in canciones]
+    # La caché lee y escribe con la sesión síncrona: en el threadpool, fuera del event loop
+    resolved = await run_in_threadpool(cache.get_many, keys, db) if cache is not None else {}
+
+    # Una sola búsqueda por clave pendiente, aunque la canción aparezca repetida
+    pending = {}
+    for key, (titulo, artista) in zip(keys, canciones):
+        if key not in resolved:
+            pending.setdefault(key, (titulo, artista))
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def resolve(key: str, titulo: str, artista: str):
+        async with semaphore:
+            try:
+                uri = await asyncio.wait_for(search_track_uri(titulo, artista, access_token), timeout)
+                return key, True, uri
+            except asyncio.TimeoutError:
+                logger.warning(f"[IA] Timeout buscando '{titulo}' - '{artista}'")
+            except Exception as e:
+                logger.warning(f"[IA] Fallo buscando '{titulo}' - '{artista}': {e}")
+            return key, False, None
+
+    results = await asyncio.gather(*(resolve(key, *song) for key, song in pending.items()))
+    searched = {key: uri for key, ok, uri in results if ok}
+
+    if cache is not None:
+        await run_in_threadpool(cache.set_many, searched, db)
+        logger.info(f"[IA] Caché de búsquedas: {len(canciones) - len(pending)} aciertos, {len(pending)} búsquedas")
+    resolved.update(searched)
+
+    return [resolved[key] for key in keys if resolved.get(key)]
+
 # === Playlist Autogenerada por IA ===
 
-async def generate_playlist_auto(prompt: str, user: User, db: Session):
+async def generate_playlist_auto(prompt: str, user: Principal, db: Session):
     """Genera automáticamente una playlist basada en un tema usando IA."""
     logger.info(f"[IA] Generando playlist para: {prompt}")
-    access_token = get_valid_spotify_token(user, db)
-    headers = {"Authorization": f"Bearer {access_token}"}
+    access_token = await get_valid_spotify_token(user, db)
 
     system_message = (
         "Eres un asistente experto en música. Devuélveme un título para una playlist, una descripción clara para la playlist y una lista de 20 canciones relacionadas con el siguiente tema. "
         "Formato:\nTítulo: <aquí el título>\nDescripcion: <aqui la descripcion>\nCanciones:\nCada canción en una línea, 'Título - Artista'. Sin otra explicación."
     )
 
-    top_info = get_user_full_top_info(user, db)
+    top_info = await get_user_full_top_info(user, db)
 
     def format_top_info(title: str, data: dict) -> str:
         return (
@@ -246,13 +652,12 @@ async def generate_playlist_auto(prompt: str, user: User, db: Session):
 
     user_message = f"{system_message}\nTema: {prompt}"
 
-    agent = Agent()
     try:
-        response_text = await agent.chat(user_message, extra_context=extra_context)
+        response_text = await playlist_agent.chat(user_message, extra_context=extra_context)
         logger.info(f"[IA] Respuesta del modelo: {len(response_text)} caracteres")
     except Exception as e:
         logger.error(f"[IA] Error del modelo: {e}")
-        raise HTTPException(status_code=500, detail="Error al generar canciones con el modelo")
+        raise to_http_exception(e, "Error al generar canciones con el modelo")
 
     # Parsear respuesta
     title = None
@@ -276,24 +681,11 @@ async def generate_playlist_auto(prompt: str, user: User, db: Session):
         raise HTTPException(status_code=500, detail="Error al procesar la respuesta del modelo")
 
     # Buscar canciones en Spotify
-    track_uris = []
-    for titulo, artista in canciones:
-        query = f"track:{titulo} artist:{artista}"
-        search_url = f"https://api.spotify.com/v1/search?q={requests.utils.quote(query)}&type=track&limit=1"
-        search_resp = requests.get(search_url, headers=headers)
-
-        if search_resp.status_code == 200:
-            items = search_resp.json().get("tracks", {}).get("items", [])
-            if items:
-                track_uris.append(items[0]["uri"])
-            else:
-                logger.info(f"[IA] No encontrada: '{titulo}' de '{artista}'")
-        else:
-            logger.warning(f"[IA] Error en búsqueda de '{titulo}' - '{artista}'")
+    track_uris = await resolve_track_uris(canciones, access_token, db=db)
+    logger.info(f"[IA] Resueltas {len(track_uris)} de {len(canciones)} canciones")
 
     # Crear playlist
-    create_url = f"https://api.spotify.com/v1/users/{user.spotify_user_id}/playlists"
-    create_resp = requests.post(create_url, headers=headers, json={
+    create_resp = await spotify_client.post(f"/users/{user.spotify_user_id}/playlists", access_token=access_token, json={
         "name": title,
         "description": description
     })
@@ -309,21 +701,18 @@ async def generate_playlist_auto(prompt: str, user: User, db: Session):
     chunk_size = 100
     for i in range(0, len(track_uris), chunk_size):
         uris_chunk = track_uris[i:i + chunk_size]
-        add_resp = requests.post(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks", headers=headers, json={"uris": uris_chunk})
+        add_resp = await spotify_client.post(f"/playlists/{playlist_id}/tracks", access_token=access_token, json={"uris": uris_chunk})
 
         if add_resp.status_code != 201:
             logger.error(f"[IA] Error al agregar canciones: {add_resp.status_code}, {add_resp.text}")
             raise HTTPException(status_code=add_resp.status_code, detail="Error al agregar canciones a la playlist")
 
+    playlist_tracks_cache.invalidate(playlist_id)
     logger.info(f"[IA] Playlist generada exitosamente con {len(track_uris)} canciones")
     return {"message": "Playlist creada exitosamente", "playlist_id": playlist_id, "title": title}
 
-def remove_tracks_from_playlist(playlist_id: str, data: RemoveTracksRequest, user: User):
-    access_token = user.spotify_access_token
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+async def remove_tracks_from_playlist(playlist_id: str, data: RemoveTracksRequest, user: Principal, db: Session):
+    access_token = await get_valid_spotify_token(user, db)
 
     body = {
         "tracks": [track.dict() for track in data.tracks]
@@ -331,29 +720,29 @@ def remove_tracks_from_playlist(playlist_id: str, data: RemoveTracksRequest, use
     if data.snapshot_id:
         body["snapshot_id"] = data.snapshot_id
 
-    response = requests.delete(
-        f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-        headers=headers,
+    response = await spotify_client.delete(
+        f"/playlists/{playlist_id}/tracks",
+        access_token=access_token,
         json=body
     )
 
     if response.status_code == 200:
-        return {"snapshot_id": response.json().get("snapshot_id")}
+        snapshot_id = response.json().get("snapshot_id")
+        playlist_tracks_cache.remove_tracks(playlist_id, [t.get("uri") for t in body["tracks"]], snapshot_id)
+        return {"snapshot_id": snapshot_id}
     else:
+        playlist_tracks_cache.invalidate(playlist_id)
         return {
             "error": response.json(),
             "status_code": response.status_code
         }
     
-def unfollow_playlist_logic(playlist_id: str, user: User):
-    access_token = user.spotify_access_token
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
+async def unfollow_playlist_logic(playlist_id: str, user: Principal, db: Session):
+    access_token = await get_valid_spotify_token(user, db)
 
-    response = requests.delete(
-        f"https://api.spotify.com/v1/playlists/{playlist_id}/followers",
-        headers=headers
+    response = await spotify_client.delete(
+        f"/playlists/{playlist_id}/followers",
+        access_token=access_token
     )
 
     if response.status_code == 200:
@@ -363,13 +752,14 @@ def unfollow_playlist_logic(playlist_id: str, user: User):
     else:
         raise HTTPException(status_code=response.status_code, detail=response.json())
 
-def get_user_full_top_info(user: User, db: Session):
-    access_token = get_valid_spotify_token(user, db)
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-    def get_top_items(endpoint: str, time_range: str):
-        url = f"https://api.spotify.com/v1/me/top/{endpoint}?limit=5&time_range={time_range}"
-        resp = requests.get(url, headers=headers)
+async def fetch_user_full_top_info(access_token: str) -> dict:
+    """Descarga de Spotify los top artistas, canciones y géneros en los tres periodos."""
+    async def get_top_items(endpoint: str, time_range: str):
+        resp = await spotify_client.get(
+            f"/me/top/{endpoint}",
+            access_token=access_token,
+            params={"limit": 5, "time_range": time_range}
+        )
         if resp.status_code != 200:
             raise HTTPException(status_code=resp.status_code, detail=f"No se pudo obtener top {endpoint} ({time_range})")
         return resp.json().get("items", [])
@@ -386,9 +776,17 @@ def get_user_full_top_info(user: User, db: Session):
         "top_genres": {}
     }
 
-    for label, time_range in periods.items():
+    # Las 6 peticiones (artistas y canciones × periodo) se lanzan a la vez
+    responses = await asyncio.gather(*(
+        get_top_items(endpoint, time_range)
+        for time_range in periods.values()
+        for endpoint in ("artists", "tracks")
+    ))
+
+    for index, label in enumerate(periods):
+        artists, tracks = responses[2 * index], responses[2 * index + 1]
+
         # Top artistas
-        artists = get_top_items("artists", time_range)
         result["top_artists"][label] = [a["name"] for a in artists]
 
         # Top géneros
@@ -400,7 +798,25 @@ def get_user_full_top_info(user: User, db: Session):
         result["top_genres"][label] = top_genres
 
         # Top canciones
-        tracks = get_top_items("tracks", time_range)
         result["top_tracks"][label] = [f"{t['name']} - {t['artists'][0]['name']}" for t in tracks]
 
     return result
+
+
+async def get_user_full_top_info(user: Principal, db: Session):
+    """Devuelve la información top del usuario desde la caché, refrescándola si hace falta."""
+    cached, fresh = top_info_cache.peek(user.id)
+    if fresh:
+        return cached
+
+    # El token se obtiene dentro de la petición para que la recarga en segundo
+    # plano no dependa de la sesión de BD, que se cierra al responder
+    access_token = await get_valid_spotify_token(user, db)
+    loader = partial(fetch_user_full_top_info, access_token)
+
+    if cached is not None:
+        logger.info(f"[TOP] Sirviendo top info en caché para {user.email}, refrescando en segundo plano")
+        top_info_cache.refresh_in_background(user.id, loader)
+        return cached
+
+    return await top_info_cache.refresh(user.id, loader)
@@ -18,3 +18,7 @@ class User(Base):
 
     conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
 
+    @property
+    def spotify_connected(self) -> bool:
+        return bool(self.spotify_user_id and self.spotify_access_token)
+
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, Text, DateTime
+from datetime import datetime
+from src.config.db import Base
+
+class CompletionCacheEntry(Base):
+    __tablename__ = 'completion_cache'
+    __table_args__ = {'extend_existing': True}
+
+    # sha256 de (modelo, mensajes, parámetros de muestreo)
+    cache_key = Column(String(64), primary_key=True)
+    model = Column(String(100))
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<CompletionCacheEntry key={self.cache_key[:12]} model={self.model}>"
@@ -1,16 +1,23 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from src.config.db import Base
 
 class Conversation(Base):
     __tablename__ = 'conversations'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Listado de conversaciones de un usuario, más recientes primero
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"))
     created_at = Column(DateTime, default=datetime.utcnow)
     title = Column(String, default=lambda: "Conversación " + datetime.utcnow().strftime("%d/%m/%Y %H:%M"))
+    # Resumen acumulado de los mensajes antiguos, hasta el mensaje summary_until_id incluido
+    summary = Column(String, nullable=True)
+    summary_until_id = Column(Integer, nullable=True)
 
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     user = relationship("src.models.auth_model.User", back_populates="conversations")
@@ -1,17 +1,23 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from src.config.db import Base
 
 class Message(Base):
     __tablename__ = 'messages'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Historial de una conversación ordenado por fecha (últimos N y completo)
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey('conversations.id', ondelete="CASCADE"))
     role = Column(String)
     content = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Tokens estimados del contenido (se calcula al guardar; NULL en mensajes antiguos)
+    token_count = Column(Integer, nullable=True)
 
     conversation = relationship("Conversation", back_populates="messages")
 
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+from src.config.db import Base
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    __table_args__ = {'extend_existing': True}
+
+    # Una fila por migración aplicada (ver src/config/migrations.py)
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SchemaMigration version={self.version}>"
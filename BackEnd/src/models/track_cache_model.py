@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, DateTime
+from datetime import datetime
+from src.config.db import Base
+
+class TrackSearchCache(Base):
+    __tablename__ = 'track_search_cache'
+    __table_args__ = {'extend_existing': True}
+
+    # Clave normalizada "titulo|artista"
+    query_key = Column(String(512), primary_key=True)
+    # URI de Spotify; None indica que la búsqueda no encontró resultados
+    track_uri = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<TrackSearchCache key={self.query_key!r} uri={self.track_uri}>"
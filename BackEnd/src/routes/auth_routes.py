@@ -12,7 +12,7 @@ from src.controllers.auth_controller import (
     update_user_info
 )
 from src.services.spotify_service import login_spotify
-from src.models.auth_model import User
+from src.services.principal_cache import Principal
 import os
 from typing import Optional
 from urllib.parse import quote
@@ -32,30 +32,30 @@ class UpdateUserRequest(BaseModel):
     password: Optional[str] = None
 
 @router.post("/register")
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    return register_user(data.username, data.email, data.password, db)
+async def register(data: RegisterRequest, db: Session = Depends(get_db)):
+    return await register_user(data.username, data.email, data.password, db)
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     # OAuth2PasswordRequestForm tiene username y password, usamos username para email
-    return login_user(form_data.username, form_data.password, db)
+    return await login_user(form_data.username, form_data.password, db)
 
 @router.get("/me")
-def get_profile(user: User = Depends(get_current_user)):
+def get_profile(user: Principal = Depends(get_current_user)):
     return get_user_info(user)
 
 @router.put("/me")
-def update_profile(
+async def update_profile(
     data: UpdateUserRequest,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return update_user_info(data, user, db)
+    return await update_user_info(data, user, db)
 
 @router.get("/callback")
 async def spotify_callback(request: Request, db: Session = Depends(get_db)):
     try:
-        result = login_spotify(request, db)
+        result = await login_spotify(request, db)
         if not result.get("success", False):
             reason = quote(result.get("message", "Error desconocido"))
             return RedirectResponse(url=f"{FRONTEND_URL}/error?reason={reason}")
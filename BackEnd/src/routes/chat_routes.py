@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Query, Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from src.controllers import chat_controller
-from src.controllers.auth_controller import get_db, get_current_user
-from src.models.auth_model import User
+from src.controllers.auth_controller import get_db, get_async_db, get_current_user
+from src.services.principal_cache import Principal
 from pydantic import BaseModel
 from typing import Literal, Optional
 
@@ -12,68 +14,120 @@ class ChatRequest(BaseModel):
     question: str
     mode: Optional[Literal["normal", "creatividad", "razonamiento"]] = "normal"
 
+async def get_owned_conversation(chat_id: int, current_user: Principal, db: AsyncSession):
+    """Devuelve la conversación si pertenece al usuario; si no, 403."""
+    conversation = await chat_controller.get_conversation_by_id(chat_id, db)
+
+    if not conversation or str(conversation.user_id) != str(current_user.id):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return conversation
+
 @router.post("/start")
-async def start_chat(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def start_chat(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Inicia una nueva conversación para un usuario específico.
     """
-    user_id = str(current_user.id)
-    return await chat_controller.start_conversation(user_id, db)
+    return await chat_controller.start_conversation(current_user.id, db)
 
 @router.post("/{chat_id}/message")
 async def send_message(
     chat_id: int,
     body: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user_db: Session = Depends(get_db)
 ):
     """
     Envía un mensaje a una conversación existente, con opción de modo.
     """
-    conversation = chat_controller.get_conversation_by_id(str(chat_id), db)
+    await get_owned_conversation(chat_id, current_user, db)
+    return await chat_controller.handle_message(chat_id, body.question, current_user, db, mode=body.mode, user_db=user_db)
 
-    if not conversation or str(conversation.user_id) != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Unauthorized")
+@router.post("/{chat_id}/message/stream")
+async def send_message_stream(
+    chat_id: int,
+    body: ChatRequest,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user_db: Session = Depends(get_db)
+):
+    """
+    Envía un mensaje y devuelve la respuesta en streaming mediante Server-Sent Events.
+    Eventos: 'token' por cada fragmento, 'done' con la respuesta completa, 'title' después
+    si se genera un título automático, o 'error'.
+    """
+    await get_owned_conversation(chat_id, current_user, db)
 
-    return await chat_controller.handle_message(chat_id, body.question, current_user, db, mode=body.mode)
+    events = await chat_controller.stream_message(chat_id, body.question, current_user, db, mode=body.mode, user_db=user_db)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{chat_id}/title")
+async def get_title_status(
+    chat_id: int,
+    wait: float = Query(0, ge=0, le=30, description="Segundos a esperar si hay un título generándose"),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Devuelve el título actual y si todavía se está generando uno automático.
+    """
+    await get_owned_conversation(chat_id, current_user, db)
+    return await chat_controller.get_title_status(chat_id, db, wait=wait)
 
 @router.delete("/{chat_id}")
-def delete_chat(chat_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_chat(chat_id: int, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Elimina una conversación y sus mensajes asociados.
     """
-    conversation = chat_controller.get_conversation_by_id(chat_id, db)
-
-    if not conversation or str(conversation.user_id) != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Unauthorized")
-    return chat_controller.delete_chat(chat_id, db)
+    await get_owned_conversation(chat_id, current_user, db)
+    return await chat_controller.delete_chat(chat_id, db)
 
 @router.get("/{chat_id}/history")
-def get_history(chat_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_history(
+    chat_id: int,
+    before: Optional[int] = Query(None, ge=1, description="Id de mensaje: devuelve los anteriores"),
+    after: Optional[int] = Query(None, ge=1, description="Id de mensaje: devuelve los posteriores"),
+    limit: Optional[int] = Query(None, ge=1, le=chat_controller.HISTORY_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Devuelve el historial como NDJSON en streaming"),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Obtiene el historial de mensajes de una conversación.
+    Sin parámetros devuelve la lista completa; con `before`/`after`/`limit` pagina por
+    cursor y con `stream=true` emite un mensaje por línea (NDJSON).
     """
-    conversation = chat_controller.get_conversation_by_id(chat_id, db)
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Usa 'before' o 'after', no ambos")
 
-    if not conversation or str(conversation.user_id) != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Unauthorized")
-    return chat_controller.get_history(chat_id, db)
+    await get_owned_conversation(chat_id, current_user, db)
+
+    if stream:
+        lines = await chat_controller.open_history_stream(chat_id, db, before=before, after=after, limit=limit)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    if before is None and after is None and limit is None:
+        return await chat_controller.get_history(chat_id, db)
+
+    return await chat_controller.get_history_page(
+        chat_id, db, before=before, after=after, limit=limit or chat_controller.HISTORY_PAGE_SIZE
+    )
 
 @router.get("/user")
-def get_conversations(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_conversations(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene todas las conversaciones de un usuario.
     """
-    user_id = str(current_user.id)
-    return chat_controller.get_conversations(user_id, db)
+    return await chat_controller.get_conversations(current_user.id, db)
 
 @router.put("/{chat_id}/rename")
-def rename_conversation(chat_id: int, new_title: str = Body(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def rename_conversation(chat_id: int, new_title: str = Body(...), current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Cambia el título de una conversación existente.
     """
-    conversation = chat_controller.get_conversation_by_id(chat_id, db)
-
-    if not conversation or str(conversation.user_id) != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Unauthorized")
-    return chat_controller.rename_conversation(chat_id, new_title, db)
+    await get_owned_conversation(chat_id, current_user, db)
+    return await chat_controller.rename_conversation(chat_id, new_title, db)
@@ -0,0 +1,67 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+
+from src.config.db import get_pool_stats
+from src.services.chatIA_service import model_breakers, model_latency
+from src.services.completion_cache import completion_cache
+from src.services.principal_cache import principal_cache
+from src.utils.password_hasher import password_hasher
+
+# Las rutas internas exigen la cabecera X-Internal-Token con este valor.
+# Sin token configurado no existen: responden 404
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+router = APIRouter()
+
+def check_internal_token(token: Optional[str]):
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(token or "", INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+@router.get("/db-pool")
+def db_pool_stats(x_internal_token: Optional[str] = Header(None)):
+    """
+    Estadísticas de solo lectura de los pools de conexiones (síncrono y async):
+    conexiones en uso, overflow, timeouts y tiempo de espera por una conexión.
+    """
+    check_internal_token(x_internal_token)
+    return get_pool_stats()
+
+@router.get("/completion-cache")
+def completion_cache_stats(x_internal_token: Optional[str] = Header(None)):
+    """
+    Aciertos, fallos y peticiones no cacheables de la caché de respuestas del modelo.
+    """
+    check_internal_token(x_internal_token)
+    return completion_cache.stats()
+
+@router.get("/openrouter")
+def openrouter_stats(x_internal_token: Optional[str] = Header(None)):
+    """
+    Por modelo: estado del circuit breaker (closed, open o half_open) y latencias p50/p95.
+    """
+    check_internal_token(x_internal_token)
+    return {
+        "breakers": {model: breaker.stats() for model, breaker in model_breakers.items()},
+        "latency": model_latency.stats(),
+    }
+
+@router.get("/password-hasher")
+def password_hasher_stats(x_internal_token: Optional[str] = Header(None)):
+    """
+    Hashes de contraseña en curso o en cola, capacidad y peticiones rechazadas con 503.
+    """
+    check_internal_token(x_internal_token)
+    return password_hasher.stats()
+
+@router.get("/principal-cache")
+def principal_cache_stats(x_internal_token: Optional[str] = Header(None)):
+    """
+    Usuarios autenticados en caché y aciertos/fallos de get_current_user.
+    """
+    check_internal_token(x_internal_token)
+    return principal_cache.stats()
@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-import requests
-
-from src.controllers.spotify_controller import get_all_user_playlists, update_playlist, generate_playlist_auto, remove_tracks_from_playlist, unfollow_playlist_logic, get_user_full_top_info
+from src.controllers.spotify_controller import get_all_user_playlists, update_playlist, generate_playlist_auto, remove_tracks_from_playlist, unfollow_playlist_logic, get_user_full_top_info, get_user_playlists_page, get_playlist_tracks_page, open_playlist_tracks_stream
 from src.controllers.auth_controller import get_current_user, get_db
-from src.models.auth_model import User
+from src.services.principal_cache import Principal
 from src.services.lyrircs_service import LyricsFetcher
 
 router = APIRouter()
@@ -24,25 +23,45 @@ class UpdatePlaylistRequest(BaseModel):
     description: Optional[str] = None
 
 @router.get("/playlists")
-def playlists(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return get_all_user_playlists(user, db)
+async def playlists(
+    mode: Literal["full", "metadata"] = Query("full", description="'metadata' devuelve solo metadatos paginados"),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if mode == "metadata":
+        return await get_user_playlists_page(user, db, limit=limit, cursor=cursor)
+    return await get_all_user_playlists(user, db)
+
+@router.get("/playlists/{playlist_id}/tracks")
+async def playlist_tracks(
+    playlist_id: str,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    stream: bool = Query(False, description="Devuelve todas las páginas como NDJSON a medida que llegan"),
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if stream:
+        pages = await open_playlist_tracks_stream(playlist_id, user, db, limit=limit, cursor=cursor)
+        return StreamingResponse(pages, media_type="application/x-ndjson")
+    return await get_playlist_tracks_page(playlist_id, user, db, limit=limit, cursor=cursor)
 
 @router.get("/auth/spotify/connected")
-def check_spotify_connected(user: User = Depends(get_current_user)):
+def check_spotify_connected(user: Principal = Depends(get_current_user)):
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    if user.spotify_user_id and user.spotify_access_token:
-        return {"connected": True}
-    return {"connected": False}
+    return {"connected": user.spotify_connected}
 
 @router.put("/playlists/{playlist_id}/update")
-def update_playlist_endpoint(
+async def update_playlist_endpoint(
     playlist_id: str,
     data: UpdatePlaylistRequest,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_current_user)
 ):
-    return update_playlist(
+    return await update_playlist(
         playlist_id=playlist_id,
         title=data.title,
         description=data.description,
@@ -53,19 +72,20 @@ def update_playlist_endpoint(
 @router.post("/playlists/auto-generate")
 async def auto_generate_playlist(
     prompt: str,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     playlist_url = await generate_playlist_auto(prompt, user, db)
     return {"playlist_url": playlist_url}
 
 @router.delete("/playlists/{playlist_id}/tracks")
-def remove_tracks_playlist(
+async def remove_tracks_playlist(
     playlist_id: str,
     data: RemoveTracksRequest,
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
-    return remove_tracks_from_playlist(playlist_id, data, user)
+    return await remove_tracks_from_playlist(playlist_id, data, user, db)
 
 @router.get("/lyrics")
 def get_lyrics(
@@ -77,20 +97,21 @@ def get_lyrics(
     return url
 
 @router.delete("/playlists/{playlist_id}/unfollow")
-def unfollow_playlist(
+async def unfollow_playlist(
     playlist_id: str,
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
-    return unfollow_playlist_logic(playlist_id, user)
+    return await unfollow_playlist_logic(playlist_id, user, db)
 
 @router.get("/user/top-info")
-def get_user_top_info_endpoint(
-    user: User = Depends(get_current_user),
+async def get_user_top_info_endpoint(
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Devuelve los top 3 artistas, canciones y géneros del usuario desde Spotify
     para tres períodos de tiempo: esta semana, últimos seis meses y todo el tiempo.
     """
-    top_info = get_user_full_top_info(user, db)
+    top_info = await get_user_full_top_info(user, db)
     return top_info
\ No newline at end of file
@@ -1,11 +1,167 @@
+import asyncio
+import json
+import logging
 import os
-from dotenv import load_dotenv
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import httpx  # librería async para HTTP
 
-load_dotenv()
+from src.config import dotenv_config  # noqa: F401 (carga el .env)
+from src.services.completion_cache import CompletionCache, completion_cache, completion_key
+from src.services.openrouter_resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    OpenRouterError,
+    OpenRouterResponseError,
+    OpenRouterTimeoutError,
+    RetryPolicy,
+    call_with_retries,
+    error_for_status,
+)
+
+logger = logging.getLogger(__name__)
+
 API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# === Pool HTTP hacia OpenRouter ===
+OPENROUTER_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_HTTP_MAX_CONNECTIONS", 100))
+OPENROUTER_HTTP_MAX_KEEPALIVE = int(os.getenv("OPENROUTER_HTTP_MAX_KEEPALIVE", 20))
+OPENROUTER_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_HTTP_KEEPALIVE_EXPIRY", 60))
+OPENROUTER_HTTP_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_HTTP_CONNECT_TIMEOUT", 5))
+OPENROUTER_HTTP_READ_TIMEOUT = float(os.getenv("OPENROUTER_HTTP_READ_TIMEOUT", 60))
+OPENROUTER_HTTP_POOL_TIMEOUT = float(os.getenv("OPENROUTER_HTTP_POOL_TIMEOUT", 10))
+OPENROUTER_HTTP2 = os.getenv("OPENROUTER_HTTP2", "true").strip().lower() in ("1", "true", "yes", "on")
+
+# === Modelos de respaldo y peticiones "hedged" ===
+# Modelos a los que se pasa, en orden, si falla el principal (separados por comas)
+OPENROUTER_FALLBACK_MODELS = os.getenv("OPENROUTER_FALLBACK_MODELS", "")
+# Tiempo total por modelo: "modelo=segundos,modelo=segundos"
+OPENROUTER_MODEL_TIMEOUTS = os.getenv("OPENROUTER_MODEL_TIMEOUTS", "")
+# Si el principal tarda más que su percentil de latencia se lanza otra petición al siguiente modelo
+OPENROUTER_HEDGE = os.getenv("OPENROUTER_HEDGE", "false").strip().lower() in ("1", "true", "yes", "on")
+OPENROUTER_HEDGE_PERCENTILE = float(os.getenv("OPENROUTER_HEDGE_PERCENTILE", 95))
+OPENROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("OPENROUTER_HEDGE_MIN_SAMPLES", 20))
+# Espera antes del hedge mientras no hay muestras suficientes
+OPENROUTER_HEDGE_DEFAULT_DELAY = float(os.getenv("OPENROUTER_HEDGE_DEFAULT_DELAY", 5))
+
+
+def parse_model_list(raw: str) -> List[str]:
+    return [model.strip() for model in raw.split(",") if model.strip()]
+
+
+def parse_model_timeouts(raw: str) -> Dict[str, float]:
+    timeouts = {}
+    for item in raw.split(","):
+        model, sep, seconds = item.strip().rpartition("=")
+        try:
+            if sep and model:
+                timeouts[model.strip()] = float(seconds)
+        except ValueError:
+            logger.error(f"[OPENROUTER] Timeout inválido para {model}: {seconds!r}")
+    return timeouts
+
+
+class OpenRouterClient:
+    """Cliente HTTP compartido hacia OpenRouter.
+
+    Un único httpx.AsyncClient con keep-alive (y HTTP/2 si 'h2' está instalado)
+    para no repetir el handshake TLS en cada mensaje. Se cierra desde el lifespan.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = OPENROUTER_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OPENROUTER_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = OPENROUTER_HTTP_KEEPALIVE_EXPIRY,
+        connect_timeout: float = OPENROUTER_HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = OPENROUTER_HTTP_READ_TIMEOUT,
+        pool_timeout: float = OPENROUTER_HTTP_POOL_TIMEOUT,
+        http2: bool = OPENROUTER_HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=connect_timeout,
+            pool=pool_timeout,
+        )
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("[OPENROUTER-HTTP] Paquete 'h2' no instalado, se usa HTTP/1.1")
+                http2 = False
+        self.http2 = http2
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=self.limits,
+            timeout=self.timeout,
+            transport=self.transport,
+        )
+
+    async def start(self):
+        """Crea el cliente compartido (llamado desde el lifespan)."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            logger.info(f"[OPENROUTER-HTTP] Cliente iniciado (http2={self.http2})")
+
+    async def close(self):
+        """Cierra el cliente compartido y libera las conexiones del pool."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("[OPENROUTER-HTTP] Cliente cerrado")
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Fuera del lifespan (scripts, tests) el cliente se crea bajo demanda
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+
+# Instancia compartida por todos los Agent del proceso
+openrouter_client = OpenRouterClient()
+
+# Un circuito por modelo y proceso: si un modelo se degrada se pasa a los de respaldo
+model_breakers: Dict[str, CircuitBreaker] = {}
+
+def breaker_for(model: str) -> CircuitBreaker:
+    if model not in model_breakers:
+        model_breakers[model] = CircuitBreaker()
+    return model_breakers[model]
+
+# Latencias de cada modelo, compartidas por todos los Agent: deciden cuándo lanzar el hedge
+model_latency = LatencyTracker()
+
+
+def error_from_body(error) -> OpenRouterError:
+    """Error que OpenRouter devuelve dentro del JSON ({"error": {"code", "message"}})."""
+    details = error if isinstance(error, dict) else {"message": str(error)}
+    code = details.get("code")
+    status_code = code if isinstance(code, int) and 400 <= code < 600 else 502
+    return error_for_status(status_code, str(details.get("message", "")))
+
 
 class Agent:
+    """Cliente de chat sobre OpenRouter.
+
+    `models` es la lista ordenada de modelos: si uno falla (tras sus reintentos)
+    se pasa al siguiente. Por defecto, `model` seguido de OPENROUTER_FALLBACK_MODELS.
+    Con `hedge`, si el modelo en curso tarda más que su percentil de latencia se
+    lanza la misma petición al siguiente y gana la primera respuesta correcta.
+    """
+
     def __init__(
         self,
         model="openai/gpt-4o-mini",
@@ -13,9 +169,26 @@ class Agent:
         temperature=0.7,
         top_p=1.0,
         presence_penalty=0.0,
-        frequency_penalty=0.0
+        frequency_penalty=0.0,
+        http_client: Optional[OpenRouterClient] = None,
+        cache: Optional[CompletionCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        models: Optional[List[str]] = None,
+        model_timeouts: Optional[Dict[str, float]] = None,
+        hedge: bool = OPENROUTER_HEDGE,
+        latency: Optional[LatencyTracker] = None
     ):
+        self.http_client = http_client or openrouter_client
+        self.cache = cache or completion_cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Un breaker explícito se usa para todos los modelos
+        self.breaker = breaker
         self.model = model
+        self.models = list(dict.fromkeys(models or [model] + parse_model_list(OPENROUTER_FALLBACK_MODELS)))
+        self.model_timeouts = parse_model_timeouts(OPENROUTER_MODEL_TIMEOUTS) if model_timeouts is None else model_timeouts
+        self.hedge = hedge
+        self.latency = latency or model_latency
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.top_p = top_p
@@ -30,36 +203,215 @@ class Agent:
         else:
             return "Eres un asistente experto en música. Responde en español."
 
-    async def chat(self, message_user: str, messages: list = [], mode: str = "normal", extra_context: str = "") -> str:
+    def build_payload(
+        self,
+        message_user: str,
+        messages: list = [],
+        mode: str = "normal",
+        extra_context: str = "",
+        temperature: Optional[float] = None
+    ) -> dict:
         base_context = self.get_context(mode)
-        
+
         if extra_context:
             base_context += "\n\nInformación adicional del usuario:\n" + extra_context
 
         messages = [{"role": "system", "content": base_context}] + messages.copy() + [{"role": "user", "content": message_user}]
 
-        payload = {
+        return {
             "model": self.model,
             "messages": messages,
             "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
+            "temperature": self.temperature if temperature is None else temperature,
             "top_p": self.top_p,
             "presence_penalty": self.presence_penalty,
             "frequency_penalty": self.frequency_penalty
         }
 
-        async with httpx.AsyncClient(timeout=60) as client:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
+    async def chat(
+        self,
+        message_user: str,
+        messages: list = [],
+        mode: str = "normal",
+        extra_context: str = "",
+        temperature: Optional[float] = None,
+        use_cache: bool = False
+    ) -> str:
+        """Respuesta completa del modelo.
+
+        Con `use_cache` la respuesta se busca/guarda en la caché de completions,
+        siempre que la caché esté activada y la temperatura sea baja.
+        """
+        payload = self.build_payload(message_user, messages, mode, extra_context, temperature)
+
+        key = completion_key(payload) if use_cache and self.cache.cacheable(payload) else None
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        content, answered_by = await self.request_completion(payload)
+        # La clave es la del modelo principal: una respuesta de un modelo de respaldo no se guarda
+        if key is not None and answered_by == self.models[0]:
+            await self.cache.set(key, content, model=answered_by)
+        return content
+
+    def policy_for(self, model: str) -> RetryPolicy:
+        """Política de reintentos del modelo: su timeout (si tiene) sustituye al tiempo total."""
+        timeout = self.model_timeouts.get(model)
+        if timeout is None:
+            return self.retry_policy
+        policy = self.retry_policy
+        return RetryPolicy(policy.max_attempts, policy.base_delay, policy.max_delay, timeout, policy.rng)
+
+    def hedge_delay(self, model: str) -> float:
+        if self.latency.count(model) < OPENROUTER_HEDGE_MIN_SAMPLES:
+            return OPENROUTER_HEDGE_DEFAULT_DELAY
+        return self.latency.percentile(model, OPENROUTER_HEDGE_PERCENTILE)
+
+    async def complete_with(self, payload: dict, model: str) -> str:
+        """POST a OpenRouter con un modelo concreto, con reintentos, circuit breaker y tiempo total máximo."""
+        payload = {**payload, "model": model}
+
+        async def send() -> str:
+            response = await self.http_client.client.post(
+                OPENROUTER_URL,
                 headers={"Authorization": f"Bearer {API_KEY}"},
                 json=payload
             )
+            if response.status_code != 200:
+                raise error_for_status(response.status_code, response.text, response.headers.get("Retry-After"))
 
-        data = response.json()
+            try:
+                data = response.json()
+            except ValueError:
+                raise OpenRouterResponseError("Openrouter no devuelve la respuesta en formato correcto.")
+            if isinstance(data, dict) and "error" in data:
+                raise error_from_body(data["error"])
 
-        try:
-            return data["choices"][0]["message"]["content"]
-        except (KeyError, IndexError):
-            raise Exception("Openrouter no devuelve la respuesta en formato correcto.")
+            try:
+                return data["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                raise OpenRouterResponseError("Openrouter no devuelve la respuesta en formato correcto.")
 
+        start = time.monotonic()
+        try:
+            content = await call_with_retries(send, self.policy_for(model), self.breaker or breaker_for(model))
+        except (asyncio.CancelledError, OpenRouterTimeoutError):
+            # Cancelada por el hedge o sin respuesta a tiempo: lo que tardó es una cota
+            # inferior de su latencia. Sin esta muestra el percentil solo vería las
+            # respuestas rápidas y cada hedge adelantaría el siguiente
+            self.latency.record(model, time.monotonic() - start)
+            raise
+        self.latency.record(model, time.monotonic() - start)
         return content
+
+    async def complete_hedged(self, payload: dict, primary: str, secondary: str) -> Tuple[str, str]:
+        """Pide a `primary` y, si tarda más que su umbral, también a `secondary`.
+
+        Devuelve (respuesta, modelo) de la primera respuesta correcta y cancela
+        la otra petición. Si `primary` falla antes del umbral se pasa
+        directamente a `secondary`.
+        """
+        first = asyncio.ensure_future(self.complete_with(payload, primary))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+            if done and not first.exception():
+                return first.result(), primary
+            if done:
+                logger.warning(f"[OPENROUTER] {primary} falló, se pasa a {secondary}: {first.exception()}")
+                return await self.complete_with(payload, secondary), secondary
+
+            logger.info(f"[OPENROUTER] {primary} lento, petición hedged a {secondary}")
+            second = asyncio.ensure_future(self.complete_with(payload, secondary))
+            tasks.append(second)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.exception():
+                        return task.result(), primary if task is first else secondary
+            # Fallaron las dos: se propaga el error del modelo de respaldo
+            raise second.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def request_completion(self, payload: dict) -> Tuple[str, str]:
+        """(respuesta, modelo) del primer modelo de `self.models` que responda correctamente."""
+        last_error: Optional[Exception] = None
+        index = 0
+        while index < len(self.models):
+            model = self.models[index]
+            hedge_to = self.models[index + 1] if self.hedge and index + 1 < len(self.models) else None
+            try:
+                if hedge_to:
+                    return await self.complete_hedged(payload, model, hedge_to)
+                return await self.complete_with(payload, model), model
+            except OpenRouterError as e:
+                last_error = e
+                index += 2 if hedge_to else 1
+                if index < len(self.models):
+                    logger.warning(f"[OPENROUTER] {model} no disponible ({e}), se pasa a {self.models[index]}")
+        raise last_error
+
+    async def chat_stream(self, message_user: str, messages: list = [], mode: str = "normal", extra_context: str = "") -> AsyncIterator[str]:
+        """Igual que chat, pero va devolviendo los fragmentos de texto según los genera el modelo."""
+        payload = self.build_payload(message_user, messages, mode, extra_context)
+        payload["stream"] = True
+
+        client = self.http_client.client
+
+        async def open_stream(model: str) -> httpx.Response:
+            request = client.build_request(
+                "POST",
+                OPENROUTER_URL,
+                headers={"Authorization": f"Bearer {API_KEY}"},
+                json={**payload, "model": model}
+            )
+            response = await client.send(request, stream=True)
+            if response.status_code != 200:
+                body = (await response.aread()).decode(errors="replace")
+                await response.aclose()
+                raise error_for_status(response.status_code, body, response.headers.get("Retry-After"))
+            return response
+
+        # Solo se reintenta (o se pasa a otro modelo) hasta recibir la respuesta:
+        # una vez enviados fragmentos al cliente no se puede repetir la petición.
+        # Sin hedge: dos streams en paralelo duplicarían el coste entero
+        for index, model in enumerate(self.models):
+            try:
+                response = await call_with_retries(
+                    lambda: open_stream(model), self.policy_for(model), self.breaker or breaker_for(model)
+                )
+                break
+            except OpenRouterError as e:
+                if index + 1 == len(self.models):
+                    raise
+                logger.warning(f"[OPENROUTER] {model} no disponible ({e}), se pasa a {self.models[index + 1]}")
+
+        try:
+            async for line in response.aiter_lines():
+                # Las líneas que empiezan por ':' son comentarios keep-alive de SSE
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+
+                if "error" in chunk:
+                    raise error_from_body(chunk["error"])
+
+                choices = chunk.get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+        finally:
+            await response.aclose()
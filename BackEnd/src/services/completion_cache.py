@@ -0,0 +1,154 @@
+# src/services/completion_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+from src.config.db import AsyncSessionLocal
+from src.models.completion_cache_model import CompletionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on")
+COMPLETION_CACHE_PERSISTENT = os.getenv("COMPLETION_CACHE_PERSISTENT", "false").strip().lower() in ("1", "true", "yes", "on")
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", 1000))
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", 24 * 3600))
+# Por encima de esta temperatura la respuesta no es reproducible: no se cachea
+COMPLETION_CACHE_MAX_TEMPERATURE = float(os.getenv("COMPLETION_CACHE_MAX_TEMPERATURE", 0.3))
+
+# Campos del payload que determinan la respuesta del modelo
+KEY_FIELDS = ("model", "messages", "max_tokens", "temperature", "top_p", "presence_penalty", "frequency_penalty")
+
+
+def completion_key(payload: dict) -> str:
+    """Hash estable de (modelo, mensajes, parámetros de muestreo)."""
+    material = json.dumps({field: payload.get(field) for field in KEY_FIELDS}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Caché de respuestas de OpenRouter para prompts deterministas.
+
+    Nivel en memoria (LRU con TTL) y, opcionalmente, una tabla persistente
+    compartida entre workers. Solo se usa con payloads de temperatura baja;
+    el resto se cuenta como 'bypassed' y va siempre al modelo.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = COMPLETION_CACHE_ENABLED,
+        max_entries: int = COMPLETION_CACHE_MAX_ENTRIES,
+        ttl: float = COMPLETION_CACHE_TTL,
+        max_temperature: float = COMPLETION_CACHE_MAX_TEMPERATURE,
+        session_factory: Optional[Callable] = AsyncSessionLocal if COMPLETION_CACHE_PERSISTENT else None,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.session_factory = session_factory
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def cacheable(self, payload: dict) -> bool:
+        if not self.enabled:
+            return False
+        if (payload.get("temperature") or 0) > self.max_temperature:
+            self.bypassed += 1
+            return False
+        return True
+
+    def _remember(self, key: str, response: str, expires_in: float):
+        self._entries[key] = (response, time.monotonic() + expires_in)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _from_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def get(self, key: str) -> Optional[str]:
+        response = self._from_memory(key)
+        if response is not None:
+            self.memory_hits += 1
+            return response
+
+        if self.session_factory is not None:
+            now = datetime.utcnow()
+            try:
+                async with self.session_factory() as db:
+                    row = (await db.execute(
+                        select(CompletionCacheEntry.response, CompletionCacheEntry.expires_at)
+                        .where(CompletionCacheEntry.cache_key == key, CompletionCacheEntry.expires_at > now)
+                    )).first()
+            except Exception as e:
+                logger.warning(f"[COMPLETION-CACHE] Error leyendo caché persistente: {e}")
+                row = None
+            if row is not None:
+                self._remember(key, row.response, (row.expires_at - now).total_seconds())
+                self.db_hits += 1
+                return row.response
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: str, model: Optional[str] = None):
+        """Guarda la respuesta en ambos niveles. Los errores de BD no se propagan."""
+        self._remember(key, response, self.ttl)
+        if self.session_factory is None:
+            return
+
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            try:
+                await db.merge(CompletionCacheEntry(
+                    cache_key=key,
+                    model=model,
+                    response=response,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                ))
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"[COMPLETION-CACHE] Error guardando caché persistente: {e}")
+
+    def clear(self):
+        """Vacía el nivel en memoria y reinicia los contadores."""
+        self._entries.clear()
+        self.memory_hits = self.db_hits = self.misses = self.bypassed = 0
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persistent": self.session_factory is not None,
+            "entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Instancia compartida por todo el proceso
+completion_cache = CompletionCache()
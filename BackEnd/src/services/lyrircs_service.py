@@ -1,6 +1,5 @@
 import logging
-import requests
-from bs4 import BeautifulSoup
+import httpx
 import urllib.parse
 
 logger = logging.getLogger(__name__)
@@ -32,9 +31,13 @@ class LyricsFetcher:
             "Referer": "https://duckduckgo.com/",
             "DNT": "1",
         }
-        response = requests.get(search_url, headers=headers)
+        # httpx ya está cargado por la app; requests no hace falta solo para esto
+        response = httpx.get(search_url, headers=headers, follow_redirects=True, timeout=10)
         logger.info(f"[LyricsFetcher] Respuesta de DuckDuckGo: {response.status_code}")
         if response.status_code == 200:
+            # BeautifulSoup se importa en el primer uso: casi ninguna petición lo necesita
+            from bs4 import BeautifulSoup
+
             soup = BeautifulSoup(response.text, "html.parser")
             for a in soup.find_all("a"):
                 href = a.get("href")
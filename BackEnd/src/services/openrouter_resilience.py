@@ -0,0 +1,308 @@
+# src/services/openrouter_resilience.py
+
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# === Configuración ===
+
+OPENROUTER_RETRY_MAX_ATTEMPTS = int(os.getenv("OPENROUTER_RETRY_MAX_ATTEMPTS", 3))
+OPENROUTER_RETRY_BASE_DELAY = float(os.getenv("OPENROUTER_RETRY_BASE_DELAY", 0.5))
+OPENROUTER_RETRY_MAX_DELAY = float(os.getenv("OPENROUTER_RETRY_MAX_DELAY", 8))
+# Tiempo total máximo de una petición, reintentos incluidos
+OPENROUTER_REQUEST_DEADLINE = float(os.getenv("OPENROUTER_REQUEST_DEADLINE", 30))
+OPENROUTER_BREAKER_FAILURES = int(os.getenv("OPENROUTER_BREAKER_FAILURES", 5))
+OPENROUTER_BREAKER_RESET = float(os.getenv("OPENROUTER_BREAKER_RESET", 30))
+# Latencias recientes que se guardan por modelo para calcular percentiles
+OPENROUTER_LATENCY_WINDOW = int(os.getenv("OPENROUTER_LATENCY_WINDOW", 200))
+
+
+# === Errores clasificados ===
+
+class OpenRouterError(Exception):
+    """Error al llamar a OpenRouter. `retryable` indica si tiene sentido reintentar."""
+
+    retryable = False
+    # Estado que se devuelve al cliente de la API
+    http_status = 502
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class OpenRouterRateLimitError(OpenRouterError):
+    retryable = True
+    http_status = 503
+
+
+class OpenRouterServerError(OpenRouterError):
+    retryable = True
+
+
+class OpenRouterTimeoutError(OpenRouterError):
+    retryable = True
+    http_status = 504
+
+
+class OpenRouterConnectionError(OpenRouterError):
+    retryable = True
+
+
+class OpenRouterClientError(OpenRouterError):
+    """4xx distinto de 429: la petición o la clave son incorrectas, reintentar no ayuda."""
+
+
+class OpenRouterResponseError(OpenRouterError):
+    """Respuesta 200 con un cuerpo que no se puede interpretar."""
+
+
+class OpenRouterUnavailableError(OpenRouterError):
+    """El circuito está abierto o se agotó el tiempo total: se falla sin llamar."""
+
+    http_status = 503
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos de la cabecera Retry-After (número o fecha HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def error_for_status(status_code: int, body: str = "", retry_after: Optional[str] = None) -> OpenRouterError:
+    message = f"Openrouter respondió con estado {status_code}."
+    if body:
+        message += f" {body[:200]}"
+    if status_code == 429:
+        return OpenRouterRateLimitError(message, status_code, parse_retry_after(retry_after))
+    if status_code >= 500 or status_code == 408:
+        return OpenRouterServerError(message, status_code, parse_retry_after(retry_after))
+    return OpenRouterClientError(message, status_code)
+
+
+def classify_exception(error: Exception) -> OpenRouterError:
+    """Convierte errores de transporte de httpx/asyncio en errores clasificados."""
+    if isinstance(error, OpenRouterError):
+        return error
+    if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return OpenRouterTimeoutError(f"Timeout llamando a Openrouter: {error!r}")
+    if isinstance(error, httpx.TransportError):
+        return OpenRouterConnectionError(f"Error de conexión con Openrouter: {error!r}")
+    return OpenRouterError(f"Error llamando a Openrouter: {error!r}")
+
+
+def to_http_exception(error: Exception, detail: str) -> HTTPException:
+    """HTTPException para la API a partir de un error de OpenRouter (500 si no está clasificado)."""
+    if not isinstance(error, OpenRouterError):
+        return HTTPException(status_code=500, detail=detail)
+    headers = {"Retry-After": str(max(int(error.retry_after or 0), 1))} if error.http_status == 503 else None
+    return HTTPException(status_code=error.http_status, detail=detail, headers=headers)
+
+
+# === Circuit breaker ===
+
+class CircuitBreaker:
+    """Circuit breaker por proceso.
+
+    Tras `failure_threshold` fallos seguidos se abre y las llamadas fallan al
+    instante durante `reset_timeout` segundos. Después deja pasar una única
+    llamada de prueba (half-open): si sale bien se cierra y si falla vuelve a abrirse.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = OPENROUTER_BREAKER_FAILURES,
+        reset_timeout: float = OPENROUTER_BREAKER_RESET,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 0.0)
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def release_probe(self):
+        """La llamada de prueba se canceló sin resultado: se permite otra."""
+        self._probing = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("[OPENROUTER] Circuito cerrado")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning(f"[OPENROUTER] Circuito abierto tras {self.failures} fallos")
+            self.opened_at = self.clock()
+            self._probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+# === Reintentos ===
+
+class RetryPolicy:
+    """Reintentos con backoff exponencial y jitter completo, dentro de un tiempo total máximo."""
+
+    def __init__(
+        self,
+        max_attempts: int = OPENROUTER_RETRY_MAX_ATTEMPTS,
+        base_delay: float = OPENROUTER_RETRY_BASE_DELAY,
+        max_delay: float = OPENROUTER_RETRY_MAX_DELAY,
+        deadline: float = OPENROUTER_REQUEST_DEADLINE,
+        rng: Optional[random.Random] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.rng = rng or random.Random()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes del reintento `attempt` (1 = primer reintento). Retry-After manda si es mayor."""
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+async def call_with_retries(
+    send: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: CircuitBreaker,
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> T:
+    """Ejecuta `send()` con reintentos, circuit breaker y tiempo total máximo.
+
+    Cada intento se corta con lo que quede del tiempo total. `send` debe lanzar
+    errores de OpenRouter (o de httpx) si la llamada falla.
+    """
+    started = clock()
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = policy.deadline - (clock() - started)
+        if remaining <= 0:
+            raise OpenRouterUnavailableError("Tiempo máximo de la petición a Openrouter agotado")
+        if not breaker.allow():
+            raise OpenRouterUnavailableError("Openrouter no disponible (circuito abierto)", retry_after=breaker.retry_in())
+
+        try:
+            result = await asyncio.wait_for(send(), timeout=remaining)
+        except asyncio.CancelledError:
+            # Cancelación de quien llama: no cuenta como fallo de OpenRouter
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            error = classify_exception(e)
+            if not error.retryable:
+                # Error nuestro (petición o respuesta inválida): OpenRouter respondió
+                breaker.record_success()
+                raise error from e
+            breaker.record_failure()
+
+            delay = policy.backoff(attempt, error.retry_after)
+            remaining = policy.deadline - (clock() - started)
+            if attempt >= policy.max_attempts or delay >= remaining:
+                logger.error(f"[OPENROUTER] {error} (intento {attempt}, sin más reintentos)")
+                raise error from e
+            logger.warning(f"[OPENROUTER] {error} (intento {attempt}), reintento en {delay:.2f}s")
+            await sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
+
+
+# === Latencias por modelo ===
+
+class LatencyTracker:
+    """Latencias de las últimas llamadas de cada modelo (ventana deslizante).
+
+    Las llamadas canceladas o con timeout cuentan con el tiempo hasta cortarse.
+    """
+
+    def __init__(self, window: int = OPENROUTER_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """Percentil (0-100) por rango más cercano; None si no hay muestras."""
+        samples = sorted(self._samples.get(model, ()))
+        if not samples:
+            return None
+        rank = max(math.ceil(percentile / 100 * len(samples)) - 1, 0)
+        return samples[min(rank, len(samples) - 1)]
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50_ms": round(self.percentile(model, 50) * 1000, 1),
+                "p95_ms": round(self.percentile(model, 95) * 1000, 1),
+            }
+            for model, samples in self._samples.items() if samples
+        }
@@ -0,0 +1,68 @@
+# src/services/playlist_cache.py
+
+import logging
+import os
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_CACHE_MAX_ENTRIES = int(os.getenv("PLAYLIST_CACHE_MAX_ENTRIES", 2000))
+
+
+class PlaylistTracksCache:
+    """Caché de canciones de playlists indexada por (playlist_id, snapshot_id).
+
+    Spotify cambia el snapshot_id de una playlist solo cuando cambia su
+    contenido, así que una entrada con el mismo snapshot sigue siendo válida
+    sin necesidad de TTL. Se guarda solo el último snapshot de cada playlist.
+    """
+
+    def __init__(self, max_entries: int = PLAYLIST_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, List[dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, playlist_id: str, snapshot_id: Optional[str]) -> Optional[List[dict]]:
+        """Devuelve las canciones si el snapshot cacheado coincide con el actual."""
+        entry = self._entries.get(playlist_id)
+        if snapshot_id and entry is not None and entry[0] == snapshot_id:
+            self._entries.move_to_end(playlist_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, playlist_id: str, snapshot_id: Optional[str], tracks: List[dict]):
+        if not snapshot_id:
+            return
+        self._entries[playlist_id] = (snapshot_id, tracks)
+        self._entries.move_to_end(playlist_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, playlist_id: str):
+        if self._entries.pop(playlist_id, None) is not None:
+            logger.info(f"[PLAYLIST-CACHE] Invalidada playlist {playlist_id}")
+
+    def remove_tracks(self, playlist_id: str, uris: Iterable[str], new_snapshot_id: Optional[str]):
+        """Aplica un borrado de canciones a la entrada cacheada y la mueve al nuevo snapshot."""
+        entry = self._entries.get(playlist_id)
+        if entry is None or not new_snapshot_id:
+            self.invalidate(playlist_id)
+            return
+        removed = set(uris)
+        tracks = [track for track in entry[1] if track.get("uri") not in removed]
+        self.set(playlist_id, new_snapshot_id, tracks)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Instancia compartida por todo el proceso
+playlist_tracks_cache = PlaylistTracksCache()
@@ -0,0 +1,75 @@
+# src/services/principal_cache.py
+
+import os
+import threading
+from typing import NamedTuple, Optional
+
+from src.utils.swr_cache import SWRCache
+
+# Segundos que se reutiliza el usuario autenticado sin volver a la BD. Es una caché
+# por proceso: un cambio hecho en otro worker se ve como mucho tras este tiempo
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000))
+
+
+class Principal(NamedTuple):
+    """Usuario autenticado, sin contraseña ni tokens de Spotify.
+
+    Es lo que devuelve `get_current_user`. Los handlers que necesitan la fila
+    completa (tokens de Spotify, cambios de perfil) la cargan con `load_user`.
+    """
+
+    id: int
+    username: str
+    email: str
+    spotify_user_id: Optional[str]
+    spotify_connected: bool
+
+
+class PrincipalCache:
+    """Caché con TTL de principales por `sub` del token.
+
+    `get_current_user` se ejecuta en hilos del threadpool, así que el acceso al
+    diccionario se serializa con un lock.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.enabled = ttl > 0
+        self._cache = SWRCache(ttl=ttl, max_entries=max_entries, name="PRINCIPAL")
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            principal, fresh = self._cache.peek(subject)
+        return principal if fresh else None
+
+    def set(self, subject: str, principal: Principal):
+        if self.enabled:
+            with self._lock:
+                self._cache.set(subject, principal)
+
+    def invalidate(self, *subjects: Optional[str]):
+        with self._lock:
+            for subject in subjects:
+                if subject:
+                    self._cache.invalidate(subject)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = self._cache.stats()
+        return {
+            "enabled": self.enabled,
+            "entries": stats["entries"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+        }
+
+
+# Instancia compartida por todo el proceso
+principal_cache = PrincipalCache()
@@ -0,0 +1,143 @@
+# src/services/spotify_client.py
+
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# === Configuración ===
+
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+
+
+def _env_number(name: str, default, cast=int):
+    """Lee un valor numérico del entorno, usando el valor por defecto si es inválido."""
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        logger.error(f"{name} debe ser numérico, se usa el valor por defecto {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _http2_available() -> bool:
+    """HTTP/2 en httpx requiere el paquete opcional 'h2'."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# === Cliente ===
+
+class SpotifyClient:
+    """Cliente HTTP asíncrono compartido para la Web API de Spotify.
+
+    Mantiene un único httpx.AsyncClient con pool de conexiones keep-alive para
+    evitar un handshake TCP+TLS por llamada. Se abre y se cierra desde el
+    lifespan de la aplicación.
+    """
+
+    def __init__(
+        self,
+        base_url: str = SPOTIFY_API_URL,
+        max_connections: int = _env_number("SPOTIFY_HTTP_MAX_CONNECTIONS", 200),
+        max_keepalive_connections: int = _env_number("SPOTIFY_HTTP_MAX_KEEPALIVE", 50),
+        keepalive_expiry: float = _env_number("SPOTIFY_HTTP_KEEPALIVE_EXPIRY", 30.0, float),
+        connect_timeout: float = _env_number("SPOTIFY_HTTP_CONNECT_TIMEOUT", 5.0, float),
+        read_timeout: float = _env_number("SPOTIFY_HTTP_READ_TIMEOUT", 15.0, float),
+        pool_timeout: float = _env_number("SPOTIFY_HTTP_POOL_TIMEOUT", 10.0, float),
+        http2: bool = _env_bool("SPOTIFY_HTTP2", True),
+    ):
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=pool_timeout,
+        )
+        if http2 and not _http2_available():
+            logger.warning("[SPOTIFY-HTTP] Paquete 'h2' no instalado, se usa HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=self.http2,
+            limits=self.limits,
+            timeout=self.timeout,
+        )
+
+    async def start(self):
+        """Crea el cliente compartido (llamado desde el lifespan)."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            logger.info(
+                f"[SPOTIFY-HTTP] Cliente iniciado (http2={self.http2}, "
+                f"max_connections={self.limits.max_connections})"
+            )
+
+    async def close(self):
+        """Cierra el cliente compartido y libera las conexiones del pool."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("[SPOTIFY-HTTP] Cliente cerrado")
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Fuera del lifespan (scripts, tests) el cliente se crea bajo demanda
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        access_token: Optional[str] = None,
+        headers: Optional[dict] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """Envía una petición a Spotify. Las URLs relativas se resuelven contra SPOTIFY_API_URL."""
+        request_headers = dict(headers or {})
+        if access_token:
+            request_headers["Authorization"] = f"Bearer {access_token}"
+        return await self.client.request(method, url, headers=request_headers, **kwargs)
+
+    async def get(self, url: str, access_token: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, access_token=access_token, **kwargs)
+
+    async def post(self, url: str, access_token: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, access_token=access_token, **kwargs)
+
+    async def put(self, url: str, access_token: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, access_token=access_token, **kwargs)
+
+    async def delete(self, url: str, access_token: Optional[str] = None, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, access_token=access_token, **kwargs)
+
+
+# Instancia compartida por todo el proceso
+spotify_client = SpotifyClient()
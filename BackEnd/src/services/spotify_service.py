@@ -1,15 +1,15 @@
 from fastapi import Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from src.config import dotenv_config  # noqa: F401 (carga el .env)
 from src.models.auth_model import User
 import os
-import requests
 import base64
 import logging
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
 from sqlalchemy.exc import IntegrityError
-
-load_dotenv()
+from src.services.principal_cache import principal_cache
+from src.services.spotify_client import spotify_client, SPOTIFY_TOKEN_URL
 
 CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
@@ -18,7 +18,62 @@ REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-def login_spotify(request: Request, db: Session):
+def link_spotify_account(
+    db: Session,
+    email: str,
+    spotify_user_id: str,
+    access_token: str,
+    refresh_token: str,
+    expires_in,
+):
+    """Guarda la cuenta de Spotify y sus tokens en el usuario `email`.
+
+    Hace E/S de BD con la sesión síncrona: llamar desde un hilo. Ante cualquier
+    error deshace la transacción; los conflictos se traducen a HTTPException.
+    """
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        if not user:
+            logger.warning(f"No se encontró usuario con email: {email}")
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+        # Validar que el ID de Spotify no esté ya asociado a otro usuario
+        existing_user = db.query(User).filter(User.spotify_user_id == spotify_user_id).first()
+        if existing_user and existing_user.email != user.email:
+            logger.warning(f"El ID de Spotify '{spotify_user_id}' ya está vinculado a otra cuenta: {existing_user.email}")
+            raise HTTPException(
+                status_code=409,
+                detail="Este usuario de Spotify ya está vinculado a otra cuenta en el sistema."
+            )
+
+        user.spotify_user_id = spotify_user_id
+        user.spotify_access_token = access_token
+        user.spotify_refresh_token = refresh_token
+        user.spotify_token_expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in))
+
+        db.commit()
+        principal_cache.invalidate(email)
+
+    except HTTPException:
+        raise
+
+    except IntegrityError as e:
+        db.rollback()
+        if e.orig and hasattr(e.orig, "args") and "duplicate key value violates unique constraint" in e.orig.args[0]:
+            logger.warning(f"El ID de Spotify '{spotify_user_id}' ya está vinculado a otra cuenta.")
+            raise HTTPException(
+                status_code=409,
+                detail="El ID de Spotify ya está vinculado a otra cuenta."
+            )
+        logger.error(f"Error de integridad: {str(e)}")
+        raise HTTPException(status_code=400, detail="Error al guardar la información de Spotify")
+
+    except Exception:
+        db.rollback()
+        raise
+
+
+async def login_spotify(request: Request, db: Session):
     code = request.query_params.get("code")
     email = request.query_params.get("state")
 
@@ -27,7 +82,6 @@ def login_spotify(request: Request, db: Session):
         raise HTTPException(status_code=400, detail="Faltan parámetros de autorización (code o email)")
 
     try:
-        token_url = "https://accounts.spotify.com/api/token"
         headers = {
             "Authorization": f"Basic {base64.b64encode(f'{CLIENT_ID}:{CLIENT_SECRET}'.encode()).decode()}",
             "Content-Type": "application/x-www-form-urlencoded"
@@ -38,7 +92,7 @@ def login_spotify(request: Request, db: Session):
             "redirect_uri": REDIRECT_URI
         }
 
-        response = requests.post(token_url, headers=headers, data=data)
+        response = await spotify_client.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
 
         if response.status_code != 200:
             logger.error(f"Error al obtener el token de Spotify: {response.status_code}, {response.text}")
@@ -53,10 +107,7 @@ def login_spotify(request: Request, db: Session):
             logger.error("Spotify no devolvió un token de acceso")
             raise HTTPException(status_code=502, detail="Spotify no devolvió un token válido")
 
-        user_info_response = requests.get(
-            "https://api.spotify.com/v1/me",
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
+        user_info_response = await spotify_client.get("/me", access_token=access_token)
 
         if user_info_response.status_code != 200:
             logger.error(f"No se pudo obtener la información del usuario de Spotify: {user_info_response.status_code}")
@@ -77,49 +128,20 @@ def login_spotify(request: Request, db: Session):
                 detail="El email de la cuenta de Spotify no coincide con el usuario autenticado."
             )
 
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            logger.warning(f"No se encontró usuario con email: {email}")
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-        # Validar que el ID de Spotify no esté ya asociado a otro usuario
-        existing_user = db.query(User).filter(User.spotify_user_id == spotify_user_id).first()
-        if existing_user and existing_user.email != user.email:
-            logger.warning(f"El ID de Spotify '{spotify_user_id}' ya está vinculado a otra cuenta: {existing_user.email}")
-            raise HTTPException(
-                status_code=409,
-                detail="Este usuario de Spotify ya está vinculado a otra cuenta en el sistema."
-            )
-
-        user.spotify_user_id = spotify_user_id
-        user.spotify_access_token = access_token
-        user.spotify_refresh_token = refresh_token
-        user.spotify_token_expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in))
-
-        db.commit()
-        logger.info(f"Usuario {user.email} conectado correctamente con Spotify")
+        # La sesión es síncrona: lectura, comprobación y guardado van al threadpool
+        await run_in_threadpool(
+            link_spotify_account, db, email, spotify_user_id, access_token, refresh_token, expires_in
+        )
+        logger.info(f"Usuario {email} conectado correctamente con Spotify")
 
         return {
             "success": True,
             "message": "Conexión con Spotify realizada correctamente"
         }
 
-    except IntegrityError as e:
-        db.rollback()
-        if e.orig and hasattr(e.orig, "args") and "duplicate key value violates unique constraint" in e.orig.args[0]:
-            logger.warning(f"El ID de Spotify '{spotify_user_id}' ya está vinculado a otra cuenta.")
-            raise HTTPException(
-                status_code=409,
-                detail="El ID de Spotify ya está vinculado a otra cuenta."
-            )
-        else:
-            logger.error(f"Error de integridad: {str(e)}")
-            raise HTTPException(status_code=400, detail="Error al guardar la información de Spotify")
-
     except HTTPException as e:
         raise e
 
     except Exception as e:
-        db.rollback()
         logger.exception(f"Error inesperado en login_spotify: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno del servidor al conectar con Spotify")
@@ -0,0 +1,193 @@
+# src/services/track_cache.py
+
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from src.models.track_cache_model import TrackSearchCache
+
+logger = logging.getLogger(__name__)
+
+TRACK_CACHE_MAX_ENTRIES = int(os.getenv("TRACK_CACHE_MAX_ENTRIES", 5000))
+TRACK_CACHE_TTL_HOURS = float(os.getenv("TRACK_CACHE_TTL_HOURS", 24 * 30))
+TRACK_CACHE_NEGATIVE_TTL_HOURS = float(os.getenv("TRACK_CACHE_NEGATIVE_TTL_HOURS", 24))
+
+# "feat. X" entre paréntesis/corchetes o al final del texto
+_FEAT_PATTERN = re.compile(
+    r"[\(\[]\s*(?:feat|ft|featuring)\b\.?[^\)\]]*[\)\]]|\s(?:feat|ft|featuring)\b\.?.*$"
+)
+_NON_WORD_PATTERN = re.compile(r"[^\w]+")
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza texto para comparar búsquedas: sin acentos, casefold y sin 'feat.'."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _FEAT_PATTERN.sub(" ", text.casefold())
+    return _NON_WORD_PATTERN.sub(" ", text).strip()
+
+
+def normalize_query(titulo: str, artista: str) -> str:
+    """Clave de caché para una búsqueda 'Título - Artista'."""
+    return f"{normalize_text(titulo)}|{normalize_text(artista)}"
+
+
+# INSERT ... ON CONFLICT de cada dialecto soportado (los mismos que en src/config/db.py)
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def upsert_rows(db: Session, rows: list):
+    """Inserta o actualiza filas de la caché en una sola sentencia.
+
+    Con ON CONFLICT DO UPDATE dos workers que guardan a la vez la misma clave no
+    chocan con la clave primaria, así que un guardado de la caché no hace
+    rollback del resto de la sesión de la petición.
+    """
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is None:
+        for row in rows:
+            db.merge(TrackSearchCache(**row))
+        return
+    statement = insert(TrackSearchCache).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[TrackSearchCache.query_key],
+        set_={
+            "track_uri": statement.excluded.track_uri,
+            "created_at": statement.excluded.created_at,
+            "expires_at": statement.excluded.expires_at,
+        },
+    ))
+
+
+class TrackURICache:
+    """Caché de búsquedas 'Título - Artista' → URI de Spotify.
+
+    Tiene dos niveles: un LRU acotado en memoria y una tabla persistente
+    compartida entre workers. También guarda resultados negativos (canción no
+    encontrada) con un TTL más corto.
+
+    `get_many` y `set_many` consultan la BD con una sesión síncrona, así que se
+    llaman desde el threadpool; el nivel en memoria se protege con un lock.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TRACK_CACHE_MAX_ENTRIES,
+        ttl: timedelta = timedelta(hours=TRACK_CACHE_TTL_HOURS),
+        negative_ttl: timedelta = timedelta(hours=TRACK_CACHE_NEGATIVE_TTL_HOURS),
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _ttl_for(self, uri: Optional[str]) -> timedelta:
+        return self.ttl if uri else self.negative_ttl
+
+    def _remember(self, key: str, uri: Optional[str], expires_in: float):
+        self._entries[key] = (uri, time.monotonic() + expires_in)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _from_memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        uri, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, uri
+
+    def get_many(self, keys: Iterable[str], db: Optional[Session] = None) -> Dict[str, Optional[str]]:
+        """Devuelve las claves conocidas. Un valor None es un resultado negativo cacheado."""
+        found = {}
+        pending = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                hit, uri = self._from_memory(key)
+                if hit:
+                    found[key] = uri
+                    self.memory_hits += 1
+                else:
+                    pending.append(key)
+
+        if pending and db is not None:
+            now = datetime.utcnow()
+            try:
+                rows = (
+                    db.query(TrackSearchCache)
+                    .filter(TrackSearchCache.query_key.in_(pending), TrackSearchCache.expires_at > now)
+                    .all()
+                )
+            except Exception as e:
+                logger.warning(f"[TRACK-CACHE] Error leyendo caché persistente: {e}")
+                rows = []
+            with self._lock:
+                for row in rows:
+                    found[row.query_key] = row.track_uri
+                    self._remember(row.query_key, row.track_uri, (row.expires_at - now).total_seconds())
+                    self.db_hits += 1
+
+        with self._lock:
+            self.misses += sum(1 for key in pending if key not in found)
+        return found
+
+    def set_many(self, results: Dict[str, Optional[str]], db: Optional[Session] = None):
+        """Guarda resultados resueltos en ambos niveles. Los errores de BD no se propagan."""
+        if not results:
+            return
+        now = datetime.utcnow()
+        with self._lock:
+            for key, uri in results.items():
+                self._remember(key, uri, self._ttl_for(uri).total_seconds())
+
+        if db is None:
+            return
+        rows = [
+            {"query_key": key, "track_uri": uri, "created_at": now, "expires_at": now + self._ttl_for(uri)}
+            for key, uri in results.items()
+        ]
+        try:
+            upsert_rows(db, rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[TRACK-CACHE] Error guardando caché persistente: {e}")
+
+    def clear(self):
+        """Vacía el nivel en memoria y reinicia los contadores."""
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.db_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Instancia compartida por todo el proceso
+track_uri_cache = TrackURICache()
@@ -1,24 +1,43 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from jose import jwt
 import os
-from dotenv import load_dotenv
+import threading
 
-load_dotenv()
+from src.config import dotenv_config
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Se leen al importar el módulo; los valores por defecto son los de dotenv_config
+SECRET_KEY = os.getenv("SECRET_KEY") or dotenv_config.SECRET_KEY
+ALGORITHM = os.getenv("ALGORITHM") or dotenv_config.ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES") or dotenv_config.ACCESS_TOKEN_EXPIRE_MINUTES)
+# Coste de bcrypt (2^rounds iteraciones). Los hashes con otro coste se rehacen al hacer login
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", 12))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib y python-jose se importan en el primer uso para no alargar el arranque
+pwd_context = None
+# Varios hilos del pool de hashing pueden pedir el contexto a la vez: se crea una sola vez
+_pwd_context_lock = threading.Lock()
+
+def get_pwd_context():
+    global pwd_context
+    if pwd_context is None:
+        with _pwd_context_lock:
+            if pwd_context is None:
+                from passlib.context import CryptContext
+                pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_BCRYPT_ROUNDS)
+    return pwd_context
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password, hashed_password):
+    """Verifica la contraseña. Devuelve (válida, hash nuevo o None si el guardado sigue al día)."""
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
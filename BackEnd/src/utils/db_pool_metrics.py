@@ -0,0 +1,161 @@
+# src/utils/db_pool_metrics.py
+
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolMetrics:
+    """Contadores de uso de un pool de conexiones, alimentados por eventos de SQLAlchemy.
+
+    Los eventos connect/checkout/checkin/invalidate dan los contadores; el tiempo
+    de espera por una conexión lo mide el pool instrumentado (ver TimedPoolMixin),
+    ya que SQLAlchemy no emite un evento antes del checkout.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.peak_checked_out = 0
+            self._checked_out = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    # --- Eventos del pool ---
+
+    def attach(self, pool: Pool):
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        if isinstance(pool, TimedPoolMixin):
+            pool.metrics = self
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self._checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self._checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self._checked_out = max(self._checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    # --- Lectura ---
+
+    def snapshot(self, pool: Pool) -> dict:
+        with self._lock:
+            stats = {
+                "pool": type(pool).__name__,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "wait": {
+                    "count": self.wait_count,
+                    "avg_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                    "max_ms": round(self.wait_max * 1000, 3),
+                    "total_ms": round(self.wait_total * 1000, 3),
+                },
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                # SQLAlchemy cuenta el overflow en negativo mientras el pool no está lleno
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+            })
+        else:
+            stats["checked_out"] = self._checked_out
+        return stats
+
+
+class TimedPoolMixin:
+    """Mide cuánto tarda el pool en entregar una conexión.
+
+    Incluye la espera cuando el pool está saturado y, si hay que abrir una
+    conexión nueva o hacer pre-ping, también ese tiempo.
+    """
+
+    metrics: Optional[PoolMetrics] = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # dispose() recrea el pool: se conservan las métricas acumuladas
+        new_pool = super().recreate()
+        new_pool.metrics = self.metrics
+        return new_pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Pool instrumentado equivalente a cada pool por defecto con cola
+TIMED_POOLS = {
+    QueuePool: TimedQueuePool,
+    AsyncAdaptedQueuePool: TimedAsyncAdaptedQueuePool,
+}
+
+
+def timed_pool_class(default_pool: type) -> Optional[type]:
+    """Devuelve la versión instrumentada del pool por defecto del dialecto, si es un pool con cola."""
+    return TIMED_POOLS.get(default_pool)
+
+
+def engine_pool(engine) -> Pool:
+    """Pool de un Engine o AsyncEngine."""
+    sync_engine: Engine = getattr(engine, "sync_engine", engine)
+    return sync_engine.pool
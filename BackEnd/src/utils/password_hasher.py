@@ -0,0 +1,91 @@
+# src/utils/password_hasher.py
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from src.utils.auth import hash_password, verify_and_update_password
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Hilos dedicados a bcrypt y hashes que pueden esperar turno; por encima, 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 8))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 1))
+
+
+class PasswordHasher:
+    """Ejecuta bcrypt en un pool de hilos propio y acotado, con control de admisión.
+
+    La espera es asíncrona, así que una ráfaga de logins no ocupa hilos del
+    threadpool de FastAPI: como mucho `workers + queue_size` peticiones esperan
+    un hash y el resto recibe un 503 con Retry-After al momento.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        queue_size: int = PASSWORD_HASH_QUEUE,
+        retry_after: int = PASSWORD_HASH_RETRY_AFTER,
+    ):
+        self.capacity = workers + queue_size
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Servidor ocupado, inténtalo de nuevo en unos segundos",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Ejecuta `fn` en el pool de hashing y espera el resultado (o 503 si está lleno)."""
+        self._admit()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # El hueco se libera cuando termina el hash, aunque se cancele la petición que lo espera
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await self.run(verify_and_update_password, password, hashed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "capacity": self.capacity,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+# Instancia compartida por todo el proceso
+password_hasher = PasswordHasher()
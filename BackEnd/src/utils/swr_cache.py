@@ -0,0 +1,109 @@
+# src/utils/swr_cache.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SWRCache:
+    """Caché en memoria con TTL, stale-while-revalidate y single-flight.
+
+    - Dentro del TTL el valor se sirve tal cual.
+    - Pasado el TTL, y mientras no supere `ttl + stale_ttl`, se sirve el valor
+      antiguo y se refresca en segundo plano.
+    - Las recargas concurrentes de una misma clave comparten una única tarea.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, max_entries: int = 10000, name: str = "cache"):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.name = name
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def peek(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """Devuelve (valor, fresco). El valor es None si no hay entrada utilizable."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age < self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value, True
+        if age < self.ttl + self.stale_ttl:
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return value, False
+
+        del self._entries[key]
+        self.misses += 1
+        return None, False
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.stale_hits = self.misses = self.loads = 0
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            return task
+
+        async def run():
+            try:
+                self.loads += 1
+                value = await loader()
+                self.set(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        return task
+
+    async def refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Recarga la clave y espera el resultado, uniéndose a una recarga en curso si la hay."""
+        # shield: si un solicitante se cancela, la recarga compartida sigue para el resto
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def refresh_in_background(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        """Lanza una recarga sin esperarla. Los errores se registran y se conserva el valor anterior."""
+        task = self._start_load(key, loader)
+
+        def log_failure(done: asyncio.Task):
+            if not done.cancelled() and done.exception() is not None:
+                logger.warning(f"[{self.name}] Error refrescando en segundo plano {key}: {done.exception()}")
+
+        task.add_done_callback(log_failure)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,68 @@
+# src/utils/token_budget.py
+
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Presupuesto de tokens del prompt (sistema + historial + pregunta) por modelo.
+# CHAT_CONTEXT_TOKEN_BUDGETS: "modelo=tokens,modelo=tokens"; el resto usa el valor por defecto
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 3000))
+CHAT_CONTEXT_TOKEN_BUDGETS = os.getenv("CHAT_CONTEXT_TOKEN_BUDGETS", "")
+# Tope de mensajes candidatos que se leen de la BD antes de aplicar el presupuesto
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", 50))
+
+# Tokens fijos que añade el formato de chat por cada mensaje (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def parse_budgets(raw: str) -> Dict[str, int]:
+    budgets = {}
+    for item in raw.split(","):
+        model, sep, tokens = item.strip().rpartition("=")
+        if sep and model and tokens.strip().isdigit():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+_budgets = parse_budgets(CHAT_CONTEXT_TOKEN_BUDGETS)
+
+
+def context_budget(model: str) -> int:
+    """Presupuesto de tokens del prompt para `model`."""
+    return _budgets.get(model, CHAT_CONTEXT_TOKEN_BUDGET)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimación rápida y local de los tokens de un texto.
+
+    Aproxima un tokenizador BPE: cada signo de puntuación cuenta como un token y
+    cada palabra como uno por cada 4 caracteres. Tiende a pasarse un poco, que
+    es lo seguro para no salirse del presupuesto.
+    """
+    if not text:
+        return 0
+    # Un signo de puntuación mide 1 carácter: cuenta como un token
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECES.findall(text))
+
+
+def message_tokens(content: Optional[str]) -> int:
+    """Tokens de un mensaje del historial, incluido el formato de chat."""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def fit_history(newest_first: Iterable[dict], budget: int) -> List[dict]:
+    """Elige los turnos más recientes que caben en `budget` y los devuelve en orden cronológico.
+
+    Cada mensaje lleva su coste en la clave "tokens". Se corta en el primer
+    mensaje que no cabe para no dejar huecos en la conversación.
+    """
+    selected = []
+    for message in newest_first:
+        if message["tokens"] > budget:
+            break
+        budget -= message["tokens"]
+        selected.append(message)
+    return selected[::-1]
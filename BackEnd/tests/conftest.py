@@ -2,26 +2,36 @@ import os
 import sys
 from dotenv import load_dotenv
 
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
 from fastapi.testclient import TestClient
 from datetime import datetime, timedelta
 import pytest
+import pytest_asyncio
 
 # Cargar variables de entorno desde .env
 dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.env"))
 load_dotenv(dotenv_path=dotenv_path)
 
+# Los tests crean las tablas con create_all en cada prueba, sin migraciones
+os.environ.setdefault("DB_SCHEMA_CHECK", "off")
+
 # Añadir carpeta padre al path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Importar app y dependencias
 from main import app as original_app
 from src.routes.auth_routes import get_current_user, get_db
-from src.config.db import Base, engine
+from src.config.db import Base, engine, ASYNC_DB_URL
 
 from src.models.auth_model import User
 from src.models.conversation_model import Conversation
 from src.models.message_model import Message
+from src.models.track_cache_model import TrackSearchCache
+from src.models.completion_cache_model import CompletionCacheEntry
+from src.models.schema_migration_model import SchemaMigration
+from src.services.principal_cache import principal_cache
 
 
 class FakeUser:
@@ -43,6 +53,18 @@ class FakeUser:
         self.spotify_user_id = spotify_user_id
         self.spotify_token_expires_at = datetime.utcnow() + timedelta(minutes=token_expiry_minutes)
 
+    @property
+    def spotify_connected(self):
+        return bool(self.spotify_user_id and self.spotify_access_token)
+
+
+@pytest.fixture(autouse=True)
+def clear_principal_cache():
+    # Cada test crea sus usuarios: no se reutilizan principales de otro test
+    principal_cache.clear()
+    yield
+    principal_cache.clear()
+
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -66,6 +88,32 @@ def db_session():
         connection.close()
 
 
+@pytest_asyncio.fixture
+async def async_db_session(db_session):
+    """Sesión async sobre la misma BD (tablas creadas por db_session), deshecha al terminar."""
+    async_engine = create_async_engine(ASYNC_DB_URL)
+
+    if async_engine.dialect.name == "sqlite":
+        # aiosqlite gestiona mal BEGIN/SAVEPOINT por defecto: se delega en SQLAlchemy
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def do_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(async_engine.sync_engine, "begin")
+        def do_begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+    async with async_engine.connect() as connection:
+        transaction = await connection.begin()
+        session = AsyncSession(bind=connection, expire_on_commit=False, join_transaction_mode="create_savepoint")
+        try:
+            yield session
+        finally:
+            await session.close()
+            await transaction.rollback()
+    await async_engine.dispose()
+
+
 @pytest.fixture
 def app(db_session):
     original_app.dependency_overrides[get_db] = lambda: db_session
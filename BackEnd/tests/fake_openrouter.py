@@ -0,0 +1,97 @@
+"""Servidor local que imita el endpoint de completions de OpenRouter.
+
+Responde según un guion: cada petición consume la siguiente respuesta de
+`FakeOpenRouter.script` (estado, cabeceras, retardo, JSON o fragmentos SSE);
+cuando se agota, repite la última. `models` permite un guion distinto por
+modelo. Se usa en los tests de resiliencia y se puede levantar a mano:
+
+    python -m tests.fake_openrouter   # http://127.0.0.1:8765/api/v1/chat/completions
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+COMPLETIONS_PATH = "/api/v1/chat/completions"
+
+
+def completion(content: str) -> dict:
+    return {"json": {"choices": [{"message": {"content": content}}]}}
+
+
+def failure(status: int, retry_after: Optional[str] = None, delay: float = 0) -> dict:
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return {"status": status, "json": {"error": {"code": status, "message": "fallo simulado"}}, "headers": headers, "delay": delay}
+
+
+def stream(*tokens: str) -> dict:
+    return {"sse": list(tokens)}
+
+
+class FakeOpenRouter:
+    def __init__(self, script: Optional[List[dict]] = None, models: Optional[Dict[str, List[dict]]] = None):
+        self.script = list(script or [completion("ok")])
+        self.models = {model: list(model_script) for model, model_script in (models or {}).items()}
+        self.requests: List[dict] = []
+        self.app = FastAPI()
+        self.app.post(COMPLETIONS_PATH)(self.handle)
+
+    def next_response(self, model: Optional[str] = None) -> dict:
+        script = self.models.get(model, self.script)
+        return script.pop(0) if len(script) > 1 else script[0]
+
+    def models_called(self) -> List[str]:
+        return [request.get("model") for request in self.requests]
+
+    async def handle(self, request: Request):
+        body = await request.json()
+        self.requests.append(body)
+        spec = self.next_response(body.get("model"))
+        if spec.get("delay"):
+            await asyncio.sleep(spec["delay"])
+
+        if "sse" in spec:
+            async def events():
+                for token in spec["sse"]:
+                    yield f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        if "json" in spec:
+            return JSONResponse(spec["json"], status_code=spec.get("status", 200), headers=spec.get("headers"))
+        return Response(spec.get("body", ""), status_code=spec.get("status", 200), headers=spec.get("headers"))
+
+
+@contextmanager
+def serve(fake: FakeOpenRouter, port: int = 0):
+    """Levanta `fake` en 127.0.0.1 en un hilo y devuelve la URL de completions."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", port))
+    server = uvicorn.Server(uvicorn.Config(fake.app, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}{COMPLETIONS_PATH}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        sock.close()
+
+
+if __name__ == "__main__":
+    with serve(FakeOpenRouter([completion("Respuesta de prueba")]), port=8765) as url:
+        print(f"Fake OpenRouter en {url} (Ctrl+C para salir)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
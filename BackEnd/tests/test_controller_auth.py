@@ -7,13 +7,16 @@ from unittest.mock import patch
 import pytest
 from fastapi import HTTPException
 from jose import jwt
+from passlib.context import CryptContext
 
+from src.controllers import auth_controller
 from src.controllers.auth_controller import (
     get_db,
     validate_email_address,
     register_user,
     login_user,
     get_current_user,
+    load_user,
     get_spotify_login_url,
     get_user_info,
     update_user_info,
@@ -21,6 +24,8 @@ from src.controllers.auth_controller import (
     ALGORITHM
 )
 from src.models.auth_model import User
+from src.services.principal_cache import Principal
+from src.utils import auth
 from src.utils.auth import hash_password, verify_password
 
 
@@ -49,14 +54,15 @@ def test_get_db_yield_and_closes():
 
 
 # --- Test: Registro exitoso de usuario ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.validate_email_address")
 @patch("src.controllers.auth_controller.create_access_token")
 @patch("src.controllers.auth_controller.get_spotify_login_url")
-def test_register_user_success(mock_spotify_url, mock_token, mock_validate_email, db_session):
+async def test_register_user_success(mock_spotify_url, mock_token, mock_validate_email, db_session):
     mock_token.return_value = "fake_token"
     mock_spotify_url.return_value = "https://spotify.com/auth"
 
-    result = register_user("new_user", "new@example.com", "password123", db_session)
+    result = await register_user("new_user", "new@example.com", "password123", db_session)
 
     assert result["access_token"] == "fake_token"
     assert result["redirect_url"] == "https://spotify.com/auth"
@@ -64,63 +70,87 @@ def test_register_user_success(mock_spotify_url, mock_token, mock_validate_email
 
 
 # --- Test: Registro falla si el email ya existe ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.validate_email_address")
-def test_register_user_email_exists(mock_validate, db_session):
+async def test_register_user_email_exists(mock_validate, db_session):
     db_session.add(User(username="existing", email="exists@example.com", hashed_password="hashed"))
     db_session.commit()
 
     with pytest.raises(HTTPException):
-        register_user("any", "exists@example.com", "pass", db_session)
+        await register_user("any", "exists@example.com", "pass", db_session)
 
 
 # --- Test: Registro falla si el username ya existe ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.validate_email_address")
-def test_register_user_username_exists(mock_validate, db_session):
+async def test_register_user_username_exists(mock_validate, db_session):
     db_session.add(User(username="existing_user", email="unique@example.com", hashed_password="hashed"))
     db_session.commit()
 
     with pytest.raises(HTTPException):
-        register_user("existing_user", "new@example.com", "pass", db_session)
+        await register_user("existing_user", "new@example.com", "pass", db_session)
 
 
 # --- Test: Registro falla si el email no es válido ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.validate_email_address")
-def test_register_user_invalid_email(mock_validate, db_session):
+async def test_register_user_invalid_email(mock_validate, db_session):
     mock_validate.side_effect = HTTPException(status_code=400, detail="Invalid email")
     with pytest.raises(HTTPException):
-        register_user("user", "invalid", "pass", db_session)
+        await register_user("user", "invalid", "pass", db_session)
 
 
 # --- Test: Login exitoso de usuario ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.get_spotify_login_url", return_value="https://spotify.com/login")
 @patch("src.controllers.auth_controller.create_access_token", return_value="mocked_token")
-def test_login_user_success(mock_token, mock_url, db_session):
+async def test_login_user_success(mock_token, mock_url, db_session):
     user = User(username="testuser", email="user@test.com", hashed_password=hash_password("securepassword"))
     db_session.add(user)
     db_session.commit()
 
-    result = login_user("user@test.com", "securepassword", db_session)
+    result = await login_user("user@test.com", "securepassword", db_session)
 
     assert result["access_token"] == "mocked_token"
     assert result["redirect_url"] == "https://spotify.com/login"
 
 
+# --- Test: Un hash con otro coste se rehace al hacer login ---
+@pytest.mark.asyncio
+@patch("src.controllers.auth_controller.get_spotify_login_url", return_value="https://spotify.com/login")
+@patch("src.controllers.auth_controller.create_access_token", return_value="mocked_token")
+async def test_login_user_rehashes_outdated_hash(mock_token, mock_url, db_session, monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("securepassword")
+    user = User(username="testuser", email="user@test.com", hashed_password=old_hash)
+    db_session.add(user)
+    db_session.commit()
+    monkeypatch.setattr(auth, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5))
+
+    await login_user("user@test.com", "securepassword", db_session)
+
+    db_session.refresh(user)
+    assert user.hashed_password.startswith("$2b$05$")
+    assert verify_password("securepassword", user.hashed_password)
+
+
 # --- Test: Login falla si el email no existe ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.create_access_token")
-def test_login_user_invalid_email(mock_token, db_session):
+async def test_login_user_invalid_email(mock_token, db_session):
     with pytest.raises(HTTPException):
-        login_user("missing@test.com", "pass", db_session)
+        await login_user("missing@test.com", "pass", db_session)
 
 
 # --- Test: Login falla si la contraseña es incorrecta ---
+@pytest.mark.asyncio
 @patch("src.controllers.auth_controller.get_spotify_login_url")
 @patch("src.controllers.auth_controller.create_access_token")
-def test_login_user_invalid_password(mock_token, mock_url, db_session):
+async def test_login_user_invalid_password(mock_token, mock_url, db_session):
     db_session.add(User(username="user", email="u@test.com", hashed_password=hash_password("correct")))
     db_session.commit()
 
     with pytest.raises(HTTPException):
-        login_user("u@test.com", "wrong", db_session)
+        await login_user("u@test.com", "wrong", db_session)
 
 
 # --- Test: get_current_user con token válido ---
@@ -135,6 +165,43 @@ def test_get_current_user_valid_token(db_session):
     assert result.email == user.email
 
 
+# --- Test: get_current_user devuelve un principal sin tokens y lo cachea ---
+def test_get_current_user_caches_principal(db_session):
+    user = User(username="testuser", email="testuser@test.com", hashed_password="hashed",
+                spotify_user_id="spotify_1", spotify_access_token="secret_token")
+    db_session.add(user)
+    db_session.commit()
+    token = jwt.encode({"sub": user.email, "exp": datetime.utcnow() + timedelta(minutes=15)}, SECRET_KEY, algorithm=ALGORITHM)
+
+    with patch("src.controllers.auth_controller.load_principal", wraps=auth_controller.load_principal) as mock_load:
+        first = get_current_user(token=token, db=db_session)
+        second = get_current_user(token=token, db=db_session)
+
+    assert mock_load.call_count == 1
+    assert first == second == Principal(user.id, "testuser", "testuser@test.com", "spotify_1", True)
+    assert not hasattr(first, "spotify_access_token")
+
+
+# --- Test: load_user carga la fila completa de un principal ---
+def test_load_user_from_principal(db_session):
+    user = User(username="testuser", email="testuser@test.com", hashed_password="hashed", spotify_access_token="secret_token")
+    db_session.add(user)
+    db_session.commit()
+
+    loaded = load_user(Principal(user.id, user.username, user.email, None, False), db_session)
+
+    assert loaded is user
+    assert loaded.spotify_access_token == "secret_token"
+    assert load_user(user, db_session) is user
+
+
+# --- Test: load_user con un principal cuyo usuario ya no existe ---
+def test_load_user_missing_row(db_session):
+    with pytest.raises(HTTPException) as exc:
+        load_user(Principal(999, "ghost", "ghost@test.com", None, False), db_session)
+    assert exc.value.status_code == 401
+
+
 # --- Test: get_current_user con token malformado ---
 def test_get_current_user_invalid_token_format(db_session):
     with pytest.raises(HTTPException):
@@ -172,44 +239,61 @@ def create_test_user(db, username="user1", email="user1@test.com", password="has
 
 
 # --- Test: Actualizar nombre de usuario ---
-def test_update_user_username_success(db_session):
+@pytest.mark.asyncio
+async def test_update_user_username_success(db_session):
     user = create_test_user(db_session)
     data = SimpleNamespace(username="newuser", email=None, password=None)
-    result = update_user_info(data, user, db_session)
+    result = await update_user_info(data, user, db_session)
     assert result["user"]["username"] == "newuser"
 
 
+# --- Test: Actualizar el perfil invalida el principal en caché ---
+@pytest.mark.asyncio
+async def test_update_user_info_invalidates_principal(db_session):
+    user = create_test_user(db_session)
+    token = jwt.encode({"sub": user.email, "exp": datetime.utcnow() + timedelta(minutes=15)}, SECRET_KEY, algorithm=ALGORITHM)
+    principal = get_current_user(token=token, db=db_session)
+
+    await update_user_info(SimpleNamespace(username="renamed", email=None, password=None), principal, db_session)
+
+    assert get_current_user(token=token, db=db_session).username == "renamed"
+
+
 # --- Test: Actualizar email ---
-def test_update_user_email_success(db_session):
+@pytest.mark.asyncio
+async def test_update_user_email_success(db_session):
     user = create_test_user(db_session)
     data = SimpleNamespace(username=None, email="newemail@test.com", password=None)
-    result = update_user_info(data, user, db_session)
+    result = await update_user_info(data, user, db_session)
     assert result["user"]["email"] == "newemail@test.com"
 
 
 # --- Test: Error al actualizar email ya existente ---
-def test_update_user_email_in_use_raises_error(db_session):
+@pytest.mark.asyncio
+async def test_update_user_email_in_use_raises_error(db_session):
     u1 = create_test_user(db_session, "u1", "u1@test.com")
     create_test_user(db_session, "u2", "taken@test.com")
     data = SimpleNamespace(username=None, email="taken@test.com", password=None)
 
     with pytest.raises(HTTPException):
-        update_user_info(data, u1, db_session)
+        await update_user_info(data, u1, db_session)
 
 
 # --- Test: Actualizar contraseña ---
-def test_update_user_password_success(db_session):
+@pytest.mark.asyncio
+async def test_update_user_password_success(db_session):
     user = create_test_user(db_session)
     data = SimpleNamespace(username=None, email=None, password="newpass123")
-    result = update_user_info(data, user, db_session)
+    result = await update_user_info(data, user, db_session)
     assert verify_password("newpass123", user.hashed_password)
 
 
 # --- Test: Sin cambios en actualización de usuario ---
-def test_update_user_no_changes(db_session):
+@pytest.mark.asyncio
+async def test_update_user_no_changes(db_session):
     user = create_test_user(db_session)
     data = SimpleNamespace(username=None, email=None, password=None)
-    result = update_user_info(data, user, db_session)
+    result = await update_user_info(data, user, db_session)
     assert result["message"] == "No se realizaron cambios"
 
 
@@ -228,6 +312,18 @@ def test_get_spotify_login_url_with_email(set_spotify_env):
     assert query["state"][0] == "user@example.com"
 
 
+# --- Test: URL de login Spotify con los parámetros de autorización ---
+def test_get_spotify_login_url_params():
+    url = get_spotify_login_url("user@example.com")
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parsed.query)
+
+    assert f"{parsed.scheme}://{parsed.netloc}{parsed.path}" == "https://accounts.spotify.com/authorize"
+    assert query["response_type"] == ["code"]
+    assert query["show_dialog"] == ["True"]
+    assert "user-top-read" in query["scope"][0].split()
+
+
 # --- Test: URL de login Spotify sin email ---
 def test_get_spotify_login_url_without_email(set_spotify_env):
     url = get_spotify_login_url()
@@ -1,64 +1,132 @@
+import asyncio
+import json
 import pytest
 from datetime import datetime, timedelta
 from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from unittest.mock import AsyncMock, patch
 
 from src.controllers.chat_controller import (
     get_conversation_by_id,
     start_conversation,
     save_message,
+    save_turn,
     handle_message,
+    stream_message,
+    build_chat_context,
     get_history,
+    get_history_page,
+    open_history_stream,
     delete_chat,
     get_conversations,
     rename_conversation,
+    schedule_title_generation,
+    generate_summary,
+    get_title_status,
+    _title_jobs,
+    _summary_jobs,
 )
+from src.controllers import chat_controller
 from src.models.conversation_model import Conversation
 from src.models.message_model import Message
+from src.services.openrouter_resilience import OpenRouterRateLimitError
+
+
+@pytest.fixture(autouse=True)
+def title_jobs(monkeypatch):
+    """Los trabajos de título y resumen no sobreviven al test."""
+    yield _title_jobs
+    for jobs in (_title_jobs, _summary_jobs):
+        for task in list(jobs.values()):
+            task.cancel()
+        jobs.clear()
+
+
+@pytest.fixture
+def db(async_db_session, monkeypatch):
+    """Sesión async del test; el trabajo en segundo plano usa la misma conexión."""
+    connection = async_db_session.bind
+    monkeypatch.setattr(
+        chat_controller,
+        "session_factory",
+        lambda: AsyncSession(bind=connection, expire_on_commit=False, join_transaction_mode="create_savepoint")
+    )
+    return async_db_session
+
+
+async def create(db, *objects):
+    db.add_all(objects)
+    await db.commit()
+    return objects[0] if len(objects) == 1 else objects
+
+
+async def fetch_title(db, chat_id):
+    return await db.scalar(select(Conversation.title).where(Conversation.id == chat_id))
 
 
 # --- Test: Crear conversación correctamente ---
 @pytest.mark.asyncio
-async def test_start_conversation_creates_chat(db_session):
-    result = await start_conversation("user1", db_session)
+async def test_start_conversation_creates_chat(db):
+    result = await start_conversation("user1", db)
     assert "chat_id" in result
-    chat = db_session.query(Conversation).filter_by(id=result["chat_id"]).first()
+    chat = await db.get(Conversation, result["chat_id"])
     assert chat and chat.user_id == "user1"
 
 
 # --- Test: Error al crear conversación (fallo DB) ---
 @pytest.mark.asyncio
-async def test_start_conversation_db_error_raises_http(db_session, monkeypatch):
-    monkeypatch.setattr(db_session, "add", lambda _: (_ for _ in ()).throw(Exception("DB fail")))
+async def test_start_conversation_db_error_raises_http(db, monkeypatch):
+    monkeypatch.setattr(db, "add", lambda _: (_ for _ in ()).throw(Exception("DB fail")))
     with pytest.raises(HTTPException) as exc:
-        await start_conversation("fail_user", db_session)
+        await start_conversation("fail_user", db)
     assert exc.value.status_code == 500
 
 
 # --- Test: Obtener conversación inexistente retorna None ---
-def test_get_conversation_by_id_not_found(db_session):
-    assert get_conversation_by_id(9999, db_session) is None
+@pytest.mark.asyncio
+async def test_get_conversation_by_id_not_found(db):
+    assert await get_conversation_by_id(9999, db) is None
 
 
 # --- Test: Guardar mensaje correctamente ---
 @pytest.mark.asyncio
-async def test_save_message_success(db_session):
-    conv = Conversation(user_id="1")
-    db_session.add(conv)
-    db_session.commit()
-    msg = await save_message(chat_id=conv.id, role="user", content="Hola", db=db_session)
+async def test_save_message_success(db):
+    conv = await create(db, Conversation(user_id="1"))
+    msg = await save_message(chat_id=conv.id, role="user", content="Hola", db=db)
     assert msg.content == "Hola" and msg.role == "user"
 
 
+# --- Test: Guardar turno en una sola transacción ---
+@pytest.mark.asyncio
+async def test_save_turn_inserts_both_messages(db):
+    conv = await create(db, Conversation(user_id="1"))
+    assert await save_turn(conv.id, "Pregunta", "Respuesta", db) is None
+
+    ids = await save_turn(conv.id, "Otra", "Más", db, return_ids=True)
+    history = await get_history(conv.id, db)
+    assert [(m["role"], m["content"]) for m in history] == [
+        ("user", "Pregunta"), ("assistant", "Respuesta"), ("user", "Otra"), ("assistant", "Más")
+    ]
+    assert ids == [m["id"] for m in history[2:]]
+
+
+# --- Test: Si falla el guardado del turno no queda ningún mensaje ---
+@pytest.mark.asyncio
+async def test_save_turn_failure_saves_nothing(db):
+    chat_id = (await create(db, Conversation(user_id="1"))).id
+    with patch.object(db, "commit", AsyncMock(side_effect=Exception("DB fail"))):
+        with pytest.raises(Exception):
+            await save_turn(chat_id, "Pregunta", "Respuesta", db)
+    assert await db.scalar(select(Message.id).where(Message.conversation_id == chat_id)) is None
+
+
 # --- Test: Mensaje manejado correctamente ---
 @pytest.mark.asyncio
-async def test_handle_message_success(db_session, authenticated_user):
-    conv = Conversation(user_id=authenticated_user.id)
-    db_session.add(conv)
-    db_session.commit()
+async def test_handle_message_success(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
     with patch("src.controllers.chat_controller.agent.chat", new_callable=AsyncMock) as mock_chat, \
-         patch("src.controllers.chat_controller.get_user_full_top_info") as mock_info, \
-         patch("src.controllers.chat_controller.save_message", new_callable=AsyncMock) as mock_save:
+         patch("src.controllers.chat_controller.get_user_full_top_info") as mock_info:
         mock_chat.return_value = "respuesta generada"
         mock_info.return_value = {
             "top_artists": {
@@ -71,24 +139,49 @@ async def test_handle_message_success(db_session, authenticated_user):
                 "semanal": ["G"], "seis_meses": ["G2"], "todo_el_tiempo": ["G3"]
             }
         }
-        result = await handle_message(conv.id, "Hola", authenticated_user, db_session)
+        result = await handle_message(conv.id, "Hola", authenticated_user, db)
         assert result["answer"] == "respuesta generada"
 
+    history = await get_history(conv.id, db)
+    assert [(m["role"], m["content"]) for m in history] == [("user", "Hola"), ("assistant", "respuesta generada")]
+
+
+# --- Test: El contexto incluye los turnos que caben en el presupuesto de tokens ---
+@pytest.mark.asyncio
+async def test_build_chat_context_respects_token_budget(db, authenticated_user, monkeypatch):
+    conv, _ = await create_history(db, 8)
+    await save_turn(conv.id, "x " * 400, "corta", db)
+    await save_turn(conv.id, "pregunta", "respuesta", db)
+
+    monkeypatch.setattr(chat_controller, "context_budget", lambda model: 10_000)
+    with patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        _, history, extra_context = await build_chat_context(conv.id, authenticated_user, db, question="Hola")
+    assert len(history) == 12
+    assert history[-1] == {"role": "assistant", "content": "respuesta"}
+
+    # Solo cabe el último turno: el mensaje largo corta el historial
+    fixed = (
+        chat_controller.message_tokens(chat_controller.agent.get_context("normal") + extra_context)
+        + chat_controller.message_tokens("Hola")
+    )
+    monkeypatch.setattr(chat_controller, "context_budget", lambda model: fixed + 100)
+    with patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        _, history, _ = await build_chat_context(conv.id, authenticated_user, db, question="Hola")
+    assert [m["content"] for m in history] == ["corta", "pregunta", "respuesta"]
+
 
 # --- Test: Error si conversación no existe al manejar mensaje ---
 @pytest.mark.asyncio
-async def test_handle_message_not_found(db_session, authenticated_user):
+async def test_handle_message_not_found(db, authenticated_user):
     with pytest.raises(HTTPException) as exc:
-        await handle_message(9999, "Hola", authenticated_user, db_session)
+        await handle_message(9999, "Hola", authenticated_user, db)
     assert exc.value.status_code == 404
 
 
 # --- Test: Error de IA al manejar mensaje ---
 @pytest.mark.asyncio
-async def test_handle_message_ia_error(db_session, authenticated_user):
-    conv = Conversation(user_id=authenticated_user.id)
-    db_session.add(conv)
-    db_session.commit()
+async def test_handle_message_ia_error(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
     with patch("src.controllers.chat_controller.agent.chat", new_callable=AsyncMock) as mock_chat, \
          patch("src.controllers.chat_controller.get_user_full_top_info") as mock_info:
         mock_chat.side_effect = Exception("Fallo IA")
@@ -104,68 +197,393 @@ async def test_handle_message_ia_error(db_session, authenticated_user):
             }
         }
         with pytest.raises(HTTPException) as exc:
-            await handle_message(conv.id, "Hola", authenticated_user, db_session)
+            await handle_message(conv.id, "Hola", authenticated_user, db)
         assert exc.value.status_code == 500
 
 
+# --- Test: OpenRouter saturado devuelve 503 con Retry-After ---
+@pytest.mark.asyncio
+async def test_handle_message_rate_limited_returns_503(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    with patch("src.controllers.chat_controller.agent.chat", new_callable=AsyncMock) as mock_chat, \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        mock_chat.side_effect = OpenRouterRateLimitError("límite", 429, retry_after=12)
+        with pytest.raises(HTTPException) as exc:
+            await handle_message(conv.id, "Hola", authenticated_user, db)
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "12"}
+
+
 # --- Test: Obtener historial ordenado por fecha ---
-def test_get_history_returns_ordered_messages(db_session):
-    conv = Conversation(user_id=1)
-    db_session.add(conv)
-    db_session.commit()
-    db_session.add_all([
+@pytest.mark.asyncio
+async def test_get_history_returns_ordered_messages(db):
+    conv = await create(db, Conversation(user_id=1))
+    await create(
+        db,
         Message(conversation_id=conv.id, role="user", content="1", created_at=datetime.utcnow() - timedelta(minutes=2)),
         Message(conversation_id=conv.id, role="assistant", content="2", created_at=datetime.utcnow() - timedelta(minutes=1)),
         Message(conversation_id=conv.id, role="user", content="3", created_at=datetime.utcnow())
-    ])
-    db_session.commit()
-    history = get_history(conv.id, db_session)
+    )
+    history = await get_history(conv.id, db)
     assert [m["content"] for m in history] == ["1", "2", "3"]
 
 
+async def create_history(db, count: int):
+    conv = await create(db, Conversation(user_id=1))
+    start = datetime.utcnow() - timedelta(minutes=count)
+    messages = await create(db, *[
+        Message(conversation_id=conv.id, role="user", content=str(i), created_at=start + timedelta(minutes=i))
+        for i in range(count)
+    ])
+    return conv, [m.id for m in messages]
+
+
+# --- Test: Página por defecto con los mensajes más recientes ---
+@pytest.mark.asyncio
+async def test_get_history_page_latest(db):
+    conv, _ = await create_history(db, 5)
+    page = await get_history_page(conv.id, db, limit=2)
+    assert [m["content"] for m in page["messages"]] == ["3", "4"]
+    assert page["has_more"] is True
+
+
+# --- Test: Paginar hacia atrás y hacia delante por cursor ---
+@pytest.mark.asyncio
+async def test_get_history_page_before_and_after(db):
+    conv, ids = await create_history(db, 5)
+
+    older = await get_history_page(conv.id, db, before=ids[3], limit=2)
+    assert [m["content"] for m in older["messages"]] == ["1", "2"]
+    assert older["has_more"] is True
+
+    oldest = await get_history_page(conv.id, db, before=ids[1], limit=2)
+    assert [m["content"] for m in oldest["messages"]] == ["0"]
+    assert oldest["has_more"] is False
+
+    newer = await get_history_page(conv.id, db, after=ids[1], limit=2)
+    assert [m["content"] for m in newer["messages"]] == ["2", "3"]
+    assert newer["has_more"] is True
+
+
+# --- Test: Mensajes con la misma fecha se desempatan por id ---
+@pytest.mark.asyncio
+async def test_get_history_page_same_timestamp(db):
+    conv = await create(db, Conversation(user_id=1))
+    now = datetime.utcnow()
+    messages = await create(db, *[
+        Message(conversation_id=conv.id, role="user", content=str(i), created_at=now) for i in range(3)
+    ])
+    page = await get_history_page(conv.id, db, after=messages[0].id, limit=5)
+    assert [m["content"] for m in page["messages"]] == ["1", "2"]
+
+
+# --- Test: Cursor de otra conversación es inválido ---
+@pytest.mark.asyncio
+async def test_get_history_page_foreign_cursor_raises(db):
+    conv, _ = await create_history(db, 2)
+    _, other_ids = await create_history(db, 2)
+    with pytest.raises(HTTPException) as exc:
+        await get_history_page(conv.id, db, before=other_ids[0])
+    assert exc.value.status_code == 400
+
+
+# --- Test: Historial en streaming NDJSON ---
+@pytest.mark.asyncio
+async def test_open_history_stream_yields_ndjson(db):
+    conv, ids = await create_history(db, 4)
+
+    lines = await open_history_stream(conv.id, db, after=ids[0])
+    rows = [json.loads(line) for chunk in [c async for c in lines] for line in chunk.splitlines()]
+
+    assert [r["content"] for r in rows] == ["1", "2", "3"]
+    assert set(rows[0]) == {"id", "role", "content", "timestamp"}
+    assert rows[0]["id"] == ids[1]
+
+
 # --- Test: Eliminar conversación correctamente ---
-def test_delete_chat_success(db_session):
-    conv = Conversation(user_id=1)
-    db_session.add(conv)
-    db_session.commit()
-    db_session.add(Message(conversation_id=conv.id, role="user", content="Hola"))
-    db_session.commit()
-    result = delete_chat(conv.id, db_session)
+@pytest.mark.asyncio
+async def test_delete_chat_success(db):
+    conv = await create(db, Conversation(user_id=1))
+    await create(db, Message(conversation_id=conv.id, role="user", content="Hola"))
+    result = await delete_chat(conv.id, db)
     assert result["message"] == "Conversation deleted"
-    assert db_session.query(Conversation).filter_by(id=conv.id).first() is None
+    assert await fetch_title(db, conv.id) is None
+    assert await db.scalar(select(Message.id).where(Message.conversation_id == conv.id)) is None
 
 
 # --- Test: Error al eliminar conversación inexistente ---
-def test_delete_chat_not_found_raises(db_session):
+@pytest.mark.asyncio
+async def test_delete_chat_not_found_raises(db):
     with pytest.raises(HTTPException) as exc:
-        delete_chat(999, db_session)
+        await delete_chat(999, db)
     assert exc.value.status_code == 404
 
 
 # --- Test: Obtener conversaciones ordenadas por fecha ---
-def test_get_conversations_returns_ordered_list(db_session):
-    db_session.add_all([
+@pytest.mark.asyncio
+async def test_get_conversations_returns_ordered_list(db):
+    await create(
+        db,
         Conversation(user_id=1, created_at=datetime.utcnow() - timedelta(days=2), title="Primera"),
         Conversation(user_id=1, created_at=datetime.utcnow() - timedelta(days=1), title="Segunda"),
         Conversation(user_id=1, created_at=datetime.utcnow(), title="Tercera")
-    ])
-    db_session.commit()
-    result = get_conversations(user_id="1", db=db_session)
+    )
+    result = await get_conversations(user_id=1, db=db)
     assert [c["title"] for c in result] == ["Tercera", "Segunda", "Primera"]
 
 
 # --- Test: Renombrar conversación correctamente ---
-def test_rename_conversation_success(db_session):
-    conv = Conversation(user_id=1, title="Antiguo")
-    db_session.add(conv)
-    db_session.commit()
-    result = rename_conversation(conv.id, "Nuevo", db_session)
+@pytest.mark.asyncio
+async def test_rename_conversation_success(db):
+    conv = await create(db, Conversation(user_id=1, title="Antiguo"))
+    result = await rename_conversation(conv.id, "Nuevo", db)
     assert result["message"] == "Title updated"
-    assert db_session.get(Conversation, conv.id).title == "Nuevo"
+    assert await fetch_title(db, conv.id) == "Nuevo"
 
 
 # --- Test: Error al renombrar conversación inexistente ---
-def test_rename_conversation_not_found(db_session):
+@pytest.mark.asyncio
+async def test_rename_conversation_not_found(db):
+    with pytest.raises(HTTPException) as exc:
+        await rename_conversation(9999, "Nuevo", db)
+    assert exc.value.status_code == 404
+
+
+TOP_INFO_EMPTY = {
+    "top_artists": {"semanal": [], "seis_meses": [], "todo_el_tiempo": []},
+    "top_tracks": {"semanal": [], "seis_meses": [], "todo_el_tiempo": []},
+    "top_genres": {"semanal": [], "seis_meses": [], "todo_el_tiempo": []},
+}
+
+
+def fake_stream(*tokens, error=None):
+    async def stream(*args, **kwargs):
+        for token in tokens:
+            yield token
+        if error:
+            raise error
+    return stream
+
+
+# --- Test: Stream reenvía tokens y guarda el turno al terminar ---
+@pytest.mark.asyncio
+async def test_stream_message_forwards_tokens_and_persists(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id, title="Mi chat"))
+    with patch("src.controllers.chat_controller.agent.chat_stream", fake_stream("Hola", " mundo")), \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        events = await stream_message(conv.id, "Pregunta", authenticated_user, db)
+        received = [event async for event in events]
+
+    assert received[0] == 'event: token\ndata: {"content": "Hola"}\n\n'
+    assert received[1] == 'event: token\ndata: {"content": " mundo"}\n\n'
+    assert received[-1].startswith("event: done")
+    saved = (await db.execute(
+        select(Message.role, Message.content).where(Message.conversation_id == conv.id).order_by(Message.id)
+    )).all()
+    assert [tuple(row) for row in saved] == [("user", "Pregunta"), ("assistant", "Hola mundo")]
+
+
+# --- Test: Si el cliente se desconecta se guarda la respuesta parcial ---
+@pytest.mark.asyncio
+async def test_stream_message_persists_on_disconnect(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id, title="Mi chat"))
+    with patch("src.controllers.chat_controller.agent.chat_stream", fake_stream("Parcial", " nunca")), \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        events = await stream_message(conv.id, "Pregunta", authenticated_user, db)
+        first = await events.__anext__()
+        await events.aclose()
+
+    assert "Parcial" in first
+    saved = await db.scalar(select(Message.content).where(Message.conversation_id == conv.id, Message.role == "assistant"))
+    assert saved == "Parcial"
+
+
+# --- Test: Error de IA en mitad del stream emite evento error ---
+@pytest.mark.asyncio
+async def test_stream_message_ia_error_emits_error_event(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id, title="Mi chat"))
+    with patch("src.controllers.chat_controller.agent.chat_stream", fake_stream(error=Exception("Fallo IA"))), \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        events = await stream_message(conv.id, "Pregunta", authenticated_user, db)
+        received = [event async for event in events]
+
+    assert received[0].startswith("event: error")
+    assert await db.scalar(select(Message.id).where(Message.conversation_id == conv.id)) is None
+
+
+# --- Test: Stream de conversación inexistente devuelve 404 antes de empezar ---
+@pytest.mark.asyncio
+async def test_stream_message_not_found(db, authenticated_user):
     with pytest.raises(HTTPException) as exc:
-        rename_conversation(9999, "Nuevo", db_session)
+        await stream_message(9999, "Hola", authenticated_user, db)
     assert exc.value.status_code == 404
+
+
+def chat_with_title(answer: str, title, release: asyncio.Event = None):
+    """Simula agent.chat: responde a la pregunta y, para el prompt de título, espera a `release`."""
+    async def fake_chat(prompt, messages=[], **kwargs):
+        if prompt.endswith("Título:"):
+            if release is not None:
+                await release.wait()
+            if isinstance(title, Exception):
+                raise title
+            return title
+        return answer
+    return AsyncMock(side_effect=fake_chat)
+
+
+# --- Test: La respuesta no espera al título, que se genera en segundo plano ---
+@pytest.mark.asyncio
+async def test_handle_message_generates_title_in_background(db, authenticated_user, title_jobs):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    default_title = conv.title
+    release = asyncio.Event()
+    with patch("src.controllers.chat_controller.agent.chat", chat_with_title("respuesta", "Jazz nocturno", release)), \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        result = await handle_message(conv.id, "Hola", authenticated_user, db)
+
+        assert result == {"answer": "respuesta", "title_changed": False, "title_pending": True}
+        assert await fetch_title(db, conv.id) == default_title
+
+        release.set()
+        assert await title_jobs[conv.id] == "Jazz nocturno"
+
+    assert await fetch_title(db, conv.id) == "Jazz nocturno"
+
+
+# --- Test: Mensajes concurrentes comparten un único trabajo de título ---
+@pytest.mark.asyncio
+async def test_schedule_title_generation_single_flight(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    release = asyncio.Event()
+    mock_chat = chat_with_title("respuesta", "Rock clásico", release)
+    with patch("src.controllers.chat_controller.agent.chat", mock_chat):
+        first = schedule_title_generation(conv.id, conv.title, [], "Hola")
+        second = schedule_title_generation(conv.id, conv.title, [], "Otra pregunta")
+        assert first is second
+
+        release.set()
+        await first
+
+    assert mock_chat.await_count == 1
+
+
+# --- Test: Un renombrado manual durante la generación no se sobrescribe ---
+@pytest.mark.asyncio
+async def test_generated_title_does_not_override_manual_rename(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    release = asyncio.Event()
+    with patch("src.controllers.chat_controller.agent.chat", chat_with_title("respuesta", "Título IA", release)):
+        task = schedule_title_generation(conv.id, conv.title, [], "Hola")
+        await rename_conversation(conv.id, "Mi título", db)
+        release.set()
+        assert await task is None
+
+    assert await fetch_title(db, conv.id) == "Mi título"
+
+
+# --- Test: Un fallo generando el título no afecta a la respuesta ---
+@pytest.mark.asyncio
+async def test_title_failure_does_not_affect_answer(db, authenticated_user, title_jobs):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    with patch("src.controllers.chat_controller.agent.chat", chat_with_title("respuesta", Exception("Fallo IA"))), \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        result = await handle_message(conv.id, "Hola", authenticated_user, db)
+        assert result["answer"] == "respuesta"
+        assert await title_jobs[conv.id] is None
+
+
+# --- Test: Las conversaciones con título propio no lanzan trabajo ---
+def test_schedule_title_generation_skips_custom_title():
+    assert schedule_title_generation(1, "Mi playlist favorita", [], "Hola") is None
+
+
+# --- Test: El stream envía 'done' antes del evento 'title' ---
+@pytest.mark.asyncio
+async def test_stream_message_sends_title_after_done(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    with patch("src.controllers.chat_controller.agent.chat_stream", fake_stream("Hola")), \
+         patch("src.controllers.chat_controller.agent.chat", chat_with_title("", "Pop ochentero")), \
+         patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        events = await stream_message(conv.id, "Pregunta", authenticated_user, db)
+        received = [event async for event in events]
+
+    assert [e.split("\n")[0] for e in received] == ["event: token", "event: done", "event: title"]
+    assert '"title_pending": true' in received[1]
+    assert "Pop ochentero" in received[2]
+
+
+# --- Test: El estado del título espera al trabajo en curso ---
+@pytest.mark.asyncio
+async def test_get_title_status_waits_for_pending_job(db, authenticated_user):
+    conv = await create(db, Conversation(user_id=authenticated_user.id))
+    with patch("src.controllers.chat_controller.agent.chat", chat_with_title("respuesta", "Indie")):
+        schedule_title_generation(conv.id, conv.title, [], "Hola")
+        status = await get_title_status(conv.id, db, wait=5)
+
+    assert status == {"title": "Indie", "title_pending": False}
+
+
+# --- Test: El resumen sustituye a los mensajes que ya cubre ---
+@pytest.mark.asyncio
+async def test_build_chat_context_prepends_summary(db, authenticated_user):
+    conv, ids = await create_history(db, 6)
+    conv.summary = "Le gusta el jazz"
+    conv.summary_until_id = ids[3]
+    await db.commit()
+
+    with patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY):
+        _, history, _ = await build_chat_context(conv.id, authenticated_user, db, question="Hola")
+
+    assert history[0]["role"] == "system" and "Le gusta el jazz" in history[0]["content"]
+    assert [m["content"] for m in history[1:]] == ["4", "5"]
+
+
+# --- Test: Con muchos mensajes sin resumir se lanza el resumen en segundo plano ---
+@pytest.mark.asyncio
+async def test_build_chat_context_schedules_summary(db, authenticated_user, monkeypatch):
+    conv, _ = await create_history(db, 4)
+    monkeypatch.setattr(chat_controller, "CHAT_SUMMARY_TRIGGER_MESSAGES", 4)
+
+    with patch("src.controllers.chat_controller.get_user_full_top_info", new_callable=AsyncMock, return_value=TOP_INFO_EMPTY), \
+         patch("src.controllers.chat_controller.generate_summary", new_callable=AsyncMock) as mock_summary:
+        await build_chat_context(conv.id, authenticated_user, db, question="Hola")
+        await _summary_jobs[conv.id]
+
+    mock_summary.assert_called_once_with(conv.id, None)
+
+
+# --- Test: El resumen incorpora los mensajes antiguos y conserva los recientes ---
+@pytest.mark.asyncio
+async def test_generate_summary_updates_conversation(db, monkeypatch):
+    conv, ids = await create_history(db, 5)
+    conv.summary = "Resumen viejo"
+    conv.summary_until_id = ids[0]
+    await db.commit()
+    monkeypatch.setattr(chat_controller, "CHAT_SUMMARY_KEEP_MESSAGES", 2)
+
+    with patch("src.controllers.chat_controller.summary_agent.chat", new_callable=AsyncMock, return_value=" Resumen nuevo ") as mock_chat:
+        summary = await generate_summary(conv.id, ids[0])
+
+    prompt = mock_chat.call_args.args[0]
+    assert "Resumen viejo" in prompt
+    assert "user: 1\nuser: 2\n" in prompt and "user: 3" not in prompt
+    assert summary == "Resumen nuevo"
+    row = (await db.execute(
+        select(Conversation.summary, Conversation.summary_until_id).where(Conversation.id == conv.id)
+    )).one()
+    assert tuple(row) == ("Resumen nuevo", ids[2])
+
+
+# --- Test: Si otro resumen se adelantó, el nuevo se descarta ---
+@pytest.mark.asyncio
+async def test_generate_summary_compare_and_set(db, monkeypatch):
+    conv, ids = await create_history(db, 5)
+    conv.summary_until_id = ids[1]
+    await db.commit()
+    monkeypatch.setattr(chat_controller, "CHAT_SUMMARY_KEEP_MESSAGES", 0)
+
+    with patch("src.controllers.chat_controller.summary_agent.chat", new_callable=AsyncMock, return_value="Resumen"):
+        assert await generate_summary(conv.id, None) is None
+
+    assert await db.scalar(select(Conversation.summary).where(Conversation.id == conv.id)) is None
@@ -1,19 +1,40 @@
+import asyncio
+import threading
+
 import pytest
 from fastapi import HTTPException
 from datetime import datetime, timedelta
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from sqlalchemy import inspect as sa_inspect, update
 
+from src.controllers import spotify_controller
 from src.controllers.spotify_controller import (
     refresh_spotify_token,
     get_valid_spotify_token,
     get_all_user_playlists,
     update_playlist,
     unfollow_playlist_logic,
-    get_user_full_top_info
+    get_user_full_top_info,
+    resolve_track_uris,
+    top_info_cache,
+    fetch_playlist_tracks,
+    encode_cursor,
+    decode_cursor,
+    get_user_playlists_page,
+    get_playlist_tracks_page,
+    open_playlist_tracks_stream
 )
 from src.models.auth_model import User
 
 
+@pytest.fixture(autouse=True)
+def clear_top_info_cache():
+    top_info_cache.clear()
+    yield
+    top_info_cache.clear()
+
+
 # === Helpers ===
 def create_user_with_token():
     return User(
@@ -52,75 +73,209 @@ def create_user_with_spotify():
 
 
 # --- Test: Refrescar token correctamente ---
-@patch("src.controllers.spotify_controller.requests.post")
-def test_refresh_spotify_token_success(mock_post, db_session):
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.post", new_callable=AsyncMock)
+async def test_refresh_spotify_token_success(mock_post, db_session):
     user = create_user_with_token()
+    db_session.add(user)
+    db_session.commit()
     mock_post.return_value = MagicMock(status_code=200, json=lambda: {
         "access_token": "new_token", "expires_in": 3600
     })
-    token = refresh_spotify_token(user, db_session)
+    token = await refresh_spotify_token(user, db_session)
     assert token == "new_token"
+    # Recargado en el hilo del guardado: leerlo no consulta la BD
+    assert {"email", "spotify_access_token"}.isdisjoint(sa_inspect(user).expired_attributes)
+    assert user.spotify_access_token == "new_token"
+
+
+# --- Test: El guardado del token refrescado no bloquea el event loop ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.post", new_callable=AsyncMock)
+async def test_refresh_spotify_token_saves_in_threadpool(mock_post):
+    user = create_user_with_token()
+    db = MagicMock()
+    threads = []
+    db.execute.side_effect = lambda *args, **kwargs: threads.append(threading.get_ident()) or MagicMock(rowcount=1)
+    mock_post.return_value = MagicMock(status_code=200, json=lambda: {"access_token": "new_token", "expires_in": 3600})
+
+    assert await refresh_spotify_token(user, db) == "new_token"
+    assert threads and threading.get_ident() not in threads
+    db.commit.assert_called_once()
 
 
 # --- Test: Error 400 al refrescar token ---
-@patch("src.controllers.spotify_controller.requests.post")
-def test_refresh_spotify_token_spotify_error(mock_post, db_session):
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.post", new_callable=AsyncMock)
+async def test_refresh_spotify_token_spotify_error(mock_post, db_session):
     user = create_user_with_token()
     mock_post.return_value = MagicMock(status_code=400, text="invalid_request")
     with pytest.raises(HTTPException) as exc:
-        refresh_spotify_token(user, db_session)
+        await refresh_spotify_token(user, db_session)
     assert exc.value.status_code == 502
 
 
 # --- Test: No hay refresh token disponible ---
-def test_refresh_spotify_token_no_refresh_token(db_session):
+@pytest.mark.asyncio
+async def test_refresh_spotify_token_no_refresh_token(db_session):
     user = create_user(refresh_token=None)
     with pytest.raises(HTTPException) as exc:
-        refresh_spotify_token(user, db_session)
+        await refresh_spotify_token(user, db_session)
     assert exc.value.status_code == 401
 
 
 # --- Test: Excepción inesperada al refrescar token ---
-@patch("src.controllers.spotify_controller.requests.post", side_effect=Exception("Crash"))
-def test_refresh_spotify_token_unexpected_exception(mock_post, db_session):
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.post", new_callable=AsyncMock, side_effect=Exception("Crash"))
+async def test_refresh_spotify_token_unexpected_exception(mock_post, db_session):
     user = create_user_with_token()
     with pytest.raises(HTTPException) as exc:
-        refresh_spotify_token(user, db_session)
+        await refresh_spotify_token(user, db_session)
     assert exc.value.status_code == 500
 
 
 # --- Test: Token válido aún vigente ---
-def test_get_valid_spotify_token_valid_token(db_session):
+@pytest.mark.asyncio
+async def test_get_valid_spotify_token_valid_token(db_session):
     user = create_user(expires_at=datetime.utcnow() + timedelta(minutes=10))
-    assert get_valid_spotify_token(user, db_session) == "token"
+    assert await get_valid_spotify_token(user, db_session) == "token"
 
 
 # --- Test: Token expirado se refresca ---
+@pytest.mark.asyncio
 @patch("src.controllers.spotify_controller.refresh_spotify_token", return_value="new_token")
-def test_get_valid_spotify_token_expired_token(mock_refresh, db_session):
+async def test_get_valid_spotify_token_expired_token(mock_refresh, db_session):
     user = create_user(expires_at=datetime.utcnow() - timedelta(minutes=1))
-    assert get_valid_spotify_token(user, db_session) == "new_token"
+    assert await get_valid_spotify_token(user, db_session) == "new_token"
 
 
 # --- Test: Token sin expiración se refresca ---
+@pytest.mark.asyncio
 @patch("src.controllers.spotify_controller.refresh_spotify_token", return_value="refreshed_token")
-def test_get_valid_spotify_token_missing_expiry(mock_refresh, db_session):
+async def test_get_valid_spotify_token_missing_expiry(mock_refresh, db_session):
     user = create_user(expires_at=None)
-    assert get_valid_spotify_token(user, db_session) == "refreshed_token"
+    assert await get_valid_spotify_token(user, db_session) == "refreshed_token"
 
 
 # --- Test: Usuario sin token lanza error ---
-def test_get_valid_spotify_token_no_access_token(db_session):
+@pytest.mark.asyncio
+async def test_get_valid_spotify_token_no_access_token(db_session):
     user = create_user(access_token=None)
     with pytest.raises(HTTPException) as exc:
-        get_valid_spotify_token(user, db_session)
+        await get_valid_spotify_token(user, db_session)
     assert exc.value.status_code == 401
 
 
+# --- Test: La fila del principal se carga fuera del event loop ---
+@pytest.mark.asyncio
+async def test_get_valid_spotify_token_loads_user_in_threadpool(db_session):
+    from src.services.principal_cache import Principal
+
+    user = create_user(expires_at=datetime.utcnow() + timedelta(hours=1))
+    threads = []
+
+    def load_user(principal, db):
+        threads.append(threading.get_ident())
+        return user
+
+    principal = Principal(1, "testuser", "user@test.com", None, True)
+    with patch("src.controllers.spotify_controller.load_user", side_effect=load_user):
+        assert await get_valid_spotify_token(principal, db_session) == "token"
+
+    assert threads and threading.get_ident() not in threads
+
+
+# --- Test: Peticiones concurrentes con el token caducado hacen un único refresh ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.post", new_callable=AsyncMock)
+async def test_get_valid_spotify_token_single_flight(mock_post, db_session):
+    user = create_user(expires_at=datetime.utcnow() - timedelta(minutes=1))
+    db_session.add(user)
+    db_session.commit()
+
+    async def slow_refresh(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return MagicMock(status_code=200, json=lambda: {
+            "access_token": "new_token", "expires_in": 3600, "refresh_token": "rotated_refresh"
+        })
+
+    mock_post.side_effect = slow_refresh
+    tokens = await asyncio.gather(*(get_valid_spotify_token(user, db_session) for _ in range(5)))
+
+    assert tokens == ["new_token"] * 5
+    assert mock_post.await_count == 1
+    db_session.refresh(user)
+    assert user.spotify_refresh_token == "rotated_refresh"
+
+
+# --- Test: Si otro proceso refresca antes, se usa su token (compare-and-set) ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.post", new_callable=AsyncMock)
+async def test_refresh_spotify_token_lost_race(mock_post, db_session):
+    user = create_user(expires_at=datetime.utcnow() - timedelta(minutes=1))
+    db_session.add(user)
+    db_session.commit()
+
+    async def refreshed_elsewhere(*args, **kwargs):
+        # Otro worker guarda su token mientras esperamos a Spotify
+        db_session.execute(
+            update(User).where(User.id == user.id).values(
+                spotify_access_token="other_token",
+                spotify_token_expires_at=datetime.utcnow() + timedelta(hours=1),
+            )
+        )
+        db_session.commit()
+        return MagicMock(status_code=200, json=lambda: {"access_token": "our_token", "expires_in": 3600})
+
+    mock_post.side_effect = refreshed_elsewhere
+    token = await refresh_spotify_token(user, db_session)
+
+    assert token == "other_token"
+    db_session.refresh(user)
+    assert user.spotify_access_token == "other_token"
+
+
+# --- Test: Token a punto de caducar se refresca en segundo plano una sola vez ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.refresh_token_in_background", new_callable=AsyncMock)
+async def test_get_valid_spotify_token_proactive_refresh(mock_background, db_session):
+    user = create_user(expires_at=datetime.utcnow() + timedelta(seconds=60))
+    finish = asyncio.Event()
+
+    async def refresh_in_flight(user_id):
+        await finish.wait()
+
+    mock_background.side_effect = refresh_in_flight
+
+    assert await get_valid_spotify_token(user, db_session) == "token"
+    assert await get_valid_spotify_token(user, db_session) == "token"
+    finish.set()
+    await spotify_controller._refresh_jobs[user.id]
+
+    mock_background.assert_awaited_once_with(user.id)
+    assert user.id not in spotify_controller._refresh_jobs
+
+
+# --- Test: El refresco anticipado accede a la BD fuera del event loop ---
+@pytest.mark.asyncio
+async def test_refresh_token_in_background_uses_threadpool():
+    user = create_user(expires_at=datetime.utcnow() + timedelta(hours=1))
+    db = MagicMock()
+    threads = []
+    db.get.side_effect = lambda *args: threads.append(threading.get_ident()) or user
+    db.close.side_effect = lambda: threads.append(threading.get_ident())
+
+    with patch("src.controllers.spotify_controller.SessionLocal", return_value=db):
+        await spotify_controller.refresh_token_in_background(user.id)
+
+    assert len(threads) == 2 and threading.get_ident() not in threads
+
+
 # --- Test: Obtener playlists exitosamente ---
-@patch("src.controllers.spotify_controller.requests.get")
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
-def test_get_all_user_playlists_success(mock_token, mock_get, db_session):
+async def test_get_all_user_playlists_success(mock_token, mock_get, db_session):
     user = create_user_with_token()
     mock_get.side_effect = [
         MagicMock(status_code=200, json=lambda: {
@@ -129,87 +284,95 @@ def test_get_all_user_playlists_success(mock_token, mock_get, db_session):
         }),
         MagicMock(status_code=200, json=lambda: {"items": [{"track": {"uri": "spotify:track:abc", "name": "Song", "artists": [{"name": "Artist"}]}}]})
     ]
-    result = get_all_user_playlists(user, db_session)
+    result = await get_all_user_playlists(user, db_session)
     assert "playlists" in result
 
 
 # --- Test: Error 401 al obtener playlists ---
-@patch("src.controllers.spotify_controller.requests.get")
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="some_token")
-def test_get_all_user_playlists_token_invalid(mock_token, mock_get, db_session):
+async def test_get_all_user_playlists_token_invalid(mock_token, mock_get, db_session):
     user = create_user_with_token()
     mock_get.return_value = MagicMock(status_code=401, text="Unauthorized")
     with pytest.raises(HTTPException) as exc:
-        get_all_user_playlists(user, db_session)
+        await get_all_user_playlists(user, db_session)
     assert exc.value.status_code == 401
 
 
 # --- Test: Error 500 de Spotify ---
-@patch("src.controllers.spotify_controller.requests.get")
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="some_token")
-def test_get_all_user_playlists_spotify_error(mock_token, mock_get, db_session):
+async def test_get_all_user_playlists_spotify_error(mock_token, mock_get, db_session):
     user = create_user_with_token()
     mock_get.return_value = MagicMock(status_code=500, text="Error")
     with pytest.raises(HTTPException) as exc:
-        get_all_user_playlists(user, db_session)
+        await get_all_user_playlists(user, db_session)
     assert exc.value.status_code == 500
 
 
 # --- Test: Error inesperado en get_all_user_playlists ---
+@pytest.mark.asyncio
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", side_effect=Exception("Fail"))
-def test_get_all_user_playlists_unexpected_error(mock_token, db_session):
+async def test_get_all_user_playlists_unexpected_error(mock_token, db_session):
     user = create_user_with_token()
     with pytest.raises(HTTPException) as exc:
-        get_all_user_playlists(user, db_session)
+        await get_all_user_playlists(user, db_session)
     assert exc.value.status_code == 500
 
 
 # --- Test: Actualizar playlist correctamente ---
-@patch("src.controllers.spotify_controller.requests.put")
-@patch("src.controllers.spotify_controller.requests.get")
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.put", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
-def test_update_playlist_success(mock_token, mock_get, mock_put, db_session):
+async def test_update_playlist_success(mock_token, mock_get, mock_put, db_session):
     user = create_user_with_spotify()
     mock_get.return_value = MagicMock(status_code=200, json=lambda: {"owner": {"id": user.spotify_user_id}})
     mock_put.return_value = MagicMock(status_code=200)
-    result = update_playlist("playlist123", "New", "Desc", user, db_session)
+    result = await update_playlist("playlist123", "New", "Desc", user, db_session)
     assert result["message"] == "Playlist actualizada correctamente"
 
 
 # --- Test: Dejar de seguir playlist correctamente ---
-@patch("src.controllers.spotify_controller.requests.delete")
-def test_unfollow_playlist_success(mock_delete):
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.delete", new_callable=AsyncMock)
+async def test_unfollow_playlist_success(mock_delete, db_session):
     user = create_user_with_token()
     mock_delete.return_value = MagicMock(status_code=200)
-    result = unfollow_playlist_logic("playlist123", user)
+    result = await unfollow_playlist_logic("playlist123", user, db_session)
     assert result["message"] == "Playlist eliminada de tu cuenta (dejaste de seguirla)."
 
 
 # --- Test: Error 403 al dejar de seguir playlist ---
-@patch("src.controllers.spotify_controller.requests.delete")
-def test_unfollow_playlist_forbidden(mock_delete):
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.delete", new_callable=AsyncMock)
+async def test_unfollow_playlist_forbidden(mock_delete, db_session):
     user = create_user_with_token()
     mock_delete.return_value = MagicMock(status_code=403)
     with pytest.raises(HTTPException) as exc:
-        unfollow_playlist_logic("playlist123", user)
+        await unfollow_playlist_logic("playlist123", user, db_session)
     assert exc.value.status_code == 403
 
 
 # --- Test: Otro error al dejar de seguir playlist ---
-@patch("src.controllers.spotify_controller.requests.delete")
-def test_unfollow_playlist_other_error(mock_delete):
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.delete", new_callable=AsyncMock)
+async def test_unfollow_playlist_other_error(mock_delete, db_session):
     user = create_user_with_token()
     mock_resp = MagicMock(status_code=500, json=lambda: {"error": "Internal"})
     mock_delete.return_value = mock_resp
     with pytest.raises(HTTPException) as exc:
-        unfollow_playlist_logic("playlist123", user)
+        await unfollow_playlist_logic("playlist123", user, db_session)
     assert exc.value.status_code == 500
 
 
 # --- Test: Obtener top info completo correctamente ---
-@patch("src.controllers.spotify_controller.requests.get")
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
-def test_get_user_full_top_info_success(mock_token, mock_get, db_session):
+async def test_get_user_full_top_info_success(mock_token, mock_get, db_session):
     user = create_user_with_spotify()
 
     artist_resp = MagicMock(status_code=200, json=lambda: {
@@ -221,26 +384,370 @@ def test_get_user_full_top_info_success(mock_token, mock_get, db_session):
 
     mock_get.side_effect = [artist_resp, track_resp] * 3
 
-    result = get_user_full_top_info(user, db_session)
+    result = await get_user_full_top_info(user, db_session)
     assert "top_artists" in result
     assert "Track 1 - Artist A" not in result["top_tracks"]["semanal"]  # Asserting logic integrity
 
 
 # --- Test: Error al obtener top desde Spotify ---
-@patch("src.controllers.spotify_controller.requests.get")
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
-def test_get_user_full_top_info_spotify_error(mock_token, mock_get, db_session):
+async def test_get_user_full_top_info_spotify_error(mock_token, mock_get, db_session):
     user = create_user_with_spotify()
     mock_get.return_value = MagicMock(status_code=500, text="Spotify error")
     with pytest.raises(HTTPException) as exc:
-        get_user_full_top_info(user, db_session)
+        await get_user_full_top_info(user, db_session)
     assert exc.value.status_code == 500
 
 
 # --- Test: Token inválido al obtener top ---
+@pytest.mark.asyncio
 @patch("src.controllers.spotify_controller.get_valid_spotify_token", side_effect=HTTPException(status_code=401, detail="Token inválido"))
-def test_get_user_full_top_info_invalid_token(mock_token, db_session):
+async def test_get_user_full_top_info_invalid_token(mock_token, db_session):
     user = create_user_with_spotify()
     with pytest.raises(HTTPException) as exc:
-        get_user_full_top_info(user, db_session)
+        await get_user_full_top_info(user, db_session)
     assert exc.value.status_code == 401
+
+
+# --- Test: Resolución concurrente conserva el orden y tolera fallos ---
+@pytest.mark.asyncio
+async def test_resolve_track_uris_keeps_order_and_skips_failures():
+    async def fake_search(titulo, artista, access_token):
+        if titulo == "B":
+            raise Exception("Spotify caído")
+        if titulo == "C":
+            return None
+        # La primera canción tarda más para forzar un orden de llegada distinto
+        await asyncio.sleep(0.02 if titulo == "A" else 0)
+        return f"spotify:track:{titulo}"
+
+    canciones = [("A", "x"), ("B", "x"), ("C", "x"), ("D", "x")]
+    with patch("src.controllers.spotify_controller.search_track_uri", side_effect=fake_search):
+        uris = await resolve_track_uris(canciones, "token", concurrency=4, cache=None)
+
+    assert uris == ["spotify:track:A", "spotify:track:D"]
+
+
+# --- Test: Búsquedas que exceden el timeout se descartan ---
+@pytest.mark.asyncio
+async def test_resolve_track_uris_timeout_is_skipped():
+    async def fake_search(titulo, artista, access_token):
+        await asyncio.sleep(1 if titulo == "lenta" else 0)
+        return f"spotify:track:{titulo}"
+
+    with patch("src.controllers.spotify_controller.search_track_uri", side_effect=fake_search):
+        uris = await resolve_track_uris([("lenta", "x"), ("rapida", "x")], "token", timeout=0.05, cache=None)
+
+    assert uris == ["spotify:track:rapida"]
+
+
+# --- Test: La concurrencia no supera el límite configurado ---
+@pytest.mark.asyncio
+async def test_resolve_track_uris_respects_concurrency_limit():
+    in_flight = 0
+    peak = 0
+
+    async def fake_search(titulo, artista, access_token):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return f"spotify:track:{titulo}"
+
+    canciones = [(str(i), "x") for i in range(12)]
+    with patch("src.controllers.spotify_controller.search_track_uri", side_effect=fake_search):
+        uris = await resolve_track_uris(canciones, "token", concurrency=3, cache=None)
+
+    assert len(uris) == 12
+    assert peak <= 3
+
+
+# --- Test: Las canciones cacheadas no se buscan de nuevo ---
+@pytest.mark.asyncio
+async def test_resolve_track_uris_uses_cache():
+    from src.services.track_cache import TrackURICache, normalize_query
+
+    cache = TrackURICache()
+    cache.set_many({normalize_query("Cached", "x"): "spotify:track:cached", normalize_query("Nope", "x"): None})
+
+    searched = []
+
+    async def fake_search(titulo, artista, access_token):
+        searched.append(titulo)
+        return f"spotify:track:{titulo}"
+
+    canciones = [("Cached", "x"), ("Nope", "x"), ("New", "x"), ("new", "X")]
+    with patch("src.controllers.spotify_controller.search_track_uri", side_effect=fake_search):
+        uris = await resolve_track_uris(canciones, "token", cache=cache)
+
+    assert searched == ["New"]
+    assert uris == ["spotify:track:cached", "spotify:track:New", "spotify:track:New"]
+    assert cache.get_many([normalize_query("New", "x")]) == {normalize_query("New", "x"): "spotify:track:New"}
+
+
+# --- Test: La caché de búsquedas consulta la BD fuera del event loop ---
+@pytest.mark.asyncio
+async def test_resolve_track_uris_cache_db_in_threadpool():
+    from src.services.track_cache import TrackURICache
+
+    db = MagicMock()
+    threads = []
+
+    def query(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return MagicMock(**{"filter.return_value.all.return_value": []})
+
+    db.query.side_effect = query
+    db.commit.side_effect = lambda: threads.append(threading.get_ident())
+    with patch("src.controllers.spotify_controller.search_track_uri", new_callable=AsyncMock, return_value="spotify:track:1"):
+        uris = await resolve_track_uris([("Song", "Artist")], "token", db=db, cache=TrackURICache())
+
+    assert uris == ["spotify:track:1"]
+    assert len(threads) == 2 and threading.get_ident() not in threads
+    db.commit.assert_called_once()
+
+
+# --- Test: Top info se sirve desde caché sin volver a Spotify ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.fetch_user_full_top_info", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_user_full_top_info_cached(mock_token, mock_fetch, db_session):
+    user = create_user_with_spotify()
+    mock_fetch.return_value = {"top_artists": {}, "top_tracks": {}, "top_genres": {}}
+
+    first = await get_user_full_top_info(user, db_session)
+    second = await get_user_full_top_info(user, db_session)
+
+    assert first is second
+    mock_fetch.assert_awaited_once_with("valid_token")
+    mock_token.assert_awaited_once()
+
+
+# --- Test: Peticiones concurrentes del mismo usuario comparten una recarga ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_user_full_top_info_single_flight(mock_token, db_session):
+    user = create_user_with_spotify()
+    calls = 0
+
+    async def slow_fetch(access_token):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return {"top_artists": {}, "top_tracks": {}, "top_genres": {}}
+
+    with patch("src.controllers.spotify_controller.fetch_user_full_top_info", side_effect=slow_fetch):
+        results = await asyncio.gather(*(get_user_full_top_info(user, db_session) for _ in range(5)))
+
+    assert calls == 1
+    assert all(r == results[0] for r in results)
+
+
+# --- Test: Con datos caducados se sirve lo antiguo y se refresca en segundo plano ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_user_full_top_info_stale_while_revalidate(mock_token, db_session, monkeypatch):
+    user = create_user_with_spotify()
+    old = {"top_artists": {"semanal": ["Old"]}}
+    new = {"top_artists": {"semanal": ["New"]}}
+    top_info_cache.set(user.id, old)
+    monkeypatch.setattr(top_info_cache, "ttl", 0)
+    monkeypatch.setattr(top_info_cache, "stale_ttl", 60)
+
+    with patch("src.controllers.spotify_controller.fetch_user_full_top_info", new_callable=AsyncMock, return_value=new):
+        assert await get_user_full_top_info(user, db_session) is old
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    assert top_info_cache.peek(user.id)[0] is new
+
+
+# --- Test: Se descargan todas las páginas de canciones con proyección de campos ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+async def test_fetch_playlist_tracks_all_pages(mock_get):
+    def page(url, access_token=None, params=None):
+        offset = params["offset"]
+        count = min(100, 250 - offset)
+        items = [{"track": {"name": f"T{offset + i}", "uri": f"u{offset + i}", "artists": [{"name": "A"}]}} for i in range(count)]
+        return MagicMock(status_code=200, json=lambda: {"items": items, "total": 250})
+
+    mock_get.side_effect = page
+
+    tracks = await fetch_playlist_tracks("p1", "token")
+
+    assert len(tracks) == 250
+    assert [t["uri"] for t in tracks[:2]] == ["u0", "u1"] and tracks[-1]["uri"] == "u249"
+    assert sorted(c.kwargs["params"]["offset"] for c in mock_get.call_args_list) == [0, 100, 200]
+    assert all("fields" in c.kwargs["params"] for c in mock_get.call_args_list)
+
+
+# --- Test: Con total conocido y playlist vacía no se hace ninguna petición ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+async def test_fetch_playlist_tracks_empty_with_known_total(mock_get):
+    assert await fetch_playlist_tracks("p1", "token", total=0) == []
+    mock_get.assert_not_awaited()
+
+
+# --- Test: Listado con varias páginas de playlists y canciones completas ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_all_user_playlists_multiple_pages(mock_token, mock_get, db_session):
+    user = create_user_with_token()
+
+    def respond(url, access_token=None, params=None):
+        if url == "/me/playlists":
+            offset = params["offset"]
+            items = [
+                {"id": f"p{i}", "name": f"P{i}", "description": "", "images": [], "tracks": {"total": 150}}
+                for i in range(offset, min(offset + 50, 60))
+            ]
+            return MagicMock(status_code=200, json=lambda: {"items": items, "total": 60, "next": "more" if offset == 0 else None})
+        playlist_id = url.split("/")[2]
+        count = min(100, 150 - params["offset"])
+        items = [{"track": {"name": "T", "uri": f"{playlist_id}:{params['offset'] + i}", "artists": []}} for i in range(count)]
+        return MagicMock(status_code=200, json=lambda: {"items": items, "total": 150})
+
+    mock_get.side_effect = respond
+
+    result = await get_all_user_playlists(user, db_session)
+
+    assert [p["id"] for p in result["playlists"]] == [f"p{i}" for i in range(60)]
+    assert all(len(p["tracks"]) == 150 for p in result["playlists"])
+
+
+# --- Test: Las páginas de /me/playlists se piden con paralelismo acotado ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+async def test_fetch_all_playlist_items_respects_concurrency_limit(mock_get):
+    in_flight = 0
+    peak = 0
+
+    async def respond(url, access_token=None, params=None):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        offset = params["offset"]
+        items = [{"id": f"p{i}"} for i in range(offset, min(offset + 50, 1000))]
+        return MagicMock(status_code=200, json=lambda: {"items": items, "total": 1000, "next": "more"})
+
+    mock_get.side_effect = respond
+
+    items = await spotify_controller.fetch_all_playlist_items("token", semaphore=asyncio.Semaphore(3))
+
+    assert [item["id"] for item in items] == [f"p{i}" for i in range(1000)]
+    assert peak <= 3
+
+
+# --- Test: Cursor codifica y decodifica el offset ---
+def test_cursor_roundtrip_and_invalid():
+    assert decode_cursor(encode_cursor(150)) == 150
+    assert decode_cursor(None) == 0
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("no-es-un-cursor")
+    assert exc.value.status_code == 400
+
+
+# --- Test: Página de metadatos con una sola petición a Spotify ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_user_playlists_page_metadata_only(mock_token, mock_get, db_session):
+    user = create_user_with_token()
+    mock_get.return_value = MagicMock(status_code=200, json=lambda: {
+        "items": [{"id": "p1", "name": "P1", "description": "d", "images": [], "snapshot_id": "s1", "tracks": {"total": 42}}],
+        "total": 3,
+        "next": "more"
+    })
+
+    result = await get_user_playlists_page(user, db_session, limit=1, cursor=encode_cursor(1))
+
+    mock_get.assert_awaited_once()
+    assert mock_get.call_args.kwargs["params"] == {"limit": 1, "offset": 1}
+    assert result["playlists"][0] == {
+        "name": "P1", "id": "p1", "description": "d", "image": None, "tracks_total": 42, "snapshot_id": "s1"
+    }
+    assert decode_cursor(result["next_cursor"]) == 2
+
+
+# --- Test: Página de canciones con cursor siguiente ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_playlist_tracks_page(mock_token, mock_get, db_session):
+    user = create_user_with_token()
+    mock_get.return_value = MagicMock(status_code=200, json=lambda: {
+        "items": [{"track": {"name": "T", "uri": "u", "artists": [{"name": "A"}]}}] * 2,
+        "total": 5
+    })
+
+    result = await get_playlist_tracks_page("p1", user, db_session, limit=2)
+
+    assert len(result["tracks"]) == 2
+    assert decode_cursor(result["next_cursor"]) == 2
+
+
+# --- Test: Stream NDJSON recorre todas las páginas ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_open_playlist_tracks_stream_pages(mock_token, mock_get, db_session):
+    import json
+
+    user = create_user_with_token()
+
+    def page(url, access_token=None, params=None):
+        count = min(params["limit"], 5 - params["offset"])
+        items = [{"track": {"name": "T", "uri": f"u{params['offset'] + i}", "artists": []}} for i in range(count)]
+        return MagicMock(status_code=200, json=lambda: {"items": items, "total": 5})
+
+    mock_get.side_effect = page
+
+    stream = await open_playlist_tracks_stream("p1", user, db_session, limit=2)
+    lines = [json.loads(line) async for line in stream]
+
+    assert [len(line["tracks"]) for line in lines] == [2, 2, 1]
+    assert lines[-1]["next_cursor"] is None
+
+
+# --- Test: Listado repetido reutiliza canciones de playlists con el mismo snapshot ---
+@pytest.mark.asyncio
+@patch("src.controllers.spotify_controller.spotify_client.get", new_callable=AsyncMock)
+@patch("src.controllers.spotify_controller.get_valid_spotify_token", return_value="valid_token")
+async def test_get_all_user_playlists_reuses_snapshot_cache(mock_token, mock_get, db_session, monkeypatch):
+    from src.services.playlist_cache import PlaylistTracksCache
+
+    cache = PlaylistTracksCache()
+    monkeypatch.setattr("src.controllers.spotify_controller.playlist_tracks_cache", cache)
+    user = create_user_with_token()
+    snapshots = {"p1": "s1", "p2": "s1"}
+
+    def respond(url, access_token=None, params=None):
+        if url == "/me/playlists":
+            items = [
+                {"id": pid, "name": pid, "description": "", "images": [], "snapshot_id": snap, "tracks": {"total": 1}}
+                for pid, snap in snapshots.items()
+            ]
+            return MagicMock(status_code=200, json=lambda: {"items": items, "total": 2, "next": None})
+        items = [{"track": {"name": "T", "uri": url, "artists": []}}]
+        return MagicMock(status_code=200, json=lambda: {"items": items, "total": 1})
+
+    mock_get.side_effect = respond
+
+    await get_all_user_playlists(user, db_session)
+    assert mock_get.await_count == 3
+
+    snapshots["p2"] = "s2"
+    result = await get_all_user_playlists(user, db_session)
+
+    # Solo /me/playlists y las canciones de la playlist que cambió
+    assert mock_get.await_count == 5
+    assert mock_get.call_args_list[-1].args[0] == "/playlists/p2/tracks"
+    assert all(len(p["tracks"]) == 1 for p in result["playlists"])
@@ -0,0 +1,115 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from migrate import migrate
+from src.config.db import Base
+from src.config.migrations import (
+    LATEST_VERSION,
+    SchemaOutOfDateError,
+    check_schema_version,
+    current_version,
+    schema_drift,
+)
+from src.utils.token_budget import estimate_tokens
+
+
+def index_names(bind, table):
+    return {index["name"] for index in inspect(bind).get_indexes(table)}
+
+
+# --- Test: Añade los índices compuestos a una BD existente sin ellos ---
+def test_migrate_creates_missing_indexes(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(text("DROP INDEX ix_messages_conversation_id_created_at"))
+        conn.execute(text("DROP INDEX ix_conversations_user_id_created_at"))
+        conn.execute(text("INSERT INTO conversations (id, user_id, title) VALUES (1, 1, 'Antigua')"))
+
+    created = migrate(bind)
+
+    assert set(created) == {"ix_messages_conversation_id_created_at", "ix_conversations_user_id_created_at"}
+    assert "ix_messages_conversation_id_created_at" in index_names(bind, "messages")
+    with bind.connect() as conn:
+        assert conn.execute(text("SELECT title FROM conversations")).scalar() == "Antigua"
+
+
+# --- Test: Ejecutarla de nuevo no hace nada ---
+def test_migrate_is_idempotent(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+
+    migrate(bind)
+
+    assert migrate(bind) == []
+
+
+# --- Test: Añade columnas nuevas y rellena token_count de los mensajes antiguos ---
+def test_migrate_adds_token_count_column(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with bind.begin() as conn:
+        conn.execute(text("CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER, role VARCHAR, content VARCHAR, created_at DATETIME)"))
+        conn.execute(text("INSERT INTO messages (id, conversation_id, role, content) VALUES (1, 1, 'user', 'Hola, ¿qué tal?')"))
+
+    changes = migrate(bind)
+
+    assert "messages.token_count" in changes
+    with bind.connect() as conn:
+        assert conn.execute(text("SELECT token_count FROM messages")).scalar() == estimate_tokens("Hola, ¿qué tal?")
+
+
+# --- Test: Anota cada migración aplicada y deja la BD igual que los modelos ---
+def test_migrate_records_versions(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    assert current_version(bind) == 0
+
+    migrate(bind)
+
+    assert current_version(bind) == LATEST_VERSION
+    assert schema_drift(bind) == []
+    with bind.connect() as conn:
+        versions = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+    assert versions == list(range(1, LATEST_VERSION + 1))
+
+
+# --- Test: Una BD creada antes de las migraciones queda igual que los modelos ---
+def test_migrate_legacy_database_matches_models(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(text("DROP TABLE schema_migrations"))
+        conn.execute(text("DROP INDEX ix_conversations_user_id_created_at"))
+        conn.execute(text("ALTER TABLE conversations DROP COLUMN summary"))
+    assert "conversations.summary" in schema_drift(bind)
+
+    changes = migrate(bind)
+
+    assert {"ix_conversations_user_id_created_at", "conversations.summary"} <= set(changes)
+    assert schema_drift(bind) == []
+
+
+# --- Test: El arranque no sigue con el esquema desactualizado ---
+def test_check_schema_version_raises_when_behind(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=bind)
+
+    with pytest.raises(SchemaOutOfDateError, match="migrate.py"):
+        check_schema_version(bind, mode="error")
+    assert check_schema_version(bind, mode="warn") == 0
+    assert check_schema_version(bind, mode="off") is None
+
+
+# --- Test: Con todas las migraciones aplicadas el arranque continúa ---
+def test_check_schema_version_passes_when_current(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    migrate(bind)
+
+    assert check_schema_version(bind, mode="error") == LATEST_VERSION
+
+
+# --- Test: Una BD inaccesible muestra el error de conexión, no "faltan migraciones" ---
+def test_check_schema_version_propagates_connection_errors(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'no_existe' / 'chatify.db'}")
+
+    with pytest.raises(OperationalError):
+        check_schema_version(bind, mode="error")
@@ -1,7 +1,7 @@
 import pytest
 from fastapi import status, HTTPException
 from fastapi.testclient import TestClient
-from unittest.mock import patch, ANY
+from unittest.mock import AsyncMock, patch, ANY
 from urllib.parse import unquote
 
 
@@ -14,7 +14,7 @@ from urllib.parse import unquote
     ],
 )
 def test_register(client: TestClient, payload):
-    with patch("src.routes.auth_routes.register_user") as mock_register:
+    with patch("src.routes.auth_routes.register_user", new_callable=AsyncMock) as mock_register:
         mock_register.return_value = {"msg": "User registered"}
         response = client.post("/auth/register", json=payload)
         assert response.status_code == 200
@@ -26,7 +26,7 @@ def test_register(client: TestClient, payload):
 
 # --- Test: Login exitoso ---
 def test_login(client: TestClient):
-    with patch("src.routes.auth_routes.login_user") as mock_login:
+    with patch("src.routes.auth_routes.login_user", new_callable=AsyncMock) as mock_login:
         mock_login.return_value = {"access_token": "token", "token_type": "bearer"}
         response = client.post(
             "/auth/login",
@@ -50,7 +50,7 @@ def test_get_profile(client: TestClient):
 # --- Test: Actualizar información de usuario ---
 def test_update_profile(client: TestClient):
     data = {"username": "newuser", "email": "newemail@test.com"}
-    with patch("src.routes.auth_routes.update_user_info") as mock_update_user:
+    with patch("src.routes.auth_routes.update_user_info", new_callable=AsyncMock) as mock_update_user:
         mock_update_user.return_value = {"msg": "User updated"}
         response = client.put("/auth/me", json=data)
         assert response.status_code == 200
@@ -63,7 +63,10 @@ def test_update_profile(client: TestClient):
 async def test_spotify_callback_success(monkeypatch, client: TestClient):
     import src.routes.auth_routes as auth_routes
 
-    monkeypatch.setattr(auth_routes, "login_spotify", lambda request, db: {"success": True})
+    async def mock_login_spotify(request, db):
+        return {"success": True}
+
+    monkeypatch.setattr(auth_routes, "login_spotify", mock_login_spotify)
     monkeypatch.setattr(auth_routes, "FRONTEND_URL", "http://localhost:3000")
 
     response = client.get("/auth/callback?code=fakecode&state=user@example.com", follow_redirects=False)
@@ -76,7 +79,7 @@ async def test_spotify_callback_success(monkeypatch, client: TestClient):
 def test_spotify_callback_http_exception(monkeypatch, client: TestClient):
     import src.routes.auth_routes as auth_routes
 
-    def mock_login_spotify(request, db):
+    async def mock_login_spotify(request, db):
         raise HTTPException(status_code=400, detail="Bad request")
 
     monkeypatch.setattr(auth_routes, "login_spotify", mock_login_spotify)
@@ -93,7 +96,7 @@ def test_spotify_callback_http_exception(monkeypatch, client: TestClient):
 async def test_spotify_callback_generic_exception(monkeypatch, client: TestClient):
     import src.routes.auth_routes as auth_routes
 
-    def mock_login_spotify(request, db):
+    async def mock_login_spotify(request, db):
         raise Exception("Unexpected error")
 
     monkeypatch.setattr(auth_routes, "login_spotify", mock_login_spotify)
@@ -109,7 +112,7 @@ async def test_spotify_callback_generic_exception(monkeypatch, client: TestClien
 def test_spotify_callback_login_spotify_fails(monkeypatch, client: TestClient):
     import src.routes.auth_routes as auth_routes
 
-    def mock_login_spotify(request, db):
+    async def mock_login_spotify(request, db):
         return {"success": False, "message": "Token inválido"}
 
     monkeypatch.setattr(auth_routes, "login_spotify", mock_login_spotify)
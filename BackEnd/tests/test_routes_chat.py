@@ -5,7 +5,7 @@ from unittest.mock import patch, AsyncMock, ANY
 
 # --- Test: Iniciar chat ---
 def test_start_chat(client):
-    with patch("src.controllers.chat_controller.start_conversation") as mock_start:
+    with patch("src.controllers.chat_controller.start_conversation", new_callable=AsyncMock) as mock_start:
         mock_start.return_value = {"chat_id": 123, "message": "Chat started"}
 
         response = client.post("/chat/start")
@@ -17,7 +17,7 @@ def test_start_chat(client):
 
 # --- Test: Enviar mensaje autorizado ---
 def test_send_message_authorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get, \
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
          patch("src.controllers.chat_controller.handle_message", new_callable=AsyncMock) as mock_handle:
 
         mock_get.return_value = type("Conversation", (), {"user_id": 1})()
@@ -27,26 +27,81 @@ def test_send_message_authorized(client):
 
         assert response.status_code == 200
         assert response.json() == {"response": "OK"}
-        mock_get.assert_called_once_with('1', ANY)
+        mock_get.assert_called_once_with(1, ANY)
         mock_handle.assert_awaited_once()
 
 
 # --- Test: Enviar mensaje no autorizado ---
 def test_send_message_unauthorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get:
         mock_get.return_value = type("Conversation", (), {"user_id": 999})()
 
         response = client.post("/chat/1/message", json={"question": "Hola"})
 
         assert response.status_code == 403
         assert response.json()["detail"] == "Unauthorized"
-        mock_get.assert_called_once_with('1', ANY)
+        mock_get.assert_called_once_with(1, ANY)
+
+
+# --- Test: Enviar mensaje en streaming (SSE) ---
+def test_send_message_stream_authorized(client):
+    async def events():
+        yield 'event: token\ndata: {"content": "Hola"}\n\n'
+        yield 'event: done\ndata: {"title_changed": false}\n\n'
+
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.stream_message", new_callable=AsyncMock) as mock_stream:
+
+        mock_get.return_value = type("Conversation", (), {"user_id": 1})()
+        mock_stream.return_value = events()
+
+        response = client.post("/chat/1/message/stream", json={"question": "Hola"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "event: token" in response.text and "event: done" in response.text
+        mock_stream.assert_awaited_once()
+
+
+# --- Test: Enviar mensaje en streaming no autorizado ---
+def test_send_message_stream_unauthorized(client):
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get:
+        mock_get.return_value = type("Conversation", (), {"user_id": 999})()
+
+        response = client.post("/chat/1/message/stream", json={"question": "Hola"})
+
+        assert response.status_code == 403
+
+
+# --- Test: Estado del título ---
+def test_get_title_status_authorized(client):
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.get_title_status", new_callable=AsyncMock) as mock_status:
+
+        mock_get.return_value = type("Conversation", (), {"user_id": 1})()
+        mock_status.return_value = {"title": "Jazz", "title_pending": False}
+
+        response = client.get("/chat/1/title?wait=5")
+
+        assert response.status_code == 200
+        assert response.json() == {"title": "Jazz", "title_pending": False}
+        mock_status.assert_awaited_once_with(1, ANY, wait=5.0)
+
+
+# --- Test: Estado del título no autorizado ---
+def test_get_title_status_unauthorized(client):
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get:
+        mock_get.return_value = type("Conversation", (), {"user_id": 999})()
+
+        response = client.get("/chat/1/title")
+
+        assert response.status_code == 403
 
 
 # --- Test: Eliminar chat autorizado ---
 def test_delete_chat_authorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get, \
-         patch("src.controllers.chat_controller.delete_chat") as mock_delete:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.delete_chat", new_callable=AsyncMock) as mock_delete:
 
         mock_get.return_value = type("Conversation", (), {"user_id": 1})()
         mock_delete.return_value = {"deleted": True}
@@ -61,7 +116,7 @@ def test_delete_chat_authorized(client):
 
 # --- Test: Eliminar chat no autorizado ---
 def test_delete_chat_unauthorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get:
         mock_get.return_value = type("Conversation", (), {"user_id": 999})()
 
         response = client.delete("/chat/1")
@@ -73,8 +128,8 @@ def test_delete_chat_unauthorized(client):
 
 # --- Test: Obtener historial autorizado ---
 def test_get_history_authorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get, \
-         patch("src.controllers.chat_controller.get_history") as mock_history:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.get_history", new_callable=AsyncMock) as mock_history:
 
         mock_get.return_value = type("Conversation", (), {"user_id": 1})()
         mock_history.return_value = [
@@ -92,7 +147,7 @@ def test_get_history_authorized(client):
 
 # --- Test: Obtener historial no autorizado ---
 def test_get_history_unauthorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get:
         mock_get.return_value = type("Conversation", (), {"user_id": 999})()
 
         response = client.get("/chat/1/history")
@@ -102,9 +157,49 @@ def test_get_history_unauthorized(client):
         mock_get.assert_called_once_with(1, ANY)
 
 
+# --- Test: Historial paginado por cursor ---
+def test_get_history_paginated(client):
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.get_history_page", new_callable=AsyncMock) as mock_page:
+
+        mock_get.return_value = type("Conversation", (), {"user_id": 1})()
+        mock_page.return_value = {"messages": [], "has_more": False}
+
+        response = client.get("/chat/1/history?before=10&limit=20")
+
+        assert response.status_code == 200
+        assert response.json() == mock_page.return_value
+        mock_page.assert_called_once_with(1, ANY, before=10, after=None, limit=20)
+
+
+# --- Test: before y after a la vez no se permiten ---
+def test_get_history_before_and_after(client):
+    response = client.get("/chat/1/history?before=10&after=2")
+    assert response.status_code == 400
+
+
+# --- Test: Historial en streaming NDJSON ---
+def test_get_history_stream(client):
+    async def lines():
+        yield '{"id": 1}\n'
+        yield '{"id": 2}\n'
+
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.open_history_stream", new_callable=AsyncMock) as mock_stream:
+
+        mock_get.return_value = type("Conversation", (), {"user_id": 1})()
+        mock_stream.return_value = lines()
+
+        response = client.get("/chat/1/history?stream=true")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert response.text.splitlines() == ['{"id": 1}', '{"id": 2}']
+
+
 # --- Test: Obtener conversaciones de usuario ---
 def test_get_user_conversations(client):
-    with patch("src.controllers.chat_controller.get_conversations") as mock_get_convs:
+    with patch("src.controllers.chat_controller.get_conversations", new_callable=AsyncMock) as mock_get_convs:
         mock_get_convs.return_value = [
             {"id": 1, "created_at": "2024-05-01T10:00:00", "title": "Conversación 1"},
             {"id": 2, "created_at": "2024-05-02T12:00:00", "title": "Conversación 2"}
@@ -114,13 +209,13 @@ def test_get_user_conversations(client):
 
         assert response.status_code == 200
         assert response.json() == mock_get_convs.return_value
-        mock_get_convs.assert_called_once_with("1", ANY)
+        mock_get_convs.assert_called_once_with(1, ANY)
 
 
 # --- Test: Renombrar conversación autorizado ---
 def test_rename_conversation_authorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get, \
-         patch("src.controllers.chat_controller.rename_conversation") as mock_rename:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get, \
+         patch("src.controllers.chat_controller.rename_conversation", new_callable=AsyncMock) as mock_rename:
 
         mock_get.return_value = type("Conversation", (), {"user_id": 1})()
         mock_rename.return_value = {"message": "Title updated"}
@@ -135,7 +230,7 @@ def test_rename_conversation_authorized(client):
 
 # --- Test: Renombrar conversación no autorizado ---
 def test_rename_conversation_unauthorized(client):
-    with patch("src.controllers.chat_controller.get_conversation_by_id") as mock_get:
+    with patch("src.controllers.chat_controller.get_conversation_by_id", new_callable=AsyncMock) as mock_get:
         mock_get.return_value = type("Conversation", (), {"user_id": 999})()
 
         response = client.put("/chat/1/rename", json="Nuevo título")
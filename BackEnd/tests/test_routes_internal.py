@@ -0,0 +1,79 @@
+import pytest
+
+from src.routes import internal_routes
+from src.services import chatIA_service
+from src.services.openrouter_resilience import CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def internal_token(client, monkeypatch):
+    monkeypatch.setattr(internal_routes, "INTERNAL_API_TOKEN", "secreto")
+    client.headers["X-Internal-Token"] = "secreto"
+
+
+# --- Test: Estadísticas del pool de BD ---
+def test_db_pool_stats(client):
+    response = client.get("/internal/db-pool")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data["engines"]) == {"sync", "async"}
+    assert "checked_out" in data["engines"]["sync"]
+    assert "wait" in data["engines"]["async"]
+    assert data["config"]["order"] in ("fifo", "lifo")
+
+
+# --- Test: Se exige la cabecera con el token configurado ---
+def test_db_pool_stats_requires_token(client):
+    del client.headers["X-Internal-Token"]
+
+    assert client.get("/internal/db-pool").status_code == 403
+    assert client.get("/internal/db-pool", headers={"X-Internal-Token": "otro"}).status_code == 403
+    assert client.get("/internal/db-pool", headers={"X-Internal-Token": "secreto"}).status_code == 200
+
+
+# --- Test: Sin token configurado las rutas internas no existen ---
+def test_internal_routes_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(internal_routes, "INTERNAL_API_TOKEN", None)
+
+    for path in ("/internal/db-pool", "/internal/completion-cache", "/internal/password-hasher"):
+        assert client.get(path).status_code == 404
+
+
+# --- Test: Estadísticas de la caché de respuestas del modelo ---
+def test_completion_cache_stats(client):
+    response = client.get("/internal/completion-cache")
+
+    assert response.status_code == 200
+    assert {"enabled", "memory_hits", "db_hits", "misses", "bypassed", "hit_ratio"} <= set(response.json())
+
+
+# --- Test: Estado de los circuit breakers y latencias de OpenRouter ---
+def test_openrouter_stats(client, monkeypatch):
+    breaker = CircuitBreaker()
+    monkeypatch.setitem(chatIA_service.model_breakers, "modelo/test", breaker)
+    monkeypatch.setattr(chatIA_service.model_latency, "_samples", {})
+    chatIA_service.model_latency.record("modelo/test", 0.25)
+
+    response = client.get("/internal/openrouter")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["breakers"]["modelo/test"]["state"] == "closed"
+    assert data["latency"]["modelo/test"] == {"samples": 1, "p50_ms": 250.0, "p95_ms": 250.0}
+
+
+# --- Test: Estadísticas del pool de hashing de contraseñas ---
+def test_password_hasher_stats(client):
+    response = client.get("/internal/password-hasher")
+
+    assert response.status_code == 200
+    assert {"in_flight", "capacity", "completed", "rejected"} <= set(response.json())
+
+
+# --- Test: Estadísticas de la caché de usuarios autenticados ---
+def test_principal_cache_stats(client):
+    response = client.get("/internal/principal-cache")
+
+    assert response.status_code == 200
+    assert {"enabled", "entries", "hits", "misses"} <= set(response.json())
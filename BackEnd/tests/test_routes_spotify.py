@@ -41,7 +41,10 @@ async def test_auto_generate_playlist(client_with_user, monkeypatch):
 def test_get_playlists(client_with_user, monkeypatch):
     client, user = client_with_user
 
-    monkeypatch.setattr("src.controllers.spotify_controller.get_valid_spotify_token", lambda u, db: "valid_token_mock")
+    async def mock_token(u, db):
+        return "valid_token_mock"
+
+    monkeypatch.setattr("src.controllers.spotify_controller.get_valid_spotify_token", mock_token)
 
     class MockPlaylistResponse:
         status_code = 200
@@ -51,10 +54,10 @@ def test_get_playlists(client_with_user, monkeypatch):
         status_code = 200
         def json(self): return {"items": [{"track": {"name": "Canción 1", "artists": [{"name": "Artista"}], "uri": "spotify:track:123"}}]}
 
-    def mock_requests_get(url, headers=None):
+    async def mock_spotify_get(url, access_token=None, **kwargs):
         return MockPlaylistResponse() if "tracks" not in url else MockTracksResponse()
 
-    monkeypatch.setattr("requests.get", mock_requests_get)
+    monkeypatch.setattr("src.controllers.spotify_controller.spotify_client.get", mock_spotify_get)
 
     headers = {"Authorization": "Bearer valid_token_mock"}
     response = client.get("/spotify/playlists", headers=headers)
@@ -90,7 +93,7 @@ def test_check_spotify_connected_false(client_with_user_without_spotify):
 def test_update_playlist_endpoint(client_with_user, monkeypatch):
     client, user = client_with_user
 
-    def mock_update(playlist_id, title, description, user, db):
+    async def mock_update(playlist_id, title, description, user, db):
         assert playlist_id == "123"
         assert title == "New Title"
         assert description == "New Description"
@@ -110,7 +113,7 @@ def test_update_playlist_endpoint(client_with_user, monkeypatch):
 def test_remove_tracks_playlist(client_with_user, monkeypatch):
     client, user = client_with_user
 
-    def mock_remove(playlist_id, data, u):
+    async def mock_remove(playlist_id, data, u, db):
         assert playlist_id == "playlist123"
         assert isinstance(data.tracks, list)
         assert u.username == user.username
@@ -145,7 +148,7 @@ def test_get_lyrics_with_patch(client_with_user):
 def test_unfollow_playlist(client_with_user, monkeypatch):
     client, user = client_with_user
 
-    def mock_unfollow(playlist_id, u):
+    async def mock_unfollow(playlist_id, u, db):
         assert playlist_id == "playlist123"
         assert u.username == user.username
         return {"unfollowed": True}
@@ -156,3 +159,38 @@ def test_unfollow_playlist(client_with_user, monkeypatch):
 
     assert response.status_code == 200
     assert response.json() == {"unfollowed": True}
+
+
+# --- Test: Listado de playlists en modo metadatos ---
+def test_get_playlists_metadata_mode(client_with_user, monkeypatch):
+    client, user = client_with_user
+
+    async def mock_page(u, db, limit, cursor):
+        assert limit == 10 and cursor == "abc"
+        return {"playlists": [{"id": "p1"}], "total": 1, "next_cursor": None}
+
+    monkeypatch.setattr("src.routes.spotify_routes.get_user_playlists_page", mock_page)
+
+    response = client.get("/spotify/playlists?mode=metadata&limit=10&cursor=abc")
+
+    assert response.status_code == 200
+    assert response.json()["playlists"] == [{"id": "p1"}]
+
+
+# --- Test: Canciones de una playlist en streaming NDJSON ---
+def test_playlist_tracks_stream(client_with_user, monkeypatch):
+    client, user = client_with_user
+
+    async def mock_stream(playlist_id, u, db, limit, cursor):
+        async def pages():
+            yield '{"tracks": [1]}\n'
+            yield '{"tracks": [2]}\n'
+        return pages()
+
+    monkeypatch.setattr("src.routes.spotify_routes.open_playlist_tracks_stream", mock_stream)
+
+    response = client.get("/spotify/playlists/p1/tracks?stream=true")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.text.splitlines() == ['{"tracks": [1]}', '{"tracks": [2]}']
@@ -1,37 +1,46 @@
+import httpx
 import pytest
-from unittest.mock import AsyncMock, patch, MagicMock
-from src.services.chatIA_service import Agent
+from src.services.chatIA_service import Agent, OpenRouterClient, openrouter_client
+from src.services.completion_cache import CompletionCache
+
+
+def build_http_client(handler) -> OpenRouterClient:
+    return OpenRouterClient(http2=False, transport=httpx.MockTransport(handler))
+
+
+def json_handler(data: dict, seen: dict = None):
+    def handler(request):
+        if seen is not None:
+            seen["payload"] = request.content
+        return httpx.Response(200, json=data)
+    return handler
+
+
+def stream_handler(body: str, status_code: int = 200, seen: dict = None):
+    def handler(request):
+        if seen is not None:
+            seen["payload"] = request.content
+        return httpx.Response(status_code, content=body.encode(), headers={"Content-Type": "text/event-stream"})
+    return handler
 
 
 # --- Test: Respuesta exitosa del agente ---
 @pytest.mark.asyncio
 async def test_chat_success():
-    agent = Agent()
-
     fake_response_data = {
         "choices": [
             {"message": {"content": "¡Hola! Soy un asistente musical."}}
         ]
     }
+    agent = Agent(http_client=build_http_client(json_handler(fake_response_data)))
 
-    mock_response = MagicMock()
-    mock_response.json.return_value = fake_response_data
-
-    mock_client = AsyncMock()
-    mock_client.post.return_value = mock_response
-
-    mock_async_client = AsyncMock()
-    mock_async_client.__aenter__.return_value = mock_client
-
-    with patch("src.services.chatIA_service.httpx.AsyncClient", return_value=mock_async_client):
-        result = await agent.chat("Hola", mode="normal")
-        assert "asistente musical" in result
+    result = await agent.chat("Hola", mode="normal")
+    assert "asistente musical" in result
 
 
 # --- Test: Respuesta con contexto adicional ---
 @pytest.mark.asyncio
 async def test_chat_with_extra_context():
-    agent = Agent()
     extra_info = "El usuario ama el jazz."
 
     fake_response_data = {
@@ -39,39 +48,103 @@ async def test_chat_with_extra_context():
             {"message": {"content": "Entiendo que te encanta el jazz. Aquí tienes algo especial..."}}
         ]
     }
+    seen = {}
+    agent = Agent(http_client=build_http_client(json_handler(fake_response_data, seen)))
 
-    mock_response = MagicMock()
-    mock_response.json.return_value = fake_response_data
+    result = await agent.chat("Recomiéndame algo", mode="creatividad", extra_context=extra_info)
+    assert "jazz" in result
+    assert "ama el jazz" in seen["payload"].decode()
 
-    mock_client = AsyncMock()
-    mock_client.post.return_value = mock_response
 
-    mock_async_client = AsyncMock()
-    mock_async_client.__aenter__.return_value = mock_client
+# --- Test: Formato inválido en respuesta lanza excepción ---
+@pytest.mark.asyncio
+async def test_chat_invalid_response_raises():
+    agent = Agent(http_client=build_http_client(json_handler({"unexpected": "data"})))
 
-    with patch("src.services.chatIA_service.httpx.AsyncClient", return_value=mock_async_client):
-        result = await agent.chat("Recomiéndame algo", mode="creatividad", extra_context=extra_info)
-        assert "jazz" in result
+    with pytest.raises(Exception, match="Openrouter no devuelve la respuesta en formato correcto."):
+        await agent.chat("Hola", mode="razonamiento")
 
 
-# --- Test: Formato inválido en respuesta lanza excepción ---
+# --- Test: Varias llamadas reutilizan el mismo cliente HTTP ---
 @pytest.mark.asyncio
-async def test_chat_invalid_response_raises():
-    agent = Agent()
+async def test_chat_reuses_pooled_client():
+    http_client = build_http_client(json_handler({"choices": [{"message": {"content": "ok"}}]}))
+    chat_agent, title_agent = Agent(http_client=http_client), Agent(http_client=http_client)
 
-    fake_invalid_response = {
-        "unexpected": "data"
-    }
+    await chat_agent.chat("Hola")
+    first = http_client.client
+    await title_agent.chat("Título")
+
+    assert http_client.client is first
+    await http_client.close()
+    assert first.is_closed
 
-    mock_response = MagicMock()
-    mock_response.json.return_value = fake_invalid_response
 
-    mock_client = AsyncMock()
-    mock_client.post.return_value = mock_response
+# --- Test: Sin cliente explícito se usa el compartido del proceso ---
+def test_agent_defaults_to_shared_client():
+    assert Agent().http_client is openrouter_client
 
-    mock_async_client = AsyncMock()
-    mock_async_client.__aenter__.return_value = mock_client
 
-    with patch("src.services.chatIA_service.httpx.AsyncClient", return_value=mock_async_client):
-        with pytest.raises(Exception, match="Openrouter no devuelve la respuesta en formato correcto."):
-            await agent.chat("Hola", mode="razonamiento")
+# --- Test: Con use_cache las respuestas deterministas no repiten la petición ---
+@pytest.mark.asyncio
+async def test_chat_uses_completion_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Jazz nocturno"}}]})
+
+    cache = CompletionCache(enabled=True, max_temperature=0.3)
+    agent = Agent(http_client=build_http_client(handler), cache=cache)
+
+    assert await agent.chat("Título", temperature=0.2, use_cache=True) == "Jazz nocturno"
+    assert await agent.chat("Título", temperature=0.2, use_cache=True) == "Jazz nocturno"
+    assert len(calls) == 1
+
+    # Sin use_cache o con temperatura alta siempre se llama al modelo
+    await agent.chat("Título", temperature=0.2)
+    await agent.chat("Título", use_cache=True)
+    assert len(calls) == 3
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["bypassed"] == 1
+
+
+# --- Test: chat_stream devuelve los fragmentos en orden ---
+@pytest.mark.asyncio
+async def test_chat_stream_yields_deltas():
+    body = (
+        ": OPENROUTER PROCESSING\n\n"
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": "Hola"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": " mundo"}}]}\n\n'
+        "data: [DONE]\n\n"
+    )
+    seen = {}
+    agent = Agent(http_client=build_http_client(stream_handler(body, seen=seen)))
+
+    chunks = [chunk async for chunk in agent.chat_stream("Hola")]
+
+    assert chunks == ["Hola", " mundo"]
+    assert b'"stream": true' in seen["payload"] or b'"stream":true' in seen["payload"]
+
+
+# --- Test: chat_stream lanza excepción si OpenRouter responde con error ---
+@pytest.mark.asyncio
+async def test_chat_stream_http_error():
+    agent = Agent(http_client=build_http_client(stream_handler("nope", status_code=502)))
+
+    with pytest.raises(Exception):
+        async for _ in agent.chat_stream("Hola"):
+            pass
+
+
+# --- Test: chat_stream lanza excepción si llega un error en mitad del stream ---
+@pytest.mark.asyncio
+async def test_chat_stream_error_chunk():
+    body = 'data: {"choices": [{"delta": {"content": "Ho"}}]}\n\ndata: {"error": {"message": "overloaded"}}\n\n'
+    agent = Agent(http_client=build_http_client(stream_handler(body)))
+
+    chunks = []
+    with pytest.raises(Exception):
+        async for chunk in agent.chat_stream("Hola"):
+            chunks.append(chunk)
+    assert chunks == ["Ho"]
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.completion_cache_model import CompletionCacheEntry
+from src.services.completion_cache import CompletionCache, completion_key
+
+
+def payload(content="Hola", temperature=0.0, **overrides):
+    data = {
+        "model": "openai/gpt-4o-mini",
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": 300,
+        "temperature": temperature,
+        "top_p": 1.0,
+        "presence_penalty": 0.0,
+        "frequency_penalty": 0.0,
+    }
+    data.update(overrides)
+    return data
+
+
+def session_factory_for(async_db_session):
+    connection = async_db_session.bind
+    return lambda: AsyncSession(bind=connection, expire_on_commit=False, join_transaction_mode="create_savepoint")
+
+
+# --- Test: La clave depende del modelo, los mensajes y el muestreo ---
+def test_completion_key():
+    assert completion_key(payload()) == completion_key(payload())
+    assert completion_key(payload()) != completion_key(payload("Adiós"))
+    assert completion_key(payload()) != completion_key(payload(model="otro/modelo"))
+    assert completion_key(payload()) != completion_key(payload(top_p=0.5))
+    # 'stream' no cambia la respuesta
+    assert completion_key(payload()) == completion_key(payload(stream=True))
+
+
+# --- Test: Temperaturas altas no se cachean ---
+def test_high_temperature_bypasses_cache():
+    cache = CompletionCache(enabled=True, max_temperature=0.3)
+    assert cache.cacheable(payload(temperature=0.2))
+    assert not cache.cacheable(payload(temperature=0.7))
+    assert cache.stats()["bypassed"] == 1
+
+
+# --- Test: Desactivada no se usa ---
+def test_disabled_cache_is_not_cacheable():
+    assert not CompletionCache(enabled=False).cacheable(payload())
+
+
+# --- Test: Acierto en memoria y contadores ---
+@pytest.mark.asyncio
+async def test_memory_hit_and_counters():
+    cache = CompletionCache(enabled=True)
+    assert await cache.get("k") is None
+    await cache.set("k", "respuesta")
+
+    assert await cache.get("k") == "respuesta"
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+# --- Test: Las entradas expiran y el LRU descarta la menos usada ---
+@pytest.mark.asyncio
+async def test_ttl_and_lru(monkeypatch):
+    cache = CompletionCache(enabled=True, max_entries=2, ttl=10)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    await cache.get("a")
+    await cache.set("c", "3")
+    assert await cache.get("b") is None
+
+    now = time.monotonic()
+    monkeypatch.setattr("src.services.completion_cache.time.monotonic", lambda: now + 11)
+    assert await cache.get("a") is None
+
+
+# --- Test: El nivel persistente sobrevive a un proceso nuevo ---
+@pytest.mark.asyncio
+async def test_persistent_tier(async_db_session):
+    factory = session_factory_for(async_db_session)
+    await CompletionCache(enabled=True, session_factory=factory).set("k", "guardada", model="m")
+
+    fresh = CompletionCache(enabled=True, session_factory=factory)
+    assert await fresh.get("k") == "guardada"
+    assert await fresh.get("k") == "guardada"
+    assert fresh.stats()["db_hits"] == 1 and fresh.stats()["memory_hits"] == 1
+
+    row = await async_db_session.scalar(select(CompletionCacheEntry).where(CompletionCacheEntry.cache_key == "k"))
+    assert row.model == "m"
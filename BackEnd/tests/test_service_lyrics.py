@@ -10,7 +10,7 @@ def test_search_song_url_success_with_redirect():
         </body></html>
     '''
     mock_response = MagicMock(status_code=200, text=html_content)
-    with patch("src.services.lyrircs_service.requests.get", return_value=mock_response):
+    with patch("src.services.lyrircs_service.httpx.get", return_value=mock_response):
         fetcher = LyricsFetcher()
         url = fetcher.search_song_url("Artist", "Song")
         assert url == "https://genius.com/Artist-song-lyrics"
@@ -23,7 +23,7 @@ def test_search_song_url_success_with_direct_link():
         </body></html>
     '''
     mock_response = MagicMock(status_code=200, text=html_content)
-    with patch("src.services.lyrircs_service.requests.get", return_value=mock_response):
+    with patch("src.services.lyrircs_service.httpx.get", return_value=mock_response):
         fetcher = LyricsFetcher()
         data = fetcher.search_song_url("Artist", "Song")
         assert isinstance(data, dict)
@@ -34,7 +34,7 @@ def test_search_song_url_success_with_direct_link():
 def test_search_song_url_not_found():
     html_content = "<html><body>No relevant links</body></html>"
     mock_response = MagicMock(status_code=200, text=html_content)
-    with patch("src.services.lyrircs_service.requests.get", return_value=mock_response):
+    with patch("src.services.lyrircs_service.httpx.get", return_value=mock_response):
         fetcher = LyricsFetcher()
         data = fetcher.search_song_url("Unknown", "Nothing")
         assert isinstance(data, dict)
@@ -44,7 +44,7 @@ def test_search_song_url_not_found():
 
 def test_search_song_url_captcha():
     mock_response = MagicMock(status_code=202, text="")
-    with patch("src.services.lyrircs_service.requests.get", return_value=mock_response):
+    with patch("src.services.lyrircs_service.httpx.get", return_value=mock_response):
         fetcher = LyricsFetcher()
         data = fetcher.search_song_url("Artist", "Song")
         assert isinstance(data, dict)
@@ -53,7 +53,7 @@ def test_search_song_url_captcha():
 
 
 def test_search_song_url_request_fails():
-    with patch("src.services.lyrircs_service.requests.get", side_effect=Exception("Connection error")):
+    with patch("src.services.lyrircs_service.httpx.get", side_effect=Exception("Connection error")):
         fetcher = LyricsFetcher()
         url = fetcher.search_song_url("Artist", "Song")
         assert isinstance(url, str)
@@ -0,0 +1,304 @@
+import asyncio
+import random
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.services import chatIA_service
+from src.services.chatIA_service import Agent, OpenRouterClient
+from src.services.completion_cache import CompletionCache
+from src.services.openrouter_resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    OpenRouterClientError,
+    OpenRouterRateLimitError,
+    OpenRouterServerError,
+    OpenRouterTimeoutError,
+    OpenRouterUnavailableError,
+    RetryPolicy,
+    call_with_retries,
+    parse_retry_after,
+    to_http_exception,
+)
+from tests.fake_openrouter import FakeOpenRouter, completion, failure, serve, stream
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_openrouter(monkeypatch):
+    """Arranca un OpenRouter falso con el guion indicado y apunta el servicio a él."""
+    servers = []
+
+    def start(*script, models=None):
+        fake = FakeOpenRouter(list(script), models=models)
+        context = serve(fake)
+        monkeypatch.setattr(chatIA_service, "OPENROUTER_URL", context.__enter__())
+        servers.append(context)
+        return fake
+
+    yield start
+    for context in servers:
+        context.__exit__(None, None, None)
+
+
+def build_agent(max_attempts=3, deadline=5.0, breaker=None, **kwargs) -> Agent:
+    return Agent(
+        http_client=OpenRouterClient(http2=False),
+        retry_policy=RetryPolicy(max_attempts=max_attempts, base_delay=0.01, max_delay=0.05, deadline=deadline),
+        breaker=breaker or CircuitBreaker(failure_threshold=10, reset_timeout=30),
+        **kwargs,
+    )
+
+
+# --- Test: Retry-After en segundos y como fecha HTTP ---
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("mañana") is None
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= parse_retry_after(future) <= 30
+
+
+# --- Test: El backoff tiene jitter, crece y respeta el máximo y Retry-After ---
+def test_backoff_bounds():
+    policy = RetryPolicy(base_delay=1, max_delay=4, rng=random.Random(1))
+    delays = [policy.backoff(attempt) for attempt in range(1, 6) for _ in range(20)]
+    assert all(0 <= d <= 4 for d in delays)
+    assert len(set(delays)) > 1
+    assert policy.backoff(1, retry_after=10) == 10
+
+
+# --- Test: El circuito se abre, falla rápido y se recupera con una prueba ---
+def test_circuit_breaker_transitions():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # solo una llamada de prueba
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+# --- Test: Se reintenta hasta el máximo de intentos esperando el backoff ---
+@pytest.mark.asyncio
+async def test_call_with_retries_gives_up_after_max_attempts():
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    async def send():
+        raise OpenRouterServerError("caído", 503)
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=1, deadline=60)
+    with pytest.raises(OpenRouterServerError):
+        await call_with_retries(send, policy, CircuitBreaker(failure_threshold=10), sleep=fake_sleep)
+    assert len(sleeps) == 2
+
+
+# --- Test: Un Retry-After mayor que el tiempo restante no se espera ---
+@pytest.mark.asyncio
+async def test_call_with_retries_does_not_wait_past_deadline():
+    async def send():
+        raise OpenRouterRateLimitError("límite", 429, retry_after=120)
+
+    with pytest.raises(OpenRouterRateLimitError) as exc:
+        await call_with_retries(send, RetryPolicy(deadline=5), CircuitBreaker())
+    assert exc.value.retry_after == 120
+
+
+# --- Test: Errores clasificados se traducen a respuestas HTTP ---
+def test_to_http_exception():
+    assert to_http_exception(Exception("x"), "Error").status_code == 500
+    rate_limited = to_http_exception(OpenRouterRateLimitError("límite", 429, retry_after=7), "Error")
+    assert rate_limited.status_code == 503 and rate_limited.headers["Retry-After"] == "7"
+    assert to_http_exception(OpenRouterClientError("clave", 401), "Error").status_code == 502
+
+
+# --- Test: Un 5xx transitorio se reintenta contra el servidor ---
+@pytest.mark.asyncio
+async def test_agent_retries_server_errors(fake_openrouter):
+    fake = fake_openrouter(failure(503), failure(502), completion("por fin"))
+
+    assert await build_agent().chat("Hola") == "por fin"
+    assert len(fake.requests) == 3
+
+
+# --- Test: Un 429 espera lo que indica Retry-After ---
+@pytest.mark.asyncio
+async def test_agent_honors_retry_after(fake_openrouter):
+    fake = fake_openrouter(failure(429, retry_after="0.3"), completion("ok"))
+
+    start = time.monotonic()
+    assert await build_agent().chat("Hola") == "ok"
+    assert time.monotonic() - start >= 0.3
+    assert len(fake.requests) == 2
+
+
+# --- Test: Un 4xx no se reintenta ---
+@pytest.mark.asyncio
+async def test_agent_does_not_retry_client_errors(fake_openrouter):
+    fake = fake_openrouter(failure(401), completion("nunca"))
+
+    with pytest.raises(OpenRouterClientError):
+        await build_agent().chat("Hola")
+    assert len(fake.requests) == 1
+
+
+# --- Test: Un upstream lento se corta al llegar al tiempo total ---
+@pytest.mark.asyncio
+async def test_agent_enforces_deadline(fake_openrouter):
+    fake_openrouter({**completion("tarde"), "delay": 2})
+
+    start = time.monotonic()
+    with pytest.raises(OpenRouterTimeoutError) as exc:
+        await build_agent(deadline=0.3).chat("Hola")
+    assert time.monotonic() - start < 1.5
+    assert exc.value.http_status == 504
+
+
+# --- Test: Con el circuito abierto se falla sin llamar a OpenRouter ---
+@pytest.mark.asyncio
+async def test_agent_fails_fast_with_open_circuit(fake_openrouter):
+    fake = fake_openrouter(failure(500))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    agent = build_agent(max_attempts=1, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(OpenRouterServerError):
+            await agent.chat("Hola")
+    with pytest.raises(OpenRouterUnavailableError):
+        await agent.chat("Hola")
+    assert len(fake.requests) == 2
+
+
+# --- Test: El stream se reintenta si falla antes del primer fragmento ---
+@pytest.mark.asyncio
+async def test_agent_stream_retries_before_first_chunk(fake_openrouter):
+    fake = fake_openrouter(failure(502), stream("Hola", " mundo"))
+
+    chunks = [chunk async for chunk in build_agent().chat_stream("Hola")]
+
+    assert chunks == ["Hola", " mundo"]
+    assert len(fake.requests) == 2
+
+
+# --- Test: Percentiles de latencia por modelo ---
+def test_latency_tracker_percentiles():
+    latency = LatencyTracker(window=100)
+    assert latency.percentile("m", 95) is None
+    for ms in range(1, 201):
+        latency.record("m", ms / 1000)
+
+    assert latency.count("m") == 100  # solo la ventana más reciente
+    assert latency.percentile("m", 50) == 0.15
+    assert latency.percentile("m", 95) == 0.195
+
+
+# --- Test: Si el modelo principal falla se pasa al siguiente ---
+@pytest.mark.asyncio
+async def test_agent_fails_over_to_next_model(fake_openrouter):
+    fake = fake_openrouter(models={"principal": [failure(503)], "respaldo": [completion("desde respaldo")]})
+    agent = build_agent(max_attempts=2, models=["principal", "respaldo"], hedge=False, latency=LatencyTracker())
+
+    assert await agent.chat("Hola") == "desde respaldo"
+    assert fake.models_called() == ["principal", "principal", "respaldo"]
+
+
+# --- Test: La respuesta de un modelo de respaldo no se guarda con la clave del principal ---
+@pytest.mark.asyncio
+async def test_agent_does_not_cache_fallback_answer(fake_openrouter):
+    fake = fake_openrouter(models={"principal": [failure(503), completion("desde principal")], "respaldo": [completion("desde respaldo")]})
+    cache = CompletionCache(enabled=True, max_temperature=0.3)
+    agent = build_agent(max_attempts=1, models=["principal", "respaldo"], hedge=False, latency=LatencyTracker(), cache=cache)
+
+    assert await agent.chat("Hola", temperature=0.2, use_cache=True) == "desde respaldo"
+    assert await agent.chat("Hola", temperature=0.2, use_cache=True) == "desde principal"
+    assert await agent.chat("Hola", temperature=0.2, use_cache=True) == "desde principal"
+    assert fake.models_called() == ["principal", "respaldo", "principal"]
+
+
+# --- Test: Cada modelo tiene su propio tiempo máximo ---
+@pytest.mark.asyncio
+async def test_agent_per_model_timeout(fake_openrouter):
+    fake_openrouter(models={"lento": [{**completion("tarde"), "delay": 2}], "rapido": [completion("a tiempo")]})
+    agent = build_agent(models=["lento", "rapido"], model_timeouts={"lento": 0.2}, hedge=False, latency=LatencyTracker())
+
+    start = time.monotonic()
+    assert await agent.chat("Hola") == "a tiempo"
+    assert time.monotonic() - start < 1.5
+
+
+# --- Test: Petición hedged cuando el principal supera su percentil de latencia ---
+@pytest.mark.asyncio
+async def test_agent_hedges_slow_primary(fake_openrouter, monkeypatch):
+    fake = fake_openrouter(models={"principal": [{**completion("lenta"), "delay": 1.5}], "respaldo": [completion("rápida")]})
+    monkeypatch.setattr(chatIA_service, "OPENROUTER_HEDGE_MIN_SAMPLES", 5)
+    latency = LatencyTracker()
+    for _ in range(5):
+        latency.record("principal", 0.1)
+    agent = build_agent(models=["principal", "respaldo"], hedge=True, latency=latency)
+
+    start = time.monotonic()
+    assert await agent.chat("Hola") == "rápida"
+    assert time.monotonic() - start < 1.0
+    assert fake.models_called() == ["principal", "respaldo"]
+    assert latency.count("respaldo") == 1
+
+
+# --- Test: La petición cancelada por el hedge también cuenta en el percentil ---
+@pytest.mark.asyncio
+async def test_agent_hedge_records_cancelled_latency(fake_openrouter, monkeypatch):
+    fake_openrouter(models={"principal": [{**completion("lenta"), "delay": 1.5}], "respaldo": [{**completion("rápida"), "delay": 0.2}]})
+    monkeypatch.setattr(chatIA_service, "OPENROUTER_HEDGE_MIN_SAMPLES", 5)
+    latency = LatencyTracker()
+    for _ in range(5):
+        latency.record("principal", 0.1)
+    agent = build_agent(models=["principal", "respaldo"], hedge=True, latency=latency)
+
+    assert await agent.chat("Hola") == "rápida"
+    await asyncio.sleep(0.05)  # la tarea cancelada registra su muestra al despertar
+
+    assert latency.count("principal") == 6
+    assert max(latency._samples["principal"]) >= 0.3
+
+
+# --- Test: Sin lentitud no se lanza la petición hedged ---
+@pytest.mark.asyncio
+async def test_agent_no_hedge_when_primary_is_fast(fake_openrouter):
+    fake = fake_openrouter(models={"principal": [completion("principal")], "respaldo": [completion("respaldo")]})
+    agent = build_agent(models=["principal", "respaldo"], hedge=True, latency=LatencyTracker())
+
+    assert await agent.chat("Hola") == "principal"
+    assert fake.models_called() == ["principal"]
+
+
+# --- Test: El stream pasa al modelo de respaldo si el principal no responde ---
+@pytest.mark.asyncio
+async def test_agent_stream_fails_over(fake_openrouter):
+    fake = fake_openrouter(models={"principal": [failure(500)], "respaldo": [stream("Hola")]})
+    agent = build_agent(max_attempts=1, models=["principal", "respaldo"], latency=LatencyTracker())
+
+    assert [chunk async for chunk in agent.chat_stream("Hola")] == ["Hola"]
+    assert fake.models_called() == ["principal", "respaldo"]
@@ -0,0 +1,49 @@
+from src.services.playlist_cache import PlaylistTracksCache
+
+
+TRACKS = [{"name": "A", "artists": [], "uri": "u1"}, {"name": "B", "artists": [], "uri": "u2"}]
+
+
+# --- Test: Acierto solo con el mismo snapshot ---
+def test_get_requires_matching_snapshot():
+    cache = PlaylistTracksCache()
+    cache.set("p1", "s1", TRACKS)
+
+    assert cache.get("p1", "s1") == TRACKS
+    assert cache.get("p1", "s2") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+# --- Test: Sin snapshot no se cachea ---
+def test_set_without_snapshot_is_ignored():
+    cache = PlaylistTracksCache()
+    cache.set("p1", None, TRACKS)
+    assert cache.get("p1", None) is None
+
+
+# --- Test: Borrar canciones actualiza la entrada al nuevo snapshot ---
+def test_remove_tracks_moves_entry_to_new_snapshot():
+    cache = PlaylistTracksCache()
+    cache.set("p1", "s1", TRACKS)
+
+    cache.remove_tracks("p1", ["u1"], "s2")
+
+    assert cache.get("p1", "s1") is None
+    assert cache.get("p1", "s2") == [{"name": "B", "artists": [], "uri": "u2"}]
+
+
+# --- Test: Borrar sin snapshot nuevo invalida la entrada ---
+def test_remove_tracks_without_snapshot_invalidates():
+    cache = PlaylistTracksCache()
+    cache.set("p1", "s1", TRACKS)
+    cache.remove_tracks("p1", ["u1"], None)
+    assert cache.get("p1", "s1") is None
+
+
+# --- Test: Límite de entradas ---
+def test_max_entries_evicts_oldest_playlist():
+    cache = PlaylistTracksCache(max_entries=1)
+    cache.set("p1", "s1", TRACKS)
+    cache.set("p2", "s1", TRACKS)
+    assert cache.get("p1", "s1") is None
+    assert cache.get("p2", "s1") == TRACKS
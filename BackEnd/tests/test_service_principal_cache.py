@@ -0,0 +1,48 @@
+import time
+
+from src.services.principal_cache import Principal, PrincipalCache
+
+PRINCIPAL = Principal(1, "user1", "user1@test.com", None, False)
+
+
+# --- Test: Guardar y recuperar un principal ---
+def test_get_after_set():
+    cache = PrincipalCache(ttl=60)
+    assert cache.get("user1@test.com") is None
+
+    cache.set("user1@test.com", PRINCIPAL)
+
+    assert cache.get("user1@test.com") == PRINCIPAL
+    assert cache.stats() == {"enabled": True, "entries": 1, "hits": 1, "misses": 1}
+
+
+# --- Test: Las entradas caducan tras el TTL ---
+def test_expires_after_ttl(monkeypatch):
+    cache = PrincipalCache(ttl=30)
+    cache.set("user1@test.com", PRINCIPAL)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+
+    assert cache.get("user1@test.com") is None
+
+
+# --- Test: Invalidar varias claves, ignorando las vacías ---
+def test_invalidate():
+    cache = PrincipalCache(ttl=60)
+    cache.set("old@test.com", PRINCIPAL)
+    cache.set("new@test.com", PRINCIPAL)
+
+    cache.invalidate("old@test.com", None, "new@test.com")
+
+    assert cache.get("old@test.com") is None
+    assert cache.get("new@test.com") is None
+
+
+# --- Test: Con TTL 0 la caché está desactivada ---
+def test_disabled_with_zero_ttl():
+    cache = PrincipalCache(ttl=0)
+    cache.set("user1@test.com", PRINCIPAL)
+
+    assert cache.get("user1@test.com") is None
+    assert cache.stats()["enabled"] is False
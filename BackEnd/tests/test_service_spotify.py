@@ -1,6 +1,8 @@
+import threading
+
 import pytest
 from fastapi import Request, HTTPException
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from sqlalchemy.exc import IntegrityError
 from src.services.spotify_service import login_spotify
 from src.models.auth_model import User
@@ -19,7 +21,8 @@ def mock_user():
     return user
 
 
-def test_login_success(mock_user):
+@pytest.mark.asyncio
+async def test_login_success(mock_user):
     mock_db = MagicMock()
     mock_db.query.return_value.filter.return_value.first.return_value = mock_user
 
@@ -33,8 +36,8 @@ def test_login_success(mock_user):
         "id": "spotify_user_123"
     }
 
-    with patch("src.services.spotify_service.requests.post") as mock_post, \
-         patch("src.services.spotify_service.requests.get") as mock_get:
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post, \
+         patch("src.services.spotify_service.spotify_client.get", new_callable=AsyncMock, return_value=MagicMock()) as mock_get:
         
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = token_response
@@ -42,46 +45,52 @@ def test_login_success(mock_user):
         mock_get.return_value.status_code = 200
         mock_get.return_value.json.return_value = user_info_response
 
-        result = login_spotify(mock_request(), mock_db)
+        with patch("src.services.spotify_service.principal_cache.invalidate") as mock_invalidate:
+            result = await login_spotify(mock_request(), mock_db)
         assert result["success"] is True
         mock_db.commit.assert_called_once()
+        mock_invalidate.assert_called_once_with("user@test.com")
 
 
-def test_login_missing_params():
+@pytest.mark.asyncio
+async def test_login_missing_params():
     with pytest.raises(HTTPException) as exc_info:
-        login_spotify(mock_request(code=None), MagicMock())
+        await login_spotify(mock_request(code=None), MagicMock())
     assert exc_info.value.status_code == 400
 
 
-def test_token_request_failure():
-    with patch("src.services.spotify_service.requests.post") as mock_post:
+@pytest.mark.asyncio
+async def test_token_request_failure():
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post:
         mock_post.return_value.status_code = 400
         mock_post.return_value.text = "invalid_request"
 
         with pytest.raises(HTTPException) as exc_info:
-            login_spotify(mock_request(), MagicMock())
+            await login_spotify(mock_request(), MagicMock())
         assert exc_info.value.status_code == 502
 
 
-def test_no_access_token():
-    with patch("src.services.spotify_service.requests.post") as mock_post:
+@pytest.mark.asyncio
+async def test_no_access_token():
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post:
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = {}  # no access_token
 
         with pytest.raises(HTTPException) as exc_info:
-            login_spotify(mock_request(), MagicMock())
+            await login_spotify(mock_request(), MagicMock())
         assert exc_info.value.status_code == 502
 
 
-def test_user_info_failure():
+@pytest.mark.asyncio
+async def test_user_info_failure():
     token_response = {
         "access_token": "token123",
         "refresh_token": "refresh123",
         "expires_in": 3600
     }
 
-    with patch("src.services.spotify_service.requests.post") as mock_post, \
-         patch("src.services.spotify_service.requests.get") as mock_get:
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post, \
+         patch("src.services.spotify_service.spotify_client.get", new_callable=AsyncMock, return_value=MagicMock()) as mock_get:
 
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = token_response
@@ -89,11 +98,12 @@ def test_user_info_failure():
         mock_get.return_value.status_code = 403
 
         with pytest.raises(HTTPException) as exc_info:
-            login_spotify(mock_request(), MagicMock())
+            await login_spotify(mock_request(), MagicMock())
         assert exc_info.value.status_code == 502
 
 
-def test_user_not_found():
+@pytest.mark.asyncio
+async def test_user_not_found():
     mock_db = MagicMock()
     mock_db.query.return_value.filter.return_value.first.return_value = None
 
@@ -105,8 +115,8 @@ def test_user_not_found():
 
     user_info_response = {"id": "spotify_user_123"}
 
-    with patch("src.services.spotify_service.requests.post") as mock_post, \
-         patch("src.services.spotify_service.requests.get") as mock_get:
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post, \
+         patch("src.services.spotify_service.spotify_client.get", new_callable=AsyncMock, return_value=MagicMock()) as mock_get:
 
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = token_response
@@ -115,11 +125,12 @@ def test_user_not_found():
         mock_get.return_value.json.return_value = user_info_response
 
         with pytest.raises(HTTPException) as exc_info:
-            login_spotify(mock_request(), mock_db)
+            await login_spotify(mock_request(), mock_db)
         assert exc_info.value.status_code == 404
 
 
-def test_integrity_error_duplicate_key(mock_user):
+@pytest.mark.asyncio
+async def test_integrity_error_duplicate_key(mock_user):
     mock_db = MagicMock()
     mock_db.query.return_value.filter.return_value.first.return_value = mock_user
 
@@ -134,8 +145,8 @@ def test_integrity_error_duplicate_key(mock_user):
     integrity_error.orig = MagicMock()
     integrity_error.orig.args = ("duplicate key value violates unique constraint",)
 
-    with patch("src.services.spotify_service.requests.post") as mock_post, \
-         patch("src.services.spotify_service.requests.get") as mock_get:
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post, \
+         patch("src.services.spotify_service.spotify_client.get", new_callable=AsyncMock, return_value=MagicMock()) as mock_get:
 
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = token_response
@@ -146,15 +157,16 @@ def test_integrity_error_duplicate_key(mock_user):
         mock_db.commit.side_effect = integrity_error
 
         with pytest.raises(HTTPException) as exc_info:
-            login_spotify(mock_request(), mock_db)
+            await login_spotify(mock_request(), mock_db)
         assert exc_info.value.status_code == 409
 
 
-def test_unexpected_exception(mock_user):
+@pytest.mark.asyncio
+async def test_unexpected_exception(mock_user):
     mock_db = MagicMock()
     mock_db.query.side_effect = Exception("Something broke")
 
-    with patch("BackEnd.src.services.spotify_service.requests.post") as mock_post:
+    with patch("BackEnd.src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post:
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = {
             "access_token": "token123",
@@ -162,10 +174,35 @@ def test_unexpected_exception(mock_user):
             "expires_in": 3600
         }
 
-        with patch("BackEnd.src.services.spotify_service.requests.get") as mock_get:
+        with patch("BackEnd.src.services.spotify_service.spotify_client.get", new_callable=AsyncMock, return_value=MagicMock()) as mock_get:
             mock_get.return_value.status_code = 200
             mock_get.return_value.json.return_value = {"id": "spotify_user_123"}
 
             with pytest.raises(HTTPException) as exc_info:
-                login_spotify(mock_request(), mock_db)
+                await login_spotify(mock_request(), mock_db)
             assert exc_info.value.status_code == 500
+
+
+# --- Test: El acceso a la BD del callback no bloquea el event loop ---
+@pytest.mark.asyncio
+async def test_login_db_work_in_threadpool(mock_user):
+    mock_db = MagicMock()
+    threads = []
+
+    def query(*args):
+        threads.append(threading.get_ident())
+        return MagicMock(**{"filter.return_value.first.return_value": mock_user})
+
+    mock_db.query.side_effect = query
+    mock_db.commit.side_effect = lambda: threads.append(threading.get_ident())
+
+    with patch("src.services.spotify_service.spotify_client.post", new_callable=AsyncMock, return_value=MagicMock()) as mock_post, \
+         patch("src.services.spotify_service.spotify_client.get", new_callable=AsyncMock, return_value=MagicMock()) as mock_get:
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"access_token": "token123", "refresh_token": "refresh123", "expires_in": 3600}
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {"id": "spotify_user_123"}
+
+        assert (await login_spotify(mock_request(), mock_db))["success"] is True
+
+    assert len(threads) == 3 and threading.get_ident() not in threads
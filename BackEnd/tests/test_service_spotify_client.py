@@ -0,0 +1,59 @@
+import httpx
+import pytest
+
+from src.services.spotify_client import SpotifyClient
+
+
+def build_client(handler):
+    client = SpotifyClient(base_url="https://api.test/v1", http2=False)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+# --- Test: Añade el token Bearer y resuelve URLs relativas ---
+@pytest.mark.asyncio
+async def test_request_adds_bearer_and_base_url():
+    seen = {}
+
+    def handler(request):
+        seen["url"] = str(request.url)
+        seen["auth"] = request.headers.get("Authorization")
+        return httpx.Response(200, json={"ok": True})
+
+    client = build_client(handler)
+    response = await client.get("/me/playlists", access_token="abc", params={"limit": 50})
+
+    assert response.json() == {"ok": True}
+    assert seen["url"] == "https://api.test/v1/me/playlists?limit=50"
+    assert seen["auth"] == "Bearer abc"
+    await client.close()
+
+
+# --- Test: Las URLs absolutas (token de cuentas) no usan la base ---
+@pytest.mark.asyncio
+async def test_absolute_url_is_not_rebased():
+    seen = {}
+
+    def handler(request):
+        seen["url"] = str(request.url)
+        return httpx.Response(200, json={})
+
+    client = build_client(handler)
+    await client.post("https://accounts.test/api/token", data={"grant_type": "refresh_token"})
+
+    assert seen["url"] == "https://accounts.test/api/token"
+    await client.close()
+
+
+# --- Test: start/close gestionan un único cliente compartido ---
+@pytest.mark.asyncio
+async def test_start_and_close_reuse_single_client():
+    client = SpotifyClient(base_url="https://api.test/v1", http2=False)
+    await client.start()
+    first = client.client
+    await client.start()
+    assert client.client is first
+
+    await client.close()
+    assert first.is_closed
+    assert client._client is None
@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.track_cache_model import TrackSearchCache
+from src.models.auth_model import User
+from src.services.track_cache import TrackURICache, normalize_query, normalize_text, upsert_rows
+
+
+# --- Test: Normalización sin acentos, casefold y sin 'feat.' ---
+def test_normalize_text_variants_share_key():
+    assert normalize_text("Canción Bonita (feat. Otro Artista)") == "cancion bonita"
+    assert normalize_text("CANCIÓN BONITA ft. Otro") == "cancion bonita"
+    assert normalize_query("Despacito", "Luis Fonsi feat. Daddy Yankee") == normalize_query("despacito", "LUIS FONSI")
+
+
+# --- Test: 'ft' dentro de una palabra no se elimina ---
+def test_normalize_text_keeps_words_containing_ft():
+    assert normalize_text("Left Behind") == "left behind"
+
+
+# --- Test: Acierto en memoria y contadores ---
+def test_memory_hit_and_counters():
+    cache = TrackURICache()
+    cache.set_many({"a|b": "spotify:track:1"})
+
+    assert cache.get_many(["a|b", "c|d"]) == {"a|b": "spotify:track:1"}
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+# --- Test: Resultados negativos se cachean como None ---
+def test_negative_result_is_cached():
+    cache = TrackURICache()
+    cache.set_many({"nada|nadie": None})
+    assert cache.get_many(["nada|nadie"]) == {"nada|nadie": None}
+
+
+# --- Test: El LRU descarta la entrada menos usada ---
+def test_lru_evicts_least_recently_used():
+    cache = TrackURICache(max_entries=2)
+    cache.set_many({"a|a": "1", "b|b": "2"})
+    cache.get_many(["a|a"])
+    cache.set_many({"c|c": "3"})
+
+    assert set(cache.get_many(["a|a", "b|b", "c|c"])) == {"a|a", "c|c"}
+
+
+# --- Test: Las entradas expiradas en memoria no se devuelven ---
+def test_memory_entry_expires():
+    cache = TrackURICache(ttl=timedelta(seconds=0.01))
+    cache.set_many({"a|b": "spotify:track:1"})
+    time.sleep(0.02)
+    assert cache.get_many(["a|b"]) == {}
+
+
+# --- Test: Persistencia en BD y recuperación desde otro proceso ---
+def test_persistent_tier_roundtrip(db_session):
+    TrackURICache().set_many({"a|b": "spotify:track:1", "x|y": None}, db_session)
+
+    fresh = TrackURICache()
+    assert fresh.get_many(["a|b", "x|y"], db_session) == {"a|b": "spotify:track:1", "x|y": None}
+    assert fresh.stats()["db_hits"] == 2
+
+    # Promocionadas a memoria
+    assert fresh.get_many(["a|b"]) == {"a|b": "spotify:track:1"}
+
+
+# --- Test: Filas expiradas en BD se ignoran ---
+def test_persistent_tier_ignores_expired_rows(db_session):
+    db_session.add(TrackSearchCache(
+        query_key="a|b",
+        track_uri="spotify:track:1",
+        expires_at=datetime.utcnow() - timedelta(minutes=1)
+    ))
+    db_session.commit()
+
+    assert TrackURICache().get_many(["a|b"], db_session) == {}
+
+
+# --- Test: Actualizar una entrada existente en BD ---
+def test_persistent_tier_updates_existing_row(db_session):
+    TrackURICache().set_many({"a|b": None}, db_session)
+    TrackURICache().set_many({"a|b": "spotify:track:2"}, db_session)
+
+    row = db_session.get(TrackSearchCache, "a|b")
+    assert row.track_uri == "spotify:track:2"
+
+
+# --- Test: Guardar una clave que otro worker ya insertó no hace rollback de la sesión ---
+def test_persistent_tier_upsert_keeps_pending_work(db_session):
+    now = datetime.utcnow()
+    row = {"query_key": "a|b", "track_uri": "spotify:track:1", "created_at": now, "expires_at": now + timedelta(hours=1)}
+    upsert_rows(db_session, [row])  # la fila del otro worker, sin pasar por el ORM
+    db_session.add(User(username="pendiente", email="pendiente@test.com", hashed_password="x"))
+
+    TrackURICache().set_many({"a|b": "spotify:track:2"}, db_session)
+
+    assert db_session.get(TrackSearchCache, "a|b").track_uri == "spotify:track:2"
+    assert db_session.query(User).filter_by(username="pendiente").count() == 1
@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+from benchmarks.bench_startup import BACKEND_DIR, LAZY_MODULES
+
+
+# --- Test: Importar la app no carga las dependencias que se usan bajo demanda ---
+def test_import_main_skips_lazy_dependencies(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}")
+    code = f"import main, sys; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ""
@@ -1,5 +1,6 @@
 import pytest
 import importlib
+import threading
 from datetime import timedelta, datetime
 from jose import jwt, JWTError
 
@@ -27,6 +28,24 @@ def test_hash_and_verify_password(monkeypatch):
     assert auth.verify_password(plain, hashed)
     assert not auth.verify_password("wrongpassword", hashed)
 
+def test_pwd_context_created_once_across_threads(monkeypatch):
+    auth = load_auth_with_env(monkeypatch)
+    start = threading.Barrier(8)
+    contexts = []
+
+    def worker():
+        start.wait(5)
+        contexts.append(auth.get_pwd_context())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(contexts) == 8
+    assert all(context is auth.pwd_context for context in contexts)
+
 def test_create_access_token(monkeypatch):
     auth = load_auth_with_env(monkeypatch)
     data = {"sub": "testuser"}
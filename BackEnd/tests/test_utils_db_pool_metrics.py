@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from src.utils.db_pool_metrics import PoolMetrics, TimedQueuePool, engine_pool
+
+
+@pytest.fixture
+def instrumented_engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    metrics = PoolMetrics("test")
+    metrics.attach(engine.pool)
+    yield engine, metrics
+    engine.dispose()
+
+
+# --- Test: Los eventos del pool alimentan los contadores ---
+def test_metrics_count_checkouts_and_checkins(instrumented_engine):
+    engine, metrics = instrumented_engine
+
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    stats = metrics.snapshot(engine_pool(engine))
+    assert stats["connects"] == 1
+    assert stats["checkouts"] == 3
+    assert stats["checkins"] == 3
+    assert stats["checked_out"] == 0
+    assert stats["peak_checked_out"] == 1
+    assert stats["wait"]["count"] == 3
+
+
+# --- Test: Un pool agotado registra el timeout y la espera ---
+def test_metrics_record_pool_timeout(instrumented_engine):
+    engine, metrics = instrumented_engine
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        stats = metrics.snapshot(engine_pool(engine))
+        assert stats["checked_out"] == 1
+        assert stats["overflow"] == 0
+
+    assert stats["timeouts"] == 1
+    assert stats["wait"]["max_ms"] >= 50
+
+
+# --- Test: dispose() conserva las métricas del pool recreado ---
+def test_metrics_survive_dispose(instrumented_engine):
+    engine, metrics = instrumented_engine
+    with engine.connect():
+        pass
+
+    engine.dispose()
+    with engine.connect():
+        pass
+
+    stats = metrics.snapshot(engine_pool(engine))
+    assert stats["checkouts"] == 2
+    assert stats["wait"]["count"] == 2
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from src.utils.auth import verify_password
+from src.utils.password_hasher import PasswordHasher
+
+
+# --- Test: Hash y verificación en el pool dedicado ---
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    hasher = PasswordHasher(workers=1, queue_size=1)
+    hashed = await hasher.hash("secreto")
+
+    assert verify_password("secreto", hashed)
+    assert await hasher.verify_and_update("secreto", hashed) == (True, None)
+    assert (await hasher.verify_and_update("otro", hashed))[0] is False
+    assert hasher.stats()["completed"] == 3
+
+
+# --- Test: El hash corre en un hilo del pool de hashing ---
+@pytest.mark.asyncio
+async def test_runs_on_dedicated_threads():
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    assert (await hasher.run(lambda: threading.current_thread().name)).startswith("password-hash")
+
+
+# --- Test: Mientras se espera el hash el event loop sigue atendiendo ---
+@pytest.mark.asyncio
+async def test_wait_does_not_block_event_loop():
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    release = threading.Event()
+    task = asyncio.create_task(hasher.run(release.wait, 5))
+
+    # Si `run` bloqueara el hilo del loop, este sleep no volvería hasta acabar el hash
+    await asyncio.sleep(0.05)
+    assert not task.done()
+    release.set()
+    assert await task is True
+
+
+# --- Test: Con el pool y la cola llenos se responde 503 con Retry-After ---
+@pytest.mark.asyncio
+async def test_rejects_when_full():
+    hasher = PasswordHasher(workers=1, queue_size=1, retry_after=3)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    callers = [asyncio.create_task(hasher.run(slow)) for _ in range(2)]
+    # El segundo queda en cola sin ejecutar `slow`: se espera a verlo admitido
+    deadline = time.monotonic() + 5
+    while not started.is_set() or hasher.stats()["in_flight"] < 2:
+        assert time.monotonic() < deadline, "el segundo hash no llegó a la cola"
+        await asyncio.sleep(0.01)
+
+    with pytest.raises(HTTPException) as exc:
+        await hasher.run(slow)
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "3"}
+
+    release.set()
+    await asyncio.gather(*callers)
+    stats = hasher.stats()
+    assert stats["rejected"] == 1 and stats["in_flight"] == 0
+
+
+# --- Test: Cancelar la espera no libera el hueco hasta que acaba el hash ---
+@pytest.mark.asyncio
+async def test_cancelled_wait_keeps_slot_until_hash_finishes():
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    task = asyncio.create_task(hasher.run(slow))
+    assert await asyncio.to_thread(started.wait, 5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # El hilo sigue ocupado con bcrypt: una petición nueva no puede entrar
+    with pytest.raises(HTTPException):
+        await hasher.run(slow)
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while hasher.stats()["in_flight"]:
+        assert time.monotonic() < deadline, "el hueco no se liberó"
+        await asyncio.sleep(0.01)
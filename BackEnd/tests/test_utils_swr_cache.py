@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+
+from src.utils.swr_cache import SWRCache
+
+
+# --- Test: Valor fresco, caducado y expirado ---
+def test_peek_fresh_stale_and_expired(monkeypatch):
+    cache = SWRCache(ttl=10, stale_ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr("src.utils.swr_cache.time.monotonic", lambda: now)
+    cache.set("k", "v")
+
+    assert cache.peek("k") == ("v", True)
+
+    monkeypatch.setattr("src.utils.swr_cache.time.monotonic", lambda: now + 15)
+    assert cache.peek("k") == ("v", False)
+
+    monkeypatch.setattr("src.utils.swr_cache.time.monotonic", lambda: now + 25)
+    assert cache.peek("k") == (None, False)
+    assert cache.stats()["misses"] == 1
+
+
+# --- Test: El LRU respeta el máximo de entradas ---
+def test_max_entries_evicts_oldest():
+    cache = SWRCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.peek("a")
+    cache.set("c", 3)
+
+    assert cache.peek("b") == (None, False)
+    assert cache.peek("a") == (1, True)
+
+
+# --- Test: Single-flight comparte la carga entre solicitantes ---
+@pytest.mark.asyncio
+async def test_refresh_single_flight():
+    cache = SWRCache(ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(cache.refresh("k", loader) for _ in range(10)))
+
+    assert calls == 1
+    assert results == [1] * 10
+    assert cache.peek("k") == (1, True)
+
+
+# --- Test: Un error en la carga se propaga y no deja la clave bloqueada ---
+@pytest.mark.asyncio
+async def test_refresh_error_propagates_and_clears_inflight():
+    cache = SWRCache(ttl=60)
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await cache.refresh("k", failing)
+
+    async def ok():
+        return "v"
+
+    assert await cache.refresh("k", ok) == "v"
+
+
+# --- Test: La recarga en segundo plano conserva el valor anterior si falla ---
+@pytest.mark.asyncio
+async def test_background_refresh_failure_keeps_value():
+    cache = SWRCache(ttl=60)
+    cache.set("k", "old")
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    cache.refresh_in_background("k", failing)
+    await asyncio.sleep(0.01)
+
+    assert cache.peek("k") == ("old", True)
+    assert cache.stats()["inflight"] == 0
@@ -0,0 +1,45 @@
+from src.utils import token_budget
+from src.utils.token_budget import MESSAGE_OVERHEAD_TOKENS, estimate_tokens, fit_history, parse_budgets
+
+
+# --- Test: La estimación crece con el texto y cuenta la puntuación ---
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("Hola") == 1
+    assert estimate_tokens("Hola, mundo!") == 5
+    assert estimate_tokens("palabra " * 100) == 200
+
+
+# --- Test: Presupuestos por modelo desde la variable de entorno ---
+def test_parse_budgets():
+    budgets = parse_budgets("openai/gpt-4o-mini=8000, anthropic/claude-3-haiku=4000,roto,=5")
+    assert budgets == {"openai/gpt-4o-mini": 8000, "anthropic/claude-3-haiku": 4000}
+
+
+# --- Test: Modelo sin presupuesto propio usa el valor por defecto ---
+def test_context_budget_default(monkeypatch):
+    monkeypatch.setattr(token_budget, "_budgets", {"modelo-grande": 16000})
+    assert token_budget.context_budget("modelo-grande") == 16000
+    assert token_budget.context_budget("otro") == token_budget.CHAT_CONTEXT_TOKEN_BUDGET
+
+
+# --- Test: Se eligen los mensajes recientes que caben, en orden cronológico ---
+def test_fit_history_keeps_recent_turns():
+    newest_first = [
+        {"content": "4", "tokens": 10},
+        {"content": "3", "tokens": 10},
+        {"content": "2", "tokens": 10},
+        {"content": "1", "tokens": 10},
+    ]
+    assert [m["content"] for m in fit_history(newest_first, 25)] == ["3", "4"]
+
+
+# --- Test: Un mensaje que no cabe corta el historial aunque quepan otros más antiguos ---
+def test_fit_history_stops_at_first_overflow():
+    newest_first = [
+        {"content": "corto", "tokens": MESSAGE_OVERHEAD_TOKENS + 1},
+        {"content": "enorme", "tokens": 1000},
+        {"content": "viejo", "tokens": MESSAGE_OVERHEAD_TOKENS + 1},
+    ]
+    assert [m["content"] for m in fit_history(newest_first, 100)] == ["corto"]
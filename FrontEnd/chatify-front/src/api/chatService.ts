@@ -95,6 +95,29 @@ export const fetchChatHistory = async (
 
 
 
+// Esperar al título generado automáticamente en segundo plano
+// Llamada al endpoint /chat/{chatId}/title
+export const fetchTitleStatus = async (
+    chatId: string,
+    waitSeconds: number = 15
+  ): Promise<{ title: string; title_pending: boolean } | null> => {
+    const token = localStorage.getItem("token");
+    try {
+      const res = await fetch(`${config.apiBaseUrl}/chat/${chatId}/title?wait=${waitSeconds}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      if (handleUnauthorized(res)) return null;
+      if (!res.ok) return null;
+      return await res.json();
+    } catch {
+      return null;
+    }
+  };
+
+
+
 // Borrar una conversacion
 // Llamada al endpoint /chat/{chatId}
 export const fetchDeleteChat = async (chatId: string) => {
@@ -1,6 +1,6 @@
 import React, { useEffect, useRef, useState } from 'react';
 import { Box, CircularProgress } from '@mui/material';
-import { fetchSendMessage, fetchChatHistory } from "../api/chatService";
+import { fetchSendMessage, fetchChatHistory, fetchTitleStatus } from "../api/chatService";
 import { useTheme } from "@mui/material/styles";
 import ChatMessagesList from '../components/Chats/ChatMessagesList';
 import ChatInput from '../components/Chats/ChatInput';
@@ -72,6 +72,10 @@ const Chat: React.FC<ChatProps> = ({ chatId, fetchChats }) => {
     setInput('');
     if (data && data.title_changed){
       await fetchChats();
+    } else if (data && data.title_pending) {
+      // El título se genera en segundo plano: se espera a que termine sin bloquear el chat
+      const status = await fetchTitleStatus(chatId);
+      if (status) await fetchChats();
     }
   };
 